@@ -0,0 +1,185 @@
+"""
+Микробенчмарк накладных расходов middleware на запрос.
+
+Гоняет запросы напрямую через ASGI (без сети и HTTP клиента) к пустому
+эндпоинту FastAPI без middleware и со стеком приложения (TempFileCleanup,
+Audit, Auth). Пользователь JWT берется из прогретого кэша, записи аудита
+остаются в очереди незапущенного писателя - измеряется только сам стек.
+
+С --baseline-ref стек собирается еще и из middleware указанной ревизии git
+(например, на BaseHTTPMiddleware до перевода на чистый ASGI), чтобы цифры
+"до" и "после" снимались одним запуском на одной машине.
+
+    PYTHONPATH=src python scripts/benchmark_middleware.py [--requests 20000] [--baseline-ref REV]
+"""
+
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import time
+import types
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from fastapi import FastAPI  # noqa: E402
+
+from app.api.auth.jwt import create_access_token  # noqa: E402
+from app.external.sqlalchemy.models import Role, User  # noqa: E402
+from app.middleware import audit as audit_middleware  # noqa: E402
+from app.middleware.audit import AuditMiddleware  # noqa: E402
+from app.middleware.auth import AuthMiddleware  # noqa: E402
+from app.middleware.temp_file_cleanup import TempFileCleanupMiddleware  # noqa: E402
+from app.services.audit_writer import AuditLogWriter, AuditWriterConfig  # noqa: E402
+from app.services.auth_cache import principal_cache  # noqa: E402
+
+MIDDLEWARE_DIR = Path(__file__).resolve().parents[1] / "src" / "app" / "middleware"
+
+
+class _NullSession:
+    def close(self):
+        pass
+
+
+def load_baseline(ref: str) -> types.SimpleNamespace:
+    """Классы middleware из ревизии ref; запись аудита в БД заменяется пустой функцией"""
+    modules = {}
+    for name in ("auth", "audit", "temp_file_cleanup"):
+        path = MIDDLEWARE_DIR / f"{name}.py"
+        source = subprocess.run(  # noqa: S603 - ревизия задается локально в командной строке
+            ["git", "show", f"{ref}:./{path.name}"],  # noqa: S607
+            cwd=MIDDLEWARE_DIR,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        module = types.ModuleType(f"baseline_{name}")
+        exec(compile(source, f"{ref}:{path.name}", "exec"), module.__dict__)  # noqa: S102
+        modules[name] = module
+    # Старый AuditMiddleware писал в БД прямо в запросе
+    modules["audit"].SessionLocal = _NullSession
+    modules["audit"].log_user_action = lambda **_: None
+    return types.SimpleNamespace(
+        auth=modules["auth"].AuthMiddleware,
+        audit=modules["audit"].AuditMiddleware,
+        temp_file_cleanup=modules["temp_file_cleanup"].TempFileCleanupMiddleware,
+    )
+
+
+def build_app(middleware: types.SimpleNamespace = None) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/api/items")
+    async def list_items():
+        return {"ok": True}
+
+    @app.post("/api/items")
+    async def create_item(payload: dict):
+        return {"ok": True, "fields": len(payload)}
+
+    if middleware is not None:
+        # Порядок как в create_app
+        app.add_middleware(middleware.auth)
+        app.add_middleware(middleware.audit, log_request_body=True, max_body_size=1024 * 5)
+        app.add_middleware(middleware.temp_file_cleanup)
+    return app
+
+
+def make_scope(method: str, headers: list) -> dict:
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": "/api/items",
+        "raw_path": b"/api/items",
+        "root_path": "",
+        "query_string": b"",
+        "headers": headers,
+        "client": ("127.0.0.1", 50000),
+        "server": ("testserver", 80),
+    }
+
+
+async def run(app, method: str, headers: list, body: bytes, requests: int) -> float:
+    """Среднее время запроса в микросекундах"""
+
+    async def send(message):
+        pass
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        sent = False
+
+        async def receive():
+            nonlocal sent
+            if sent:
+                return {"type": "http.disconnect"}
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        await app(make_scope(method, headers), receive, send)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+async def main(requests: int, baseline_ref: str = None):
+    # Пользователь в кэше AuthMiddleware, аудит без записи в БД
+    user = User(id=1, username="bench", is_active=True, role=Role(name="admin"))
+    principal_cache.get(1, lambda: user)
+    audit_middleware.audit_log_writer = AuditLogWriter(
+        AuditWriterConfig(
+            batch_size=requests,
+            flush_seconds=60,
+            max_queue_size=10 * requests,
+            backpressure_seconds=0,
+            spill_path="audit_spill_benchmark.jsonl",
+            dead_letter_path="audit_dead_letter_benchmark.jsonl",
+            retry_seconds=1,
+            max_retry_seconds=1,
+        )
+    )
+
+    token = create_access_token({"sub": "1"})
+    body = json.dumps({"name": "x" * 200, "values": list(range(100))}).encode()
+    headers = [(b"authorization", f"Bearer {token}".encode()), (b"user-agent", b"bench")]
+    cases = [
+        ("GET", headers, b""),
+        ("POST", headers + [(b"content-type", b"application/json")], body),
+    ]
+
+    apps = {
+        "bare": build_app(),
+        "stack": build_app(
+            types.SimpleNamespace(
+                auth=AuthMiddleware,
+                audit=AuditMiddleware,
+                temp_file_cleanup=TempFileCleanupMiddleware,
+            )
+        ),
+    }
+    if baseline_ref:
+        apps["baseline"] = build_app(load_baseline(baseline_ref))
+    for method, case_headers, case_body in cases:
+        timings = {}
+        for name, app in apps.items():
+            # Прогрев
+            await run(app, method, case_headers, case_body, 200)
+            timings[name] = await run(app, method, case_headers, case_body, requests)
+        line = f"{method:5} bare {timings['bare']:8.1f} us"
+        for name in [name for name in apps if name != "bare"]:
+            line += f"  {name} overhead {timings[name] - timings['bare']:8.1f} us/request"
+        sys.stdout.write(line + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument(
+        "--baseline-ref",
+        help="ревизия git, с middleware которой сравнить стек (например, 89bb914^)",
+    )
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.baseline_ref))
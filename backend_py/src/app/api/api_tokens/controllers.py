@@ -21,6 +21,7 @@ from app.external.sqlalchemy.utils.api_tokens import (
     validate_api_token
 )
 from app.external.sqlalchemy.models import ApiToken
+from app.services.api_token_usage import api_token_usage
 
 
 def _convert_token_to_response(token: ApiToken) -> ApiTokenResponse:
@@ -178,7 +179,10 @@ def validate_api_token_controller(
     ip_address: str
 ) -> Optional[ApiToken]:
     """Проверить валидность API токена"""
-    return validate_api_token(db, token, ip_address)
+    api_token = validate_api_token(db, token, ip_address)
+    if api_token:
+        api_token_usage.record(api_token.id)
+    return api_token
 
 
 def revoke_api_token(
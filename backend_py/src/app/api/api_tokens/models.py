@@ -187,6 +187,8 @@ class ApiTokenStats(BaseModel):
     tokens_by_user: Dict[str, int]
     most_used_tokens: List[Dict[str, Any]]
     recent_usage: List[Dict[str, Any]]
+    rate_limited_requests: int = 0  # Запросы, отклоненные по лимиту
+    most_rate_limited_tokens: List[Dict[str, Any]] = []
 
 
 class ApiTokenFilter(BaseModel):
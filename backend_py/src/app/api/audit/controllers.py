@@ -1,7 +1,10 @@
-from datetime import datetime, timedelta, timezone
+from datetime import datetime
 from typing import List, Optional, Dict, Any
 from sqlalchemy.orm import Session
 from fastapi import HTTPException
+from loguru import logger
+
+from app.external.sqlalchemy.utils.pagination import InvalidCursorError
 
 from app.api.audit.models import (
     AuditLogOut,
@@ -15,13 +18,17 @@ from app.api.audit.models import (
 from app.external.sqlalchemy.utils.audit import (
     create_audit_log,
     get_audit_logs,
+    get_audit_logs_page,
     get_audit_log_by_id,
     count_audit_logs,
     get_audit_statistics,
     get_available_actions,
     get_available_tables,
     cleanup_old_audit_logs,
+    rebuild_audit_hourly_stats,
 )
+from app.external.sqlalchemy.utils import audit_partitions
+from app.settings import settings
 
 
 def _convert_user_to_simple(user) -> Optional[UserSimple]:
@@ -101,6 +108,28 @@ def create_audit_log_entry(db: Session, audit_data: AuditLogCreate) -> AuditLogO
         )
 
 
+def _list_filters(
+    filters: AuditLogFilter,
+    date_from: Optional[datetime],
+    date_to: Optional[datetime],
+) -> dict:
+    """Фильтры списка для crud-запросов"""
+    return {
+        "user_id": filters.user_id,
+        "action": filters.action,
+        "table_name": filters.table_name,
+        "date_from": date_from,
+        "date_to": date_to,
+        "search": filters.search,
+        "request_id": filters.request_id,
+        "status_code": filters.status_code,
+        "status_code_from": filters.status_code_from,
+        "status_code_to": filters.status_code_to,
+        "duration_ms_from": filters.duration_ms_from,
+        "duration_ms_to": filters.duration_ms_to,
+    }
+
+
 def get_audit_logs_list(db: Session, filters: AuditLogFilter) -> AuditLogsList:
     """Получить список аудит-логов с фильтрацией"""
     try:
@@ -124,6 +153,9 @@ def get_audit_logs_list(db: Session, filters: AuditLogFilter) -> AuditLogsList:
                     status_code=400, detail="Invalid date_to format. Use YYYY-MM-DD"
                 )
 
+        if filters.cursor is not None:
+            return _get_audit_logs_by_cursor(db, filters, date_from, date_to)
+
         # Вычисляем skip для пагинации
         skip = (filters.page - 1) * filters.limit
 
@@ -132,12 +164,7 @@ def get_audit_logs_list(db: Session, filters: AuditLogFilter) -> AuditLogsList:
             db=db,
             skip=skip,
             limit=filters.limit,
-            user_id=filters.user_id,
-            action=filters.action,
-            table_name=filters.table_name,
-            date_from=date_from,
-            date_to=date_to,
-            search=filters.search,
+            **_list_filters(filters, date_from, date_to),
             order_by=filters.order_by,
             order_direction=filters.order_direction,
         )
@@ -145,12 +172,7 @@ def get_audit_logs_list(db: Session, filters: AuditLogFilter) -> AuditLogsList:
         # Получаем общее количество для пагинации
         total_count = count_audit_logs(
             db=db,
-            user_id=filters.user_id,
-            action=filters.action,
-            table_name=filters.table_name,
-            date_from=date_from,
-            date_to=date_to,
-            search=filters.search,
+            **_list_filters(filters, date_from, date_to),
         )
 
         # Конвертируем в выходные модели
@@ -177,6 +199,44 @@ def get_audit_logs_list(db: Session, filters: AuditLogFilter) -> AuditLogsList:
         )
 
 
+def _get_audit_logs_by_cursor(
+    db: Session,
+    filters: AuditLogFilter,
+    date_from: Optional[datetime],
+    date_to: Optional[datetime],
+) -> AuditLogsList:
+    """Страница аудит-логов по курсору: без OFFSET и без обязательного COUNT"""
+    if filters.order_by != "created_at":
+        raise HTTPException(
+            status_code=400, detail="Cursor pagination supports order_by=created_at only"
+        )
+    try:
+        page = get_audit_logs_page(
+            db=db,
+            limit=filters.limit,
+            cursor=filters.cursor,
+            total=filters.total,
+            order_direction=filters.order_direction,
+            **_list_filters(filters, date_from, date_to),
+        )
+    except InvalidCursorError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    pagination = {
+        "page_size": filters.limit,
+        "next_cursor": page.next_cursor,
+        "has_next": page.next_cursor is not None,
+    }
+    if page.total is not None:
+        pagination["total_items"] = page.total
+    if page.total_estimate is not None:
+        pagination["total_estimate"] = page.total_estimate
+    return AuditLogsList(
+        logs=[_convert_audit_log_to_out(log) for log in page.items],
+        pagination=pagination,
+    )
+
+
 def get_audit_log_by_id_controller(db: Session, log_id: int) -> AuditLogOut:
     """Получить аудит-лог по ID"""
     audit_log = get_audit_log_by_id(db, log_id)
@@ -255,8 +315,7 @@ def cleanup_old_logs_controller(db: Session, days_to_keep: int = 90) -> CleanupR
                 status_code=400, detail="days_to_keep must be at least 1"
             )
 
-        deleted_count = cleanup_old_audit_logs(db, days_to_keep)
-        cutoff_date = datetime.now(timezone.utc) - timedelta(days=days_to_keep)
+        deleted_count, cutoff_date = cleanup_old_audit_logs(db, days_to_keep)
 
         return CleanupResult(
             deleted_count=deleted_count,
@@ -270,3 +329,29 @@ def cleanup_old_logs_controller(db: Session, days_to_keep: int = 90) -> CleanupR
         raise HTTPException(
             status_code=500, detail=f"Failed to cleanup audit logs: {str(e)}"
         )
+
+
+def get_audit_partitions_controller(db: Session):
+    """Секции журнала аудита"""
+    return audit_partitions.list_audit_partitions(db)
+
+
+def migrate_audit_partitions_controller(db: Session):
+    """Перенести обычную таблицу audit_logs в секционированную и создать секции наперед"""
+    try:
+        rows = audit_partitions.migrate_audit_logs_to_partitions(db)
+    except audit_partitions.PartitionMigrationInProgress:
+        raise HTTPException(
+            status_code=409, detail="Audit logs migration is already running"
+        )
+    if rows is not None:
+        logger.info(f"Audit logs migrated to monthly partitions: {rows} rows")
+    created = audit_partitions.ensure_audit_partitions(
+        db, months_ahead=settings.audit_partitions_ahead
+    )
+    return {"migrated": rows is not None, "rows": rows or 0, "created": created}
+
+
+def rebuild_audit_stats_controller(db: Session):
+    """Пересобрать почасовые итоги по всему журналу аудита"""
+    return {"rows": rebuild_audit_hourly_stats(db)}
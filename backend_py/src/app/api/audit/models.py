@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import date, datetime
 from typing import Optional, List, Dict, Any
 from pydantic import BaseModel, ConfigDict, Field
 
@@ -60,11 +60,23 @@ class AuditLogFilter(BaseModel):
     table_name: Optional[str] = None
     date_from: Optional[str] = Field(None, description="Дата от (YYYY-MM-DD)")
     date_to: Optional[str] = Field(None, description="Дата до (YYYY-MM-DD)")
-    search: Optional[str] = Field(None, description="Поиск по IP, User-Agent, endpoint")
+    search: Optional[str] = Field(None, description="Поиск по IP, User-Agent, endpoint, ошибке")
+    request_id: Optional[str] = Field(None, description="ID запроса")
+    status_code: Optional[int] = Field(None, description="HTTP статус ответа")
+    status_code_from: Optional[int] = Field(None, description="HTTP статус от")
+    status_code_to: Optional[int] = Field(None, description="HTTP статус до")
+    duration_ms_from: Optional[int] = Field(None, ge=0, description="Длительность от (мс)")
+    duration_ms_to: Optional[int] = Field(None, ge=0, description="Длительность до (мс)")
     page: int = Field(1, ge=1, description="Номер страницы")
     limit: int = Field(50, ge=1, le=1000, description="Количество записей на странице")
     order_by: str = Field("created_at", description="Поле для сортировки")
     order_direction: str = Field("desc", pattern="^(asc|desc)$", description="Направление сортировки")
+    cursor: Optional[str] = Field(
+        None, description="Курсор страницы (пустой - первая); заменяет page"
+    )
+    total: Optional[str] = Field(
+        None, pattern="^(exact|estimate)$", description="Итог в режиме курсора: exact|estimate"
+    )
 
 
 class AuditActionStats(BaseModel):
@@ -116,6 +128,28 @@ class AuditResponse(BaseModel):
 
 class CleanupResult(BaseModel):
     """Результат очистки старых логов"""
-    deleted_count: int
+    deleted_count: int  # Для удаленных секций - оценка по статистике
     cutoff_date: datetime
     message: str
+
+
+class AuditStatsRebuildResult(BaseModel):
+    """Результат пересборки почасовых итогов"""
+    rows: int
+
+
+class AuditPartitionOut(BaseModel):
+    """Секция журнала аудита"""
+    name: str
+    month: Optional[date] = None  # None - секция по умолчанию
+    is_default: bool
+    bound: str
+    rows_estimate: int
+    size_bytes: int
+
+
+class AuditPartitionsMigrateOut(BaseModel):
+    """Результат переноса журнала аудита в секционированную таблицу"""
+    migrated: bool  # False - таблица уже секционирована
+    rows: int
+    created: List[str]
@@ -9,7 +9,10 @@ from app.api.audit.models import (
     AuditLogsList,
     AuditStatistics,
     AuditResponse,
-    CleanupResult
+    CleanupResult,
+    AuditPartitionOut,
+    AuditPartitionsMigrateOut,
+    AuditStatsRebuildResult,
 )
 from app.api.audit import controllers
 from app.external.sqlalchemy.session import get_db
@@ -57,9 +60,21 @@ def get_audit_logs(
     table_name: Optional[str] = Query(None, description="Название таблицы"),
     date_from: Optional[str] = Query(None, description="Дата от (YYYY-MM-DD)"),
     date_to: Optional[str] = Query(None, description="Дата до (YYYY-MM-DD)"),
-    search: Optional[str] = Query(None, description="Поиск по IP, User-Agent"),
+    search: Optional[str] = Query(None, description="Поиск по IP, User-Agent, endpoint, ошибке"),
+    request_id: Optional[str] = Query(None, description="ID запроса"),
+    status_code: Optional[str] = Query(None, description="HTTP статус ответа"),
+    status_code_from: Optional[str] = Query(None, description="HTTP статус от"),
+    status_code_to: Optional[str] = Query(None, description="HTTP статус до"),
+    duration_ms_from: Optional[str] = Query(None, description="Длительность от (мс)"),
+    duration_ms_to: Optional[str] = Query(None, description="Длительность до (мс)"),
     order_by: str = Query("created_at", description="Поле сортировки"),
     order_direction: str = Query("desc", pattern="^(asc|desc)$", description="Направление"),
+    cursor: Optional[str] = Query(
+        None, description="Курсор страницы (пустой - первая); следующий - в pagination.next_cursor"
+    ),
+    total: Optional[str] = Query(
+        None, pattern="^(exact|estimate)$", description="Итог в режиме курсора: exact|estimate"
+    ),
     db: Session = Depends(get_db)
 ):
     """Получить список аудит-логов с фильтрацией"""
@@ -74,8 +89,16 @@ def get_audit_logs(
         date_from=parse_optional_str(date_from),
         date_to=parse_optional_str(date_to),
         search=parse_optional_str(search),
+        request_id=parse_optional_str(request_id),
+        status_code=parse_optional_int(status_code),
+        status_code_from=parse_optional_int(status_code_from),
+        status_code_to=parse_optional_int(status_code_to),
+        duration_ms_from=parse_optional_int(duration_ms_from),
+        duration_ms_to=parse_optional_int(duration_ms_to),
         order_by=order_by,
-        order_direction=order_direction
+        order_direction=order_direction,
+        cursor=cursor,
+        total=total,
     )
     
     return controllers.get_audit_logs_list(db, filters)
@@ -144,6 +167,35 @@ def cleanup_old_audit_logs(
     return controllers.cleanup_old_logs_controller(db, days_to_keep)
 
 
+@router.post("/audit/stats/rebuild", response_model=AuditStatsRebuildResult, tags=["audit"])
+def rebuild_audit_statistics(request: Request, db: Session = Depends(get_db)):
+    """Пересобрать почасовые итоги статистики аудита (только для администраторов)"""
+    require_admin(request)
+
+    return controllers.rebuild_audit_stats_controller(db)
+
+
+@router.get("/audit/partitions", response_model=List[AuditPartitionOut], tags=["audit"])
+def get_audit_partitions(request: Request, db: Session = Depends(get_db)):
+    """Секции журнала аудита (только для администраторов)"""
+    require_admin(request)
+
+    return controllers.get_audit_partitions_controller(db)
+
+
+@router.post(
+    "/audit/partitions/migrate", response_model=AuditPartitionsMigrateOut, tags=["audit"]
+)
+def migrate_audit_partitions(request: Request, db: Session = Depends(get_db)):
+    """Перенести журнал аудита в секционированную таблицу (только для администраторов).
+
+    Таблица переписывается целиком одной транзакцией и на это время
+    заблокирована; повторный запрос во время переноса получает 409"""
+    require_admin(request)
+
+    return controllers.migrate_audit_partitions_controller(db)
+
+
 # Вспомогательный эндпоинт для получения текущего пользователя (для логирования)
 @router.get("/audit/current-user", tags=["audit"])
 def get_current_user_for_audit(request: Request):
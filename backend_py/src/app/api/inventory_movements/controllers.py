@@ -9,6 +9,7 @@ from app.external.sqlalchemy.utils.counterparties import get_counterparty
 from app.external.sqlalchemy.utils.items import get_item
 from app.external.sqlalchemy.utils.machine_stocks import get_machine_stock_by_item
 from app.external.sqlalchemy.utils.machines import get_machine
+from app.external.sqlalchemy.utils.pagination import InvalidCursorError
 from app.external.sqlalchemy.utils.reference_tables import inventory_count_status_crud
 from app.external.sqlalchemy.utils.users import get_user_by_id
 from app.external.sqlalchemy.utils.warehouse_stocks import get_warehouse_stock_by_item
@@ -69,6 +70,23 @@ def get_inventory_movements(
     )
 
 
+def get_inventory_movements_page(
+    db: Session,
+    limit: int = 100,
+    skip: int = 0,
+    cursor: str = None,
+    total: str = None,
+    **filters,
+):
+    """Страница движений товаров с курсором следующей страницы и итогами"""
+    try:
+        return movement_crud.get_inventory_movements_page(
+            db, limit=limit, skip=skip, cursor=cursor, total=total, **filters
+        )
+    except InvalidCursorError:
+        raise HTTPException(status_code=400, detail="Некорректный курсор страницы")
+
+
 def get_inventory_movements_count(
     db: Session,
     movement_type: str = None,
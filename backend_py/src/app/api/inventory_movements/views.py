@@ -1,10 +1,11 @@
 from datetime import datetime
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 
 from app.external.sqlalchemy.session import get_db
+from app.external.sqlalchemy.utils.pagination import page_headers
 
 from .controllers import (
     approve_inventory_movement,
@@ -16,6 +17,7 @@ from .controllers import (
     get_inventory_movement,
     get_inventory_movements,
     get_inventory_movements_count,
+    get_inventory_movements_page,
     get_inventory_movements_summary,
     get_movement_detail,
     get_movement_items,
@@ -43,6 +45,7 @@ router = APIRouter(prefix="/inventory-movements", tags=["inventory-movements"])
 
 @router.get("/", response_model=List[InventoryMovementOut])
 def read_inventory_movements(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     movement_type: Optional[str] = Query(None, description="Тип движения"),
@@ -59,13 +62,21 @@ def read_inventory_movements(
     search: Optional[str] = Query(
         None, description="Поиск по номеру документа или описанию"
     ),
+    cursor: Optional[str] = Query(
+        None, description="Курсор страницы (пустой - первая); следующий - в X-Next-Cursor"
+    ),
+    total: Optional[str] = Query(
+        None, pattern="^(exact|estimate)$", description="Итог по фильтрам: exact|estimate"
+    ),
     db: Session = Depends(get_db),
 ):
     """Получить список движений товаров с фильтрацией"""
-    return get_inventory_movements(
+    page = get_inventory_movements_page(
         db=db,
         skip=skip,
         limit=limit,
+        cursor=cursor,
+        total=total,
         movement_type=movement_type,
         status_id=status_id,
         from_warehouse_id=from_warehouse_id,
@@ -78,6 +89,8 @@ def read_inventory_movements(
         date_to=date_to,
         search=search,
     )
+    response.headers.update(page_headers(page))
+    return page.items
 
 
 @router.get("/summary", response_model=InventoryMovementSummary)
@@ -3,6 +3,7 @@ from sqlalchemy.orm import Session
 from .models import MachineStockIn, MachineStockUpdate, MachineStockOperation, MachineStockTransfer, MachineLoadOperation, MachineUnloadOperation
 from app.external.sqlalchemy.utils import machine_stocks as stock_crud
 from app.external.sqlalchemy.utils.machines import get_machine
+from app.external.sqlalchemy.utils.pagination import InvalidCursorError
 from app.external.sqlalchemy.utils.items import get_item
 from app.external.sqlalchemy.utils.warehouses import get_warehouse
 from typing import List, Dict, Tuple
@@ -41,6 +42,23 @@ def get_machine_stocks(
     )
 
 
+def get_machine_stocks_page(
+    db: Session,
+    limit: int = 100,
+    skip: int = 0,
+    cursor: str = None,
+    total: str = None,
+    **filters,
+):
+    """Страница остатков в автоматах с курсором следующей страницы и итогами"""
+    try:
+        return stock_crud.get_machine_stocks_page(
+            db, limit=limit, skip=skip, cursor=cursor, total=total, **filters
+        )
+    except InvalidCursorError:
+        raise HTTPException(status_code=400, detail="Некорректный курсор страницы")
+
+
 def get_machine_stocks_count(
     db: Session,
     machine_id: int = None,
@@ -1,9 +1,10 @@
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 
 from app.external.sqlalchemy.session import get_db
+from app.external.sqlalchemy.utils.pagination import page_headers
 
 from .controllers import (
     add_machine_stock,
@@ -14,6 +15,7 @@ from .controllers import (
     get_machine_stock_by_item,
     get_machine_stocks,
     get_machine_stocks_count,
+    get_machine_stocks_page,
     get_machine_stocks_by_item,
     get_machine_stocks_by_machine,
     get_machine_stocks_grouped_by_machines,
@@ -46,6 +48,7 @@ router = APIRouter(prefix="/machine-stocks", tags=["machine-stocks"])
 
 @router.get("/", response_model=List[MachineStockOut])
 def read_machine_stocks(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     machine_id: Optional[int] = Query(None, description="ID автомата"),
@@ -55,19 +58,29 @@ def read_machine_stocks(
     search: Optional[str] = Query(
         None, description="Поиск по названию товара, артикулу, штрихкоду"
     ),
+    cursor: Optional[str] = Query(
+        None, description="Курсор страницы (пустой - первая); следующий - в X-Next-Cursor"
+    ),
+    total: Optional[str] = Query(
+        None, pattern="^(exact|estimate)$", description="Итог по фильтрам: exact|estimate"
+    ),
     db: Session = Depends(get_db),
 ):
     """Получить список остатков в автоматах с фильтрацией"""
-    return get_machine_stocks(
+    page = get_machine_stocks_page(
         db=db,
         skip=skip,
         limit=limit,
+        cursor=cursor,
+        total=total,
         machine_id=machine_id,
         item_id=item_id,
         category_id=category_id,
         low_stock=low_stock,
         search=search,
     )
+    response.headers.update(page_headers(page))
+    return page.items
 
 
 @router.get("/summary", response_model=MachineStockSummary)
@@ -2,12 +2,21 @@ from datetime import date, datetime
 from decimal import Decimal
 
 from fastapi import HTTPException
+from loguru import logger
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
+from app.external.sqlalchemy.models import Monitoring
 from app.external.sqlalchemy.utils import cashless_payments as cashless_crud
 from app.external.sqlalchemy.utils import monitoring as monitoring_crud
+from app.external.sqlalchemy.utils import monitoring_partitions
+from app.external.sqlalchemy.utils.pagination import InvalidCursorError
+from app.services.fleet_status import fleet_status_cache
+from app.services.report_recompute import report_recompute_queue
+from app.services.table_export import export_response
+from app.settings import settings
 
-from .models import CashlessPaymentIn, MonitoringIn
+from .models import CashlessBulkIn, CashlessPaymentIn, MonitoringBulkIn, MonitoringIn
 
 # === Monitoring Controllers ===
 
@@ -50,6 +59,44 @@ def get_monitoring_all(
     )
 
 
+def get_monitoring_page(
+    db: Session,
+    limit: int = 100,
+    skip: int = 0,
+    cursor: str = None,
+    total: str = None,
+    machine_id: int = None,
+    date_from: str = None,
+    date_to: str = None,
+):
+    """Страница показаний мониторинга с курсором следующей страницы и итогами"""
+    try:
+        return monitoring_crud.get_monitoring_page(
+            db,
+            limit=limit,
+            skip=skip,
+            cursor=cursor,
+            total=total,
+            machine_id=machine_id,
+            date_from=date_from,
+            date_to=date_to,
+        )
+    except InvalidCursorError:
+        raise HTTPException(status_code=400, detail="Некорректный курсор страницы")
+
+
+def export_monitoring(
+    fmt: str, machine_id: int = None, date_from: str = None, date_to: str = None
+):
+    """Потоковая выгрузка показаний мониторинга с фильтрами списка"""
+    return export_response(
+        lambda db: monitoring_crud.monitoring_query(db, machine_id, date_from, date_to),
+        Monitoring.__table__,
+        fmt,
+        "monitoring",
+    )
+
+
 def get_latest_monitoring(db: Session, machine_id: int):
     """Получить последнюю запись мониторинга для автомата"""
     monitoring = monitoring_crud.get_latest_monitoring(db, machine_id)
@@ -62,8 +109,6 @@ def get_latest_monitoring(db: Session, machine_id: int):
 
 def create_monitoring(db: Session, monitoring_in: MonitoringIn):
     """Создать новую запись мониторинга"""
-    from app.api.reports.controllers import compute_and_store_reports
-
     monitoring, was_created = monitoring_crud.create_or_update_monitoring(
         db,
         machine_id=monitoring_in.machine_id,
@@ -72,23 +117,52 @@ def create_monitoring(db: Session, monitoring_in: MonitoringIn):
         date=monitoring_in.date,
     )
 
-    # Если была создана новая запись (не обновлена существующая), создаем отчет за день
+    if monitoring is None:
+        raise HTTPException(status_code=404, detail="Machine not found")
+
+    # Если была создана новая запись, пересчитываем отчет автомата за ее день
+    # (и следующий день с данными) в фоне
     if was_created:
-        try:
-            # Используем дату записи мониторинга для создания отчета
-            report_date = monitoring.date if monitoring.date else monitoring_in.date
-            if report_date:
-                processed = compute_and_store_reports(db, report_date)
-                print(
-                    f"Автоматически создан отчет за {report_date.strftime('%d.%m.%Y')}. Обработано автоматов: {processed}"
-                )
-        except Exception as e:
-            # Логируем ошибку, но не прерываем создание записи мониторинга
-            print(f"Ошибка при автоматическом создании отчета: {e}")
+        report_recompute_queue.mark_dirty(monitoring.machine_id, monitoring.date)
+        fleet_status_cache.invalidate()
 
     return monitoring
 
 
+def bulk_create_monitoring(db: Session, payload: MonitoringBulkIn):
+    """Загрузить пачку показаний мониторинга одним запросом"""
+    if len(payload.readings) > settings.monitoring_bulk_max_readings:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many readings: max {settings.monitoring_bulk_max_readings} per request",
+        )
+    results = monitoring_crud.bulk_create_monitoring(
+        db, [reading.model_dump() for reading in payload.readings]
+    )
+
+    # Пересчет отчетов - одной пометкой на пачку
+    created = [r for r in results if r["status"] == "created"]
+    report_recompute_queue.mark_dirty_many(
+        (r["machine_id"], r["date"]) for r in created
+    )
+    if created:
+        fleet_status_cache.invalidate()
+    errors = sum(1 for r in results if r["status"] == "error")
+    logger.info(
+        f"Monitoring bulk ingest: {len(results)} readings, {len(created)} created, "
+        f"{len(results) - len(created) - errors} duplicates, {errors} errors"
+    )
+    return {
+        "created": len(created),
+        "duplicates": len(results) - len(created) - errors,
+        "errors": errors,
+        "results": [
+            {"index": index, "status": r["status"], "id": r["id"], "detail": r["detail"]}
+            for index, r in enumerate(results)
+        ],
+    }
+
+
 def update_monitoring(db: Session, monitoring_id: int, monitoring_in: MonitoringIn):
     """Обновить запись мониторинга"""
     existing_monitoring = monitoring_crud.get_monitoring_by_id(db, monitoring_id)
@@ -96,8 +170,9 @@ def update_monitoring(db: Session, monitoring_id: int, monitoring_in: Monitoring
         raise HTTPException(
             status_code=404, detail="Monitoring record not found"
         )
-    
-    return monitoring_crud.update_monitoring(
+    old_machine_id, old_date = existing_monitoring.machine_id, existing_monitoring.date
+
+    monitoring = monitoring_crud.update_monitoring(
         db,
         monitoring_id=monitoring_id,
         machine_id=monitoring_in.machine_id,
@@ -106,6 +181,12 @@ def update_monitoring(db: Session, monitoring_id: int, monitoring_in: Monitoring
         date=monitoring_in.date,
     )
 
+    # Пересчитываем и старый, и новый день (запись могла сменить автомат или дату)
+    report_recompute_queue.mark_dirty(old_machine_id, old_date)
+    report_recompute_queue.mark_dirty(monitoring.machine_id, monitoring.date)
+    fleet_status_cache.invalidate()
+    return monitoring
+
 
 def delete_monitoring(db: Session, monitoring_id: int):
     """Удалить запись мониторинга"""
@@ -114,11 +195,19 @@ def delete_monitoring(db: Session, monitoring_id: int):
         raise HTTPException(
             status_code=404, detail="Monitoring record not found"
         )
-    
+    machine_id, monitoring_date = existing_monitoring.machine_id, existing_monitoring.date
+
     monitoring_crud.delete_monitoring(db, monitoring_id)
+    report_recompute_queue.mark_dirty(machine_id, monitoring_date)
+    fleet_status_cache.invalidate()
     return {"message": "Monitoring record deleted successfully"}
 
 
+def get_fleet_status(db: Session):
+    """Состояние всех автоматов: последнее показание, выручка за сегодня, загрузка"""
+    return fleet_status_cache.get(db)
+
+
 def get_monitoring_summary(
     db: Session, machine_id: int, start_date: str, end_date: str
 ):
@@ -134,6 +223,65 @@ def get_monitoring_summary(
     return monitoring_crud.get_monitoring_summary(db, machine_id, start, end)
 
 
+def get_monitoring_daily(
+    db: Session, machine_id: int, date_from: str = None, date_to: str = None
+):
+    """Получить дневные срезы мониторинга автомата (для графиков)"""
+    try:
+        start = datetime.fromisoformat(date_from) if date_from else None
+        end = datetime.fromisoformat(date_to) if date_to else None
+    except ValueError:
+        raise HTTPException(
+            status_code=400, detail="Invalid date format. Use ISO format (YYYY-MM-DD)"
+        )
+
+    return monitoring_crud.get_monitoring_daily(db, machine_id, start, end)
+
+
+def rebuild_monitoring_daily(db: Session):
+    """Пересобрать дневные срезы мониторинга по всем показаниям"""
+    rows = monitoring_crud.rebuild_monitoring_daily(db)
+    logger.info(f"Monitoring daily snapshots rebuilt: {rows} rows")
+    return {"rows": rows}
+
+
+def get_monitoring_partitions(db: Session):
+    """Секции таблицы мониторинга"""
+    return monitoring_partitions.list_monitoring_partitions(db)
+
+
+def migrate_monitoring_partitions(db: Session):
+    """Перенести обычную таблицу monitoring в секционированную и создать секции наперед"""
+    try:
+        rows = monitoring_partitions.migrate_monitoring_to_partitions(db)
+    except monitoring_partitions.PartitionMigrationInProgress:
+        raise HTTPException(
+            status_code=409, detail="Monitoring migration is already running"
+        )
+    if rows is not None:
+        logger.info(f"Monitoring migrated to monthly partitions: {rows} rows")
+    created = monitoring_partitions.ensure_monitoring_partitions(
+        db, months_ahead=settings.monitoring_partitions_ahead
+    )
+    return {"migrated": rows is not None, "rows": rows or 0, "created": created}
+
+
+def maintain_monitoring_partitions(db: Session, retention_days: int = None):
+    """Создать секции наперед, разобрать секцию по умолчанию, архивировать старые"""
+    if retention_days is None:
+        retention_days = settings.monitoring_raw_retention_days
+    result = monitoring_partitions.maintain_monitoring_partitions(
+        db,
+        months_ahead=settings.monitoring_partitions_ahead,
+        retention_days=retention_days,
+    )
+    logger.info(
+        f"Monitoring partitions maintained: created {result['created']}, "
+        f"archived {result['archived']}"
+    )
+    return result
+
+
 # === Cashless Payments Controllers ===
 
 
@@ -146,18 +294,52 @@ def get_cashless_payments(
 
 def add_cashless_transaction(db: Session, machine_id: int, amount: Decimal):
     """Добавить новую безналичную транзакцию"""
-    return cashless_crud.add_cashless_transaction(db, machine_id, amount)
+    try:
+        payment = cashless_crud.add_cashless_transaction(db, machine_id, amount)
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=404, detail="Machine not found")
+    fleet_status_cache.invalidate()
+    return payment
+
+
+def add_cashless_transactions_bulk(db: Session, payload: CashlessBulkIn):
+    """Добавить пачку безналичных транзакций одним запросом к БД"""
+    if len(payload.transactions) > settings.cashless_bulk_max_transactions:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many transactions: max {settings.cashless_bulk_max_transactions} per request",
+        )
+    errors = cashless_crud.add_cashless_transactions(
+        db, [transaction.model_dump() for transaction in payload.transactions]
+    )
+    failed = sum(1 for error in errors if error)
+    if failed < len(errors):
+        fleet_status_cache.invalidate()
+    logger.info(
+        f"Cashless bulk ingest: {len(errors)} transactions, {failed} errors"
+    )
+    return {
+        "accepted": len(errors) - failed,
+        "errors": failed,
+        "results": [
+            {"index": index, "status": "error" if error else "accepted", "detail": error}
+            for index, error in enumerate(errors)
+        ],
+    }
 
 
 def create_cashless_payment(db: Session, payment_in: CashlessPaymentIn):
     """Создать или обновить запись безналичных платежей"""
     today = date.today()
-    return cashless_crud.create_or_update_cashless_payment(
+    payment = cashless_crud.create_or_update_cashless_payment(
         db,
         machine_id=payment_in.machine_id,
         payment_date=today,
         amount=payment_in.amount,
     )
+    fleet_status_cache.invalidate()
+    return payment
 
 
 def get_cashless_payment_summary(
@@ -1,8 +1,8 @@
 from datetime import date, datetime
 from decimal import Decimal
-from typing import Optional
+from typing import List, Optional
 
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
 
 from app.api.machines.models import MachineOut
 
@@ -24,6 +24,24 @@ class MonitoringIn(BaseModel):
     date: Optional[datetime] = None
 
 
+class MonitoringBulkIn(BaseModel):
+    readings: List[MonitoringIn] = Field(..., min_length=1)
+
+
+class MonitoringBulkItem(BaseModel):
+    index: int  # позиция показания в запросе
+    status: str  # created, duplicate, error
+    id: Optional[int] = None
+    detail: Optional[str] = None
+
+
+class MonitoringBulkOut(BaseModel):
+    created: int
+    duplicates: int
+    errors: int
+    results: List[MonitoringBulkItem]
+
+
 class MonitoringSummary(BaseModel):
     total_coins: float
     total_toys: int
@@ -32,6 +50,79 @@ class MonitoringSummary(BaseModel):
     last_record: Optional[MonitoringOut] = None
 
 
+class MonitoringDailyOut(BaseModel):
+    machine_id: int
+    day: datetime
+    readings_count: int
+    max_coins: Decimal
+    max_toys: int
+    max_date: datetime
+    first_coins: Decimal
+    first_toys: int
+    first_date: datetime
+    last_coins: Decimal
+    last_toys: int
+    last_date: datetime
+    model_config = ConfigDict(from_attributes=True)
+
+
+class MonitoringDailyRebuildResponse(BaseModel):
+    rows: int
+
+
+class MonitoringPartitionOut(BaseModel):
+    name: str
+    month: Optional[date] = None  # None - секция по умолчанию
+    is_default: bool
+    bound: str
+    rows_estimate: int
+    size_bytes: int
+
+
+class MonitoringPartitionsMaintainOut(BaseModel):
+    created: List[str]
+    archived: List[str]
+
+
+class MonitoringPartitionsMigrateOut(BaseModel):
+    migrated: bool  # False - таблица уже секционирована
+    rows: int
+    created: List[str]
+
+
+class FleetLatestReading(BaseModel):
+    id: int
+    coins: Decimal
+    toys: int
+    date: datetime
+
+
+class FleetMachineStatus(BaseModel):
+    machine_id: int
+    name: str
+    latest: Optional[FleetLatestReading] = None
+    readings_today: int
+    coins_today: Decimal
+    toys_today: int
+    revenue_today: Decimal
+    cashless_today: Decimal
+    cashless_transactions_today: int
+    total_quantity: float
+    total_capacity: Optional[float] = None
+    utilization_percent: Optional[float] = None
+    total_items: int
+    low_stock_items: int
+
+
+class FleetStatusOut(BaseModel):
+    generated_at: datetime
+    machines_total: int
+    machines_reporting_today: int
+    revenue_today: Decimal
+    cashless_today: Decimal
+    machines: List[FleetMachineStatus]
+
+
 class CashlessPaymentOut(BaseModel):
     id: int
     date: date
@@ -49,6 +140,28 @@ class CashlessPaymentIn(BaseModel):
     transactions_count: int = 1
 
 
+class CashlessTransactionIn(BaseModel):
+    machine_id: int
+    amount: Decimal = Field(..., gt=0)
+    date: Optional[datetime] = None  # учитывается только день; None - сегодня
+
+
+class CashlessBulkIn(BaseModel):
+    transactions: List[CashlessTransactionIn] = Field(..., min_length=1)
+
+
+class CashlessBulkItem(BaseModel):
+    index: int  # позиция транзакции в запросе
+    status: str  # accepted, error
+    detail: Optional[str] = None
+
+
+class CashlessBulkOut(BaseModel):
+    accepted: int
+    errors: int
+    results: List[CashlessBulkItem]
+
+
 class CashlessPaymentSummary(BaseModel):
     total_amount: float
     total_transactions: int
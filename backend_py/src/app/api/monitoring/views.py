@@ -1,18 +1,31 @@
 from decimal import Decimal
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, Query, Request, Response
 from sqlalchemy.orm import Session
 
+from app.api.auth.middleware_dependencies import require_admin
 from app.external.sqlalchemy.session import get_db
+from app.external.sqlalchemy.utils.pagination import page_headers
+from app.services.telemetry_ingest import TelemetryIngestResponse
 
 from . import controllers
 from .models import (
+    CashlessBulkIn,
+    CashlessBulkOut,
     CashlessPaymentIn,
     CashlessPaymentOut,
     CashlessPaymentSummary,
+    FleetStatusOut,
+    MonitoringBulkIn,
+    MonitoringBulkOut,
+    MonitoringDailyOut,
+    MonitoringDailyRebuildResponse,
     MonitoringIn,
     MonitoringOut,
+    MonitoringPartitionOut,
+    MonitoringPartitionsMaintainOut,
+    MonitoringPartitionsMigrateOut,
     MonitoringSummary,
 )
 
@@ -23,42 +36,130 @@ router = APIRouter()
 
 @router.get("/monitoring/all", response_model=List[MonitoringOut])
 def read_monitoring_all(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     machine_id: int = None,
     date_from: str = None,
     date_to: str = None,
+    cursor: Optional[str] = Query(
+        None, description="Курсор страницы (пустой - первая); следующий - в X-Next-Cursor"
+    ),
+    total: Optional[str] = Query(
+        None, pattern="^(exact|estimate)$", description="Итог по фильтрам: exact|estimate"
+    ),
     db: Session = Depends(get_db),
 ):
     """Получить записи мониторинга с фильтрацией"""
-    return controllers.get_monitoring_all(
-        db, 
-        skip=skip, 
+    page = controllers.get_monitoring_page(
+        db,
+        skip=skip,
         limit=limit,
+        cursor=cursor,
+        total=total,
         machine_id=machine_id,
         date_from=date_from,
-        date_to=date_to
+        date_to=date_to,
     )
+    response.headers.update(page_headers(page))
+    return page.items
+
+
+@router.get("/monitoring/export")
+def export_monitoring(
+    format: str = Query("csv", pattern="^(csv|parquet|arrow)$", description="csv|parquet|arrow"),
+    machine_id: int = None,
+    date_from: str = None,
+    date_to: str = None,
+):
+    """Потоковая выгрузка показаний мониторинга в CSV/Parquet/Arrow"""
+    return controllers.export_monitoring(format, machine_id, date_from, date_to)
+
+
+@router.post("/monitoring/daily/rebuild", response_model=MonitoringDailyRebuildResponse)
+def rebuild_monitoring_daily(request: Request, db: Session = Depends(get_db)):
+    """Пересобрать дневные срезы мониторинга (только для администраторов)"""
+    require_admin(request)
+    return controllers.rebuild_monitoring_daily(db)
+
+
+@router.get(
+    "/admin/monitoring/partitions",
+    response_model=List[MonitoringPartitionOut],
+    tags=["admin"],
+)
+def read_monitoring_partitions(request: Request, db: Session = Depends(get_db)):
+    """Секции таблицы мониторинга (только для администраторов)"""
+    require_admin(request)
+    return controllers.get_monitoring_partitions(db)
+
+
+@router.post(
+    "/admin/monitoring/partitions/maintain",
+    response_model=MonitoringPartitionsMaintainOut,
+    tags=["admin"],
+)
+def maintain_monitoring_partitions(
+    request: Request,
+    retention_days: int = Query(
+        None, ge=0, description="Срок хранения сырых показаний (дней), 0 - без архивирования"
+    ),
+    db: Session = Depends(get_db),
+):
+    """Обслуживание секций мониторинга (только для администраторов)"""
+    require_admin(request)
+    return controllers.maintain_monitoring_partitions(db, retention_days)
+
+
+@router.post(
+    "/admin/monitoring/partitions/migrate",
+    response_model=MonitoringPartitionsMigrateOut,
+    tags=["admin"],
+)
+def migrate_monitoring_partitions(request: Request, db: Session = Depends(get_db)):
+    """Перенести monitoring в секционированную таблицу (только для администраторов).
+
+    Таблица переписывается целиком одной транзакцией и на это время
+    заблокирована; повторный запрос во время переноса получает 409"""
+    require_admin(request)
+    return controllers.migrate_monitoring_partitions(db)
+
+
+@router.get("/monitoring/fleet-status", response_model=FleetStatusOut)
+def read_fleet_status(db: Session = Depends(get_db)):
+    """Состояние всех автоматов одним ответом (кэшируется до новых показаний)"""
+    return controllers.get_fleet_status(db)
 
 
 @router.get("/monitoring/{machine_id}", response_model=List[MonitoringOut])
 def read_monitoring(
     machine_id: int,
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     date_from: str = None,
     date_to: str = None,
+    cursor: Optional[str] = Query(
+        None, description="Курсор страницы (пустой - первая); следующий - в X-Next-Cursor"
+    ),
+    total: Optional[str] = Query(
+        None, pattern="^(exact|estimate)$", description="Итог по фильтрам: exact|estimate"
+    ),
     db: Session = Depends(get_db),
 ):
     """Получить записи мониторинга для автомата"""
-    return controllers.get_monitoring(
-        db, 
-        machine_id, 
-        skip=skip, 
+    page = controllers.get_monitoring_page(
+        db,
+        skip=skip,
         limit=limit,
+        cursor=cursor,
+        total=total,
+        machine_id=machine_id,
         date_from=date_from,
-        date_to=date_to
+        date_to=date_to,
     )
+    response.headers.update(page_headers(page))
+    return page.items
 
 
 @router.get("/monitoring/{machine_id}/latest", response_model=MonitoringOut)
@@ -73,6 +174,21 @@ def create_monitoring(monitoring: MonitoringIn, db: Session = Depends(get_db)):
     return controllers.create_monitoring(db, monitoring)
 
 
+@router.post("/monitoring/bulk", response_model=MonitoringBulkOut)
+def create_monitoring_bulk(payload: MonitoringBulkIn, db: Session = Depends(get_db)):
+    """Загрузить пачку показаний: статус created/duplicate/error по каждому"""
+    return controllers.bulk_create_monitoring(db, payload)
+
+
+@router.post("/monitoring/ingest", response_class=TelemetryIngestResponse)
+async def ingest_monitoring_stream():
+    """Потоковая загрузка NDJSON: показания ({"machine_id", "coins", "toys", "date"})
+    и безналичные транзакции ({"type": "cashless", "machine_id", "amount", "date"}).
+
+    Строки пишутся микропорциями, подтверждения по каждой порции идут потоком NDJSON."""
+    return TelemetryIngestResponse()
+
+
 @router.put("/monitoring/{monitoring_id}", response_model=MonitoringOut)
 def update_monitoring(monitoring_id: int, monitoring: MonitoringIn, db: Session = Depends(get_db)):
     """Обновить запись мониторинга"""
@@ -96,6 +212,17 @@ def get_monitoring_summary(
     return controllers.get_monitoring_summary(db, machine_id, start_date, end_date)
 
 
+@router.get("/monitoring/{machine_id}/daily", response_model=List[MonitoringDailyOut])
+def get_monitoring_daily(
+    machine_id: int,
+    date_from: str = None,
+    date_to: str = None,
+    db: Session = Depends(get_db),
+):
+    """Получить дневные срезы мониторинга автомата за период"""
+    return controllers.get_monitoring_daily(db, machine_id, date_from, date_to)
+
+
 # === Cashless Payments Routes ===
 
 
@@ -120,6 +247,12 @@ def add_cashless_transaction(
     return controllers.add_cashless_transaction(db, machine_id, amount)
 
 
+@router.post("/cashless-payments/batch", response_model=CashlessBulkOut)
+def add_cashless_transactions_bulk(payload: CashlessBulkIn, db: Session = Depends(get_db)):
+    """Добавить пачку безналичных транзакций: суммы по автомату и дню складываются"""
+    return controllers.add_cashless_transactions_bulk(db, payload)
+
+
 @router.post("/cashless-payments", response_model=CashlessPaymentOut)
 def create_cashless_payment(payment: CashlessPaymentIn, db: Session = Depends(get_db)):
     """Создать или обновить запись безналичных платежей"""
@@ -1,87 +1,45 @@
-from datetime import datetime, timedelta, timezone
+import time
+from datetime import date, datetime
 from decimal import Decimal
-from typing import List, Optional, Dict
+from functools import partial
+from typing import Iterable, Iterator, List, Optional, Dict, Tuple
 
+from fastapi import HTTPException
+from loguru import logger
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, or_
 
 from app.external.sqlalchemy.models import (
     Report,
-    Machine,
-    Monitoring,
     InventoryMovement,
     InventoryMovementItem,
-    InventoryCountStatus,
     MachineStock,
-    Item,
     Rent,
-    Price,
 )
+from app.external.sqlalchemy.session import SessionLocal
+from app.external.sqlalchemy.utils import accounting_pivot as accounting_pivot_crud
+from app.external.sqlalchemy.utils import reports as reports_crud
+from app.external.sqlalchemy.utils import toy_cost_ledger as toy_cost_ledger_crud
 from app.external.sqlalchemy.utils.reference_tables import inventory_count_status_crud
+from app.services.report_backfill import report_backfill_manager
+from app.services.report_profiler import report_profiler
+from app.services.table_export import export_response
+from app.settings import settings
 
+from .models import ReportPeriodOut
 
-def _get_prev_monitoring_day_max(
-    db: Session, machine_id: int, target_date: datetime
-) -> Monitoring | None:
-    # find the most recent record before target_date to determine the previous day that has data
-    prev_any = (
-        db.query(Monitoring)
-        .filter(Monitoring.machine_id == machine_id, Monitoring.date < target_date)
-        .order_by(Monitoring.date.desc())
-        .first()
-    )
-    if not prev_any:
-        return None
-    prev_day = datetime(prev_any.date.year, prev_any.date.month, prev_any.date.day)
-    start = prev_day
-    end = start + timedelta(days=1)
-    return (
-        db.query(Monitoring)
-        .filter(
-            Monitoring.machine_id == machine_id,
-            Monitoring.date >= start,
-            Monitoring.date < end,
-        )
-        .order_by(
-            Monitoring.coins.desc(), Monitoring.toys.desc(), Monitoring.date.desc()
-        )
-        .first()
-    )
+# Размер порции строк при потоковой выдаче детальных отчетов
+DETAILED_STREAM_BATCH = 500
 
+# Стоимость монеты в рублях: выручка = прирост coins * COIN_PRICE_RUB
+COIN_PRICE_RUB = Decimal(settings.coin_price_rub)
 
-def _get_max_monitoring_on_date(
-    db: Session, machine_id: int, target_date: datetime
-) -> Monitoring | None:
-    start = datetime(target_date.year, target_date.month, target_date.day)
-    end = start + timedelta(days=1)
-    # take the record with the max coins/toys within the day; if multiple, the latest by date
-    return (
-        db.query(Monitoring)
-        .filter(
-            Monitoring.machine_id == machine_id,
-            Monitoring.date >= start,
-            Monitoring.date < end,
-        )
-        .order_by(
-            Monitoring.coins.desc(), Monitoring.toys.desc(), Monitoring.date.desc()
-        )
-        .first()
-    )
+ISSUE_DESCRIPTION_TEMPLATE = (
+    "Автоматическая выдача игрушек по отчету мониторинга за {date}. Автомат: {machine}"
+)
 
 
-def _get_daily_rent_cost(
-    db: Session, machine: Machine, days: int, on_date: datetime
-) -> Decimal:
-    # rent amount for current period containing on_date
-    rent = (
-        db.query(Rent)
-        .filter(
-            Rent.id == machine.rent_id,
-            Rent.start_date <= on_date,
-            Rent.end_date >= on_date,
-        )
-        .first()
-    )
+def _calc_daily_rent_cost(rent: Optional[Rent], days: int) -> Decimal:
+    # rent amount for current period containing report date
     if not rent:
         return Decimal(0)
 
@@ -101,131 +59,83 @@ def _get_daily_rent_cost(
     return daily_rent_rate * Decimal(days)
 
 
-def _get_average_toy_cost_in_machine(
-    db: Session, machine_id: int, on_date: datetime
-) -> Decimal:
-    # # Use average of active purchase prices for items currently in the machine weighted by quantities
-    # stocks: List[MachineStock] = (
-    #     db.query(MachineStock).filter(MachineStock.machine_id == machine_id).all()
-    # )
-    # total_qty = Decimal(0)
-    # total_cost = Decimal(0)
-    # for stock in stocks:
-    #     if not stock.quantity or Decimal(stock.quantity) <= 0:
-    #         continue
-    #     # find latest purchase price for this item by date
-    #     # Prefer purchase price; if absent, fallback to any active price
-    #     price: Price | None = (
-    #         db.query(Price)
-    #         .filter(
-    #             Price.item_id == stock.item_id,
-    #             Price.start_date <= on_date,
-    #             Price.end_date >= on_date,
-    #             Price.price_type == "purchase",
-    #         )
-    #         .order_by(Price.start_date.desc())
-    #         .first()
-    #     )
-    #     if not price:
-    #         price = (
-    #             db.query(Price)
-    #             .filter(
-    #                 Price.item_id == stock.item_id,
-    #                 Price.start_date <= on_date,
-    #                 Price.end_date >= on_date,
-    #             )
-    #             .order_by(Price.start_date.desc())
-    #             .first()
-    #         )
-    #     item_price = Decimal(price.price) if price else Decimal(0)
-    #     qty = Decimal(stock.quantity)
-    #     total_qty += qty
-    #     total_cost += qty * item_price
-    # if total_cost == 0:
-    # Fallback to loads-based weighted average (from inventory movements)
-    return _get_average_toy_cost_from_loads(db, machine_id, on_date)
-    # return total_cost / total_qty
-
-
-def _get_average_toy_cost_from_loads(
-    db: Session, machine_id: int, on_date: datetime
-) -> Decimal:
-    # Weighted average price from 'load_machine' movements into this machine up to on_date
-    loads = (
-        db.query(InventoryMovementItem)
-        .join(
-            InventoryMovement, InventoryMovementItem.movement_id == InventoryMovement.id
-        )
-        .filter(
-            InventoryMovement.movement_type == "load_machine",
-            InventoryMovement.to_machine_id == machine_id,
-            InventoryMovement.document_date <= on_date,
-        )
-        .all()
-    )
-    total_qty = Decimal(0)
-    total_cost = Decimal(0)
-    for item in loads:
-        qty = Decimal(item.quantity or 0)
-        price = Decimal(item.price or 0)
-        total_qty += qty
-        total_cost += qty * price
+def _calc_average_toy_cost(totals: Optional[Tuple[Decimal, Decimal]]) -> Decimal:
+    # Weighted average price from 'load_machine' movements into the machine up to report date
+    if not totals:
+        return Decimal(0)
+    total_qty, total_cost = totals
     if total_qty == 0:
         return Decimal(0)
     return total_cost / total_qty
 
 
-def _create_issue_movement_for_report(
-    db: Session,
-    machine: Machine,
-    report_date: datetime,
-    toys_diff: int,
+def _calc_report_values(
+    inputs: dict,
     avg_toy_cost: Decimal,
-) -> Optional[InventoryMovement]:
-    """
-    Создает движение товаров типа "выдача" для отчета по мониторингу.
-    Списывает игрушки с автомата в формате черновика.
-    """
-    if toys_diff <= 0:
-        return None
-
-    # Получаем статус "черновик"
-    draft_status = inventory_count_status_crud.get_by_name(db, "draft")
-    if not draft_status:
-        # Если статус не найден, используем ID 1 (предполагаем, что это черновик)
-        draft_status_id = 1
+    rent: Optional[Rent],
+) -> dict:
+    """Рассчитать показатели отчета автомата за день по показаниям мониторинга"""
+    # handle baseline values
+    has_prev = inputs["prev_date"] is not None
+    today_coins = Decimal(inputs["coins"])
+    today_toys = int(inputs["toys"])
+    prev_coins = Decimal(inputs["prev_coins"]) if has_prev else Decimal(0)
+    prev_toys = int(inputs["prev_toys"]) if has_prev else 0
+
+    coins_diff = today_coins - prev_coins
+    toys_diff = today_toys - prev_toys
+    if coins_diff < 0:
+        coins_diff = Decimal(0)
+    if toys_diff < 0:
+        toys_diff = 0
+
+    # revenue: coins_diff converted to rubles using 10 rub per coin (legacy query used *10). If game_cost is in coins, revenue is coins_diff.
+    # The user asks: "делим выручку на количество монет- это количество игр" meaning revenue is in rubles; coins are number of coins.
+    revenue_rub = coins_diff * COIN_PRICE_RUB
+
+    game_cost_coins = (
+        Decimal(inputs["game_cost"]) if inputs["game_cost"] else Decimal(1)
+    )
+    games_count = Decimal(0)
+    if game_cost_coins > 0:
+        # number of games = coins_diff / game_cost_coins
+        games_count = coins_diff / game_cost_coins
+
+    plays_per_toy = Decimal(0)
+    if toys_diff > 0:
+        plays_per_toy = games_count / Decimal(toys_diff)
+
+    day_expense = avg_toy_cost * Decimal(toys_diff)
+
+    # days between monitoring records
+    if has_prev:
+        days_count = (inputs["date"].date() - inputs["prev_date"].date()).days
+        if days_count < 0:
+            days_count = 0
     else:
-        draft_status_id = draft_status.id
+        # Если нет предыдущего мониторинга, считаем что прошло 1 день
+        days_count = 1
 
-    # Получаем товары в автомате
-    machine_stocks = (
-        db.query(MachineStock)
-        .filter(MachineStock.machine_id == machine.id, MachineStock.quantity > 0)
-        .all()
-    )
+    rent_cost = _calc_daily_rent_cost(rent, days_count)
 
-    if not machine_stocks:
-        return None
-
-    # Создаем движение товаров
-    movement = InventoryMovement(
-        movement_type="issue",
-        document_date=report_date,
-        status_id=draft_status_id,
-        description=f"Автоматическая выдача игрушек по отчету мониторинга за {report_date.strftime('%d.%m.%Y')}. Автомат: {machine.name}",
-        from_machine_id=machine.id,
-        created_by=None,  # Система
-        total_amount=avg_toy_cost * Decimal(toys_diff),
-        currency="RUB",
-    )
+    # Profit excludes rent; rent is provided as a separate field
+    profit = revenue_rub - day_expense - rent_cost
 
-    db.add(movement)
-    db.flush()  # Получаем ID движения
-    print(
-        f"Создано новое движение товаров для автомата {machine.id} на {report_date.date()} (ID: {movement.id})"
-    )
+    return {
+        "revenue": revenue_rub,
+        "toy_consumption": int(toys_diff),
+        "plays_per_toy": plays_per_toy,
+        "profit": profit,
+        "days_count": int(days_count),
+        "rent_cost": rent_cost,
+    }
 
-    # Распределяем количество игрушек по товарам в автомате
+
+def _build_issue_items(
+    machine_stocks: List[MachineStock], toys_diff: int, avg_toy_cost: Decimal
+) -> Tuple[List[InventoryMovementItem], Decimal]:
+    """Распределить расход игрушек по товарам в автомате"""
+    items = []
     remaining_toys = toys_diff
     total_cost = Decimal(0)
 
@@ -238,297 +148,253 @@ def _create_issue_movement_for_report(
         if quantity_to_issue <= 0:
             continue
 
-        # Получаем цену товара
-        item_price = avg_toy_cost  # Используем среднюю стоимость
-
-        # Проверяем, существует ли уже позиция для этого товара в движении
-        existing_item = (
-            db.query(InventoryMovementItem)
-            .filter(
-                InventoryMovementItem.movement_id == movement.id,
-                InventoryMovementItem.item_id == stock.item_id,
+        # Используем среднюю стоимость
+        item_price = avg_toy_cost
+        items.append(
+            InventoryMovementItem(
+                item_id=stock.item_id,
+                quantity=quantity_to_issue,
+                price=item_price,
+                amount=item_price * Decimal(quantity_to_issue),
             )
-            .first()
         )
+        total_cost += item_price * Decimal(quantity_to_issue)
+        remaining_toys -= quantity_to_issue
+
+    return items, total_cost
+
+
+def _sync_issue_movements(
+    db: Session, report_date: datetime, consumption: List[dict]
+) -> None:
+    """
+    Создает или обновляет движения товаров типа "выдача" для отчетов по мониторингу.
+    Списывает игрушки с автоматов в формате черновика; все автоматы обрабатываются
+    пакетно: остатки, существующие движения и позиции читаются и пишутся общими запросами.
+    """
+    machine_ids = [entry["machine_id"] for entry in consumption]
+    machine_stocks = reports_crud.get_machine_stocks_by_machine(db, machine_ids)
+    existing_movements = reports_crud.get_report_issue_movements(
+        db, machine_ids, report_date
+    )
 
-        if existing_item:
-            print(
-                f"  Позиция для товара {stock.item_id} в движении {movement.id} уже существует"
+    # Получаем статус "черновик"
+    draft_status = inventory_count_status_crud.get_by_name(db, "draft")
+    # Если статус не найден, используем ID 1 (предполагаем, что это черновик)
+    draft_status_id = draft_status.id if draft_status else 1
+
+    # Позиции существующих движений пересоздаются целиком
+    reports_crud.delete_movement_items(
+        db,
+        [
+            movement.id
+            for machine_id, movement in existing_movements.items()
+            if machine_stocks.get(machine_id)
+        ],
+    )
+
+    for entry in consumption:
+        machine_id = entry["machine_id"]
+        stocks = machine_stocks.get(machine_id)
+        if not stocks:
+            logger.debug(
+                f"Движение товаров для автомата {machine_id} не создано (нет товаров в автомате)"
             )
             continue
 
-        # Создаем позицию движения
-        movement_item = InventoryMovementItem(
-            movement_id=movement.id,
-            item_id=stock.item_id,
-            quantity=quantity_to_issue,
-            price=item_price,
-            amount=item_price * Decimal(quantity_to_issue),
+        items, total_cost = _build_issue_items(
+            stocks, entry["toys_diff"], entry["avg_toy_cost"]
         )
-
-        db.add(movement_item)
-        print(
-            f"  Создана позиция движения: товар {stock.item_id}, количество {quantity_to_issue}, цена {item_price}"
+        description = ISSUE_DESCRIPTION_TEMPLATE.format(
+            date=report_date.strftime("%d.%m.%Y"), machine=entry["machine_name"]
         )
-        total_cost += item_price * Decimal(quantity_to_issue)
-        remaining_toys -= quantity_to_issue
 
-    # Обновляем общую сумму движения
-    movement.total_amount = total_cost
-    print(f"  Общая сумма движения: {total_cost}")
+        movement = existing_movements.get(machine_id)
+        if movement:
+            movement.description = description
+            movement.total_amount = total_cost
+            for item in items:
+                item.movement_id = movement.id
+            db.add_all(items)
+        else:
+            db.add(
+                InventoryMovement(
+                    movement_type="issue",
+                    document_date=report_date,
+                    status_id=draft_status_id,
+                    description=description,
+                    from_machine_id=machine_id,
+                    created_by=None,  # Система
+                    total_amount=total_cost,
+                    currency="RUB",
+                    items=items,
+                )
+            )
 
-    return movement
+    db.flush()
 
 
-def _update_issue_movement_for_report(
-    db: Session,
-    movement: InventoryMovement,
-    machine: Machine,
-    report_date: datetime,
-    toys_diff: int,
-    avg_toy_cost: Decimal,
-) -> bool:
-    """
-    Обновляет существующее движение товаров типа "выдача" для отчета по мониторингу.
-    Обновляет позиции товаров и общую сумму движения.
-    """
-    if toys_diff <= 0:
-        return False
-
-    # Получаем товары в автомате
-    machine_stocks = (
-        db.query(MachineStock)
-        .filter(MachineStock.machine_id == machine.id, MachineStock.quantity > 0)
-        .all()
-    )
+def compute_and_store_reports(
+    db: Session, report_date: datetime, machine_ids: Optional[List[int]] = None
+) -> int:
+    # normalize report_date to date-only boundary
+    report_date = datetime(report_date.year, report_date.month, report_date.day)
 
-    if not machine_stocks:
-        return False
+    with report_profiler.run(report_date) as profile:
+        phase = partial(report_profiler.phase, profile)
 
-    # Удаляем все существующие позиции движения
-    db.query(InventoryMovementItem).filter(
-        InventoryMovementItem.movement_id == movement.id
-    ).delete()
+        # Machines without monitoring for the target day are skipped by the query itself
+        with phase("monitoring_lookup"):
+            inputs = reports_crud.get_daily_report_inputs(db, report_date, machine_ids)
+        machine_ids = [row["machine_id"] for row in inputs]
+        with phase("cost_lookup"):
+            load_totals = toy_cost_ledger_crud.get_toy_cost_totals(
+                db, machine_ids, report_date
+            )
+        with phase("rent_lookup"):
+            rents = reports_crud.get_active_rents(
+                db, list({row["rent_id"] for row in inputs if row["rent_id"]}), report_date
+            )
 
-    # Обновляем описание движения
-    movement.description = f"Автоматическая выдача игрушек по отчету мониторинга за {report_date.strftime('%d.%m.%Y')}. Автомат: {machine.name}"
+        report_rows = []
+        consumption = []
+        with phase("calculation"):
+            for row in inputs:
+                started = time.perf_counter()
+                machine_id = row["machine_id"]
+                avg_toy_cost = _calc_average_toy_cost(load_totals.get(machine_id))
+                values = _calc_report_values(row, avg_toy_cost, rents.get(row["rent_id"]))
+                report_rows.append(
+                    {"report_date": report_date, "machine_id": machine_id, **values}
+                )
+                # Создаем движение товаров типа "выдача" если есть расход игрушек
+                if values["toy_consumption"] > 0:
+                    consumption.append(
+                        {
+                            "machine_id": machine_id,
+                            "machine_name": row["name"],
+                            "toys_diff": values["toy_consumption"],
+                            "avg_toy_cost": avg_toy_cost,
+                        }
+                    )
+                if profile:
+                    profile.record_machine(machine_id, started)
+        if profile:
+            profile.machines = len(report_rows)
 
-    # Распределяем количество игрушек по товарам в автомате
-    remaining_toys = toys_diff
-    total_cost = Decimal(0)
+        try:
+            if consumption:
+                with phase("movement_upsert"):
+                    savepoint = db.begin_nested()
+                    try:
+                        _sync_issue_movements(db, report_date, consumption)
+                        savepoint.commit()
+                    except Exception as e:
+                        # Логируем ошибку, но не прерываем создание отчетов
+                        savepoint.rollback()
+                        logger.error(
+                            f"Ошибка при создании движений товаров за {report_date.date()}: {e}"
+                        )
 
-    for stock in machine_stocks:
-        if remaining_toys <= 0:
-            break
+            with phase("report_upsert"):
+                reports_crud.upsert_reports(db, report_rows)
+            with phase("commit"):
+                db.commit()
+            logger.info(
+                f"Обработано отчетов за {report_date.date()}: {len(report_rows)}"
+            )
+            return len(report_rows)
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении отчетов: {e}")
+            db.rollback()
+            raise
 
-        # Определяем, сколько товара списать
-        quantity_to_issue = min(remaining_toys, int(stock.quantity))
-        if quantity_to_issue <= 0:
-            continue
 
-        # Получаем цену товара
-        item_price = avg_toy_cost  # Используем среднюю стоимость
+def recompute_machine_days(db: Session, machine_days: Iterable[Tuple[int, date]]) -> int:
+    """
+    Пересчитать отчеты только для измененных пар (автомат, день).
+    Отчет следующего дня с данными тоже пересчитывается: его база - максимум
+    измененного дня. Отчеты за дни, где показаний больше нет, удаляются.
+    """
+    dirty = set(machine_days)
+    dirty |= reports_crud.get_next_monitoring_days(db, dirty)
 
-        # Создаем новую позицию движения
-        movement_item = InventoryMovementItem(
-            movement_id=movement.id,
-            item_id=stock.item_id,
-            quantity=quantity_to_issue,
-            price=item_price,
-            amount=item_price * Decimal(quantity_to_issue),
-        )
+    by_day: Dict[date, List[int]] = {}
+    for machine_id, day in dirty:
+        by_day.setdefault(day, []).append(machine_id)
 
-        db.add(movement_item)
-        print(
-            f"  Обновлена позиция движения: товар {stock.item_id}, количество {quantity_to_issue}, цена {item_price}"
+    processed = 0
+    for day in sorted(by_day):
+        machine_ids = sorted(by_day[day])
+        report_date = datetime(day.year, day.month, day.day)
+        reports_crud.delete_reports_without_monitoring(db, report_date, machine_ids)
+        processed += compute_and_store_reports(db, report_date, machine_ids)
+    return processed
+
+
+def start_reports_backfill(
+    start_date: date,
+    end_date: date,
+    machine_ids: Optional[List[int]] = None,
+    workers: Optional[int] = None,
+    chunk_size: Optional[int] = None,
+) -> dict:
+    """Запустить пересчет отчетов за период в пуле процессов"""
+    if start_date > end_date:
+        raise HTTPException(
+            status_code=400, detail="Дата начала периода позже даты окончания"
         )
-        total_cost += item_price * Decimal(quantity_to_issue)
-        remaining_toys -= quantity_to_issue
-
-    # Обновляем общую сумму движения
-    movement.total_amount = total_cost
-    print(f"  Обновлена общая сумма движения: {total_cost}")
+    job = report_backfill_manager.start(
+        start_date=start_date,
+        end_date=end_date,
+        machine_ids=machine_ids,
+        workers=workers,
+        chunk_size=chunk_size,
+    )
+    return job.to_dict()
 
-    return True
 
+def get_reports_backfill(job_id: str) -> dict:
+    """Получить прогресс задачи пересчета отчетов"""
+    job = report_backfill_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Задача пересчета не найдена")
+    return job.to_dict()
 
-def compute_and_store_reports(db: Session, report_date: datetime) -> int:
-    machines: List[Machine] = db.query(Machine).all()
-    processed = 0
-    # normalize report_date to date-only boundary
-    report_date = datetime(report_date.year, report_date.month, report_date.day)
 
-    for machine in machines:
-        today_mon = _get_max_monitoring_on_date(db, machine.id, report_date)
-        prev_mon = _get_prev_monitoring_day_max(db, machine.id, report_date)
-        if not today_mon:
-            # No monitoring for the target day -> skip
-            continue
-        # handle baseline values
-        today_coins = Decimal(today_mon.coins) if today_mon else Decimal(0)
-        today_toys = int(today_mon.toys) if today_mon else 0
-        prev_coins = Decimal(prev_mon.coins) if prev_mon else Decimal(0)
-        prev_toys = int(prev_mon.toys) if prev_mon else 0
-
-        coins_diff = today_coins - prev_coins
-        toys_diff = today_toys - prev_toys
-        if coins_diff < 0:
-            coins_diff = Decimal(0)
-        if toys_diff < 0:
-            toys_diff = 0
-
-        # revenue: coins_diff converted to rubles using 10 rub per coin (legacy query used *10). If game_cost is in coins, revenue is coins_diff.
-        # The user asks: "делим выручку на количество монет- это количество игр" meaning revenue is in rubles; coins are number of coins.
-        revenue_rub = coins_diff * Decimal(10)
-
-        game_cost_coins = (
-            Decimal(machine.game_cost) if machine.game_cost else Decimal(1)
-        )
-        games_count = Decimal(0)
-        if game_cost_coins > 0:
-            # number of games = coins_diff / game_cost_coins
-            games_count = coins_diff / game_cost_coins
-
-        plays_per_toy = Decimal(0)
-        if toys_diff > 0:
-            plays_per_toy = games_count / Decimal(toys_diff)
-
-        avg_toy_cost = _get_average_toy_cost_in_machine(db, machine.id, report_date)
-        day_expense = avg_toy_cost * Decimal(toys_diff)
-
-        # days between monitoring records
-        days_count = 0
-        if prev_mon and today_mon:
-            days_count = (today_mon.date.date() - prev_mon.date.date()).days
-            if days_count < 0:
-                days_count = 0
-        else:
-            # Если нет предыдущего мониторинга, считаем что прошло 1 день
-            days_count = 1
+def list_reports_backfills() -> List[dict]:
+    """Получить список задач пересчета отчетов"""
+    return [job.to_dict() for job in report_backfill_manager.list_jobs()]
 
-        rent_cost = _get_daily_rent_cost(db, machine, days_count, report_date)
 
-        # Profit excludes rent; rent is provided as a separate field
-        profit = revenue_rub - day_expense - rent_cost
+def cancel_reports_backfill(job_id: str) -> dict:
+    """Отменить задачу пересчета отчетов"""
+    job = report_backfill_manager.cancel(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Задача пересчета не найдена")
+    return job.to_dict()
 
-        # Логируем расчет для отладки
-        print(
-            f"Machine {machine.id} ({machine.name}): revenue={revenue_rub}, toy_expense={day_expense}, rent_cost={rent_cost}, days={days_count}, profit={profit}"
-        )
 
-        # Создаем движение товаров типа "выдача" если есть расход игрушек
-        if toys_diff > 0:
-            try:
-                # Проверяем, существует ли уже движение для этой даты и автомата
-                existing_movement = (
-                    db.query(InventoryMovement)
-                    .filter(
-                        InventoryMovement.movement_type == "issue",
-                        InventoryMovement.document_date == report_date,
-                        InventoryMovement.from_machine_id == machine.id,
-                        InventoryMovement.description.like(
-                            f"%отчету мониторинга за {report_date.strftime('%d.%m.%Y')}%"
-                        ),
-                    )
-                    .first()
-                )
+def rebuild_reports_rollups(db: Session) -> dict:
+    """Пересобрать суммы отчетов по периодам"""
+    rows = reports_crud.rebuild_report_rollups(db)
+    logger.info(f"Report rollups rebuilt: {rows} rows")
+    return {"rows": rows}
 
-                if existing_movement:
-                    print(
-                        f"  Обновляем существующее движение товаров для автомата {machine.id} на {report_date.date()} (ID: {existing_movement.id})"
-                    )
-                    update_result = _update_issue_movement_for_report(
-                        db, existing_movement, machine, report_date, toys_diff, avg_toy_cost
-                    )
-                    if update_result:
-                        print(f"  Движение товаров обновлено для автомата {machine.id}")
-                    else:
-                        print(
-                            f"  Движение товаров не обновлено для автомата {machine.id} (нет товаров в автомате)"
-                        )
-                else:
-                    movement_result = _create_issue_movement_for_report(
-                        db, machine, report_date, toys_diff, avg_toy_cost
-                    )
-                    if movement_result:
-                        print(f"  Движение товаров создано для автомата {machine.id}")
-                    else:
-                        print(
-                            f"  Движение товаров не создано для автомата {machine.id} (нет товаров в автомате)"
-                        )
-            except Exception as e:
-                # Логируем ошибку, но не прерываем создание отчета
-                print(
-                    f"Ошибка при создании движения товаров для автомата {machine.id}: {e}"
-                )
-                # Продолжаем выполнение, не прерывая создание отчета
 
-        # upsert report
-        existing = (
-            db.query(Report)
-            .filter(Report.machine_id == machine.id, Report.report_date == report_date)
-            .first()
-        )
-        if existing:
-            # Обновляем существующую запись
-            print(
-                f"Обновляем существующий отчет для автомата {machine.id} на {report_date.date()}"
-            )
-            existing.revenue = revenue_rub
-            existing.toy_consumption = int(toys_diff)
-            existing.plays_per_toy = plays_per_toy
-            existing.profit = profit
-            existing.days_count = int(days_count)
-            existing.rent_cost = rent_cost
-            # Используем merge для надежного обновления
-            db.merge(existing)
-            print(
-                f"  Обновленные значения: revenue={existing.revenue}, profit={existing.profit}, rent_cost={existing.rent_cost}"
-            )
-        else:
-            # Создаем новую запись
-            print(
-                f"Создаем новый отчет для автомата {machine.id} на {report_date.date()}"
-            )
-            new_report = Report(
-                report_date=report_date,
-                machine_id=machine.id,
-                revenue=revenue_rub,
-                toy_consumption=int(toys_diff),
-                plays_per_toy=plays_per_toy,
-                profit=profit,
-                days_count=int(days_count),
-                rent_cost=rent_cost,
-            )
-            db.add(new_report)
-            print(
-                f"  Новые значения: revenue={new_report.revenue}, profit={new_report.profit}, rent_cost={new_report.rent_cost}"
-            )
-        processed += 1
+def get_reports_profile() -> dict:
+    """Получить профиль расчета отчетов по фазам"""
+    return report_profiler.snapshot()
 
-    try:
-        db.commit()
-        print(f"Обработано отчетов: {processed}")
-
-        # Проверяем, что изменения сохранились
-        for machine in machines:
-            saved_report = (
-                db.query(Report)
-                .filter(
-                    Report.machine_id == machine.id, Report.report_date == report_date
-                )
-                .first()
-            )
-            if saved_report:
-                print(
-                    f"Проверка автомата {machine.id}: сохраненная прибыль = {saved_report.profit}, аренда = {saved_report.rent_cost}"
-                )
 
-        return processed
-    except Exception as e:
-        print(f"Ошибка при сохранении отчетов: {e}")
-        db.rollback()
-        raise
+def configure_reports_profile(enabled: Optional[bool] = None, reset: bool = False) -> dict:
+    """Включить/выключить профилирование расчета отчетов, сбросить замеры"""
+    report_profiler.configure(enabled=enabled, reset=reset)
+    logger.info(
+        f"Report profiling {'enabled' if report_profiler.enabled else 'disabled'}"
+        f"{', measurements reset' if reset else ''}"
+    )
+    return report_profiler.snapshot()
 
 
 def _period_key(dt: datetime, period: str) -> str:
@@ -551,65 +417,6 @@ def _period_key(dt: datetime, period: str) -> str:
     return dt.strftime("%Y-%m-%d")
 
 
-def _get_report_generation_date(dt: datetime, period: str) -> datetime:
-    """
-    Получить дату формирования отчета для указанного периода.
-    Возвращает последний день периода или текущую дату, если период еще не закончился.
-    Это дата, когда был сформирован отчет за данный промежуток времени.
-    """
-    # Получаем текущую дату в том же timezone, что и входная дата
-    if dt.tzinfo is not None:
-        now = datetime.now(timezone.utc)
-    else:
-        now = datetime.now()
-    
-    if period == "daily":
-        # Для ежедневных отчетов - сама дата
-        return dt
-    
-    elif period == "weekly":
-        # Для недельных - воскресенье недели или текущая дата
-        # Получаем воскресенье недели (последний день недели)
-        days_to_sunday = (6 - dt.weekday()) % 7
-        week_end = dt + timedelta(days=days_to_sunday)
-        # Если неделя еще не закончилась, используем текущую дату
-        return week_end if week_end <= now else now
-    
-    elif period == "monthly":
-        # Для месячных - последний день месяца или текущая дата
-        if dt.month == 12:
-            month_end = dt.replace(year=dt.year + 1, month=1, day=1) - timedelta(days=1)
-        else:
-            month_end = dt.replace(month=dt.month + 1, day=1) - timedelta(days=1)
-        return month_end if month_end <= now else now
-    
-    elif period == "quarterly":
-        # Для квартальных - последний день квартала или текущая дата
-        quarter_end_month = ((dt.month - 1) // 3 + 1) * 3  # 3, 6, 9, 12
-        if quarter_end_month == 12:
-            quarter_end = dt.replace(year=dt.year + 1, month=1, day=1) - timedelta(days=1)
-        else:
-            quarter_end = dt.replace(month=quarter_end_month + 1, day=1) - timedelta(days=1)
-        return quarter_end if quarter_end <= now else now
-    
-    elif period == "halfyear":
-        # Для полугодовых - 30 июня или 31 декабря или текущая дата
-        if dt.month <= 6:
-            halfyear_end = dt.replace(month=6, day=30)
-        else:
-            halfyear_end = dt.replace(year=dt.year + 1, month=1, day=1) - timedelta(days=1)
-        return halfyear_end if halfyear_end <= now else now
-    
-    elif period == "yearly":
-        # Для годовых - 31 декабря или текущая дата
-        year_end = dt.replace(year=dt.year + 1, month=1, day=1) - timedelta(days=1)
-        return year_end if year_end <= now else now
-    
-    else:
-        # По умолчанию - сама дата
-        return dt
-
-
 def aggregate_reports(
     db: Session,
     period: str = "daily",
@@ -617,34 +424,20 @@ def aggregate_reports(
     end_date: Optional[datetime] = None,
     machine_id: Optional[int] = None,
 ) -> Dict:
-    query = db.query(Report)
-    if start_date is not None:
-        query = query.filter(Report.report_date >= start_date)
-    if end_date is not None:
-        query = query.filter(Report.report_date <= end_date)
-    if machine_id is not None:
-        query = query.filter(Report.machine_id == machine_id)
-
-    rows: List[Report] = query.order_by(Report.report_date.desc()).all()
+    # Полные периоды читаются из report_rollups, неполные на краях - по дневным отчетам
+    totals = reports_crud.get_report_period_totals(
+        db, period, start_date=start_date, end_date=end_date, machine_id=machine_id
+    )
 
     buckets: Dict[str, Dict[str, Decimal | int]] = {}
-    for r in rows:
-        key = _period_key(r.report_date, period)
-        b = buckets.get(key)
-        if not b:
-            b = {
-                "total_revenue": Decimal(0),
-                "total_profit": Decimal(0),
-                "total_toys_sold": 0,
-                "total_rent_cost": Decimal(0),
-                "records_count": 0,
-            }
-            buckets[key] = b
-        b["total_revenue"] = b["total_revenue"] + Decimal(r.revenue or 0)
-        b["total_profit"] = b["total_profit"] + Decimal(r.profit or 0)
-        b["total_toys_sold"] = int(b["total_toys_sold"]) + int(r.toy_consumption or 0)
-        b["total_rent_cost"] = b["total_rent_cost"] + Decimal(r.rent_cost or 0)
-        b["records_count"] = int(b["records_count"]) + 1
+    for t in totals:
+        buckets[_period_key(t["period_start"], period)] = {
+            "total_revenue": Decimal(t["revenue"]),
+            "total_profit": Decimal(t["profit"]),
+            "total_toys_sold": int(t["toy_consumption"]),
+            "total_rent_cost": Decimal(t["rent_cost"]),
+            "records_count": int(t["records_count"]),
+        }
 
     # Build sorted result by period label
     def sort_key(label: str) -> tuple:
@@ -678,7 +471,7 @@ def aggregate_reports(
         total_toys_sold = int(b["total_toys_sold"])  # pcs
         total_rent_cost = Decimal(b["total_rent_cost"])  # RUB
         coins_earned = (
-            (total_revenue / Decimal(10)) if total_revenue is not None else Decimal(0)
+            (total_revenue / COIN_PRICE_RUB) if total_revenue is not None else Decimal(0)
         )
         items.append(
             {
@@ -695,9 +488,72 @@ def aggregate_reports(
     return {"success": True, "period": period, "data": items}
 
 
+def export_reports(fmt: str, report_date: Optional[datetime] = None):
+    """Потоковая выгрузка дневных отчетов с фильтрами списка"""
+    return export_response(
+        lambda db: reports_crud.reports_query(db, report_date),
+        Report.__table__,
+        fmt,
+        "reports",
+    )
+
+
 # --- Accounting Pivot контроллеры ---
 
 
+def get_accounting_pivot(db: Session, spec: accounting_pivot_crud.PivotSpec):
+    """Сводная таблица по произвольному набору измерений в колоночном формате"""
+    dimensions, source, filters, subtotals = (
+        spec.dimensions,
+        spec.source,
+        spec.filters,
+        spec.subtotals,
+    )
+    if source not in accounting_pivot_crud.PIVOT_SOURCES:
+        raise HTTPException(status_code=400, detail=f"Неизвестный источник: {source}")
+    allowed = accounting_pivot_crud.PIVOT_DIMENSIONS[source]
+    if not dimensions:
+        raise HTTPException(status_code=400, detail="Не указаны измерения")
+    unknown = [dim for dim in dimensions if dim not in allowed]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Измерения {', '.join(unknown)} недоступны для источника {source}",
+        )
+    if len(set(dimensions)) != len(dimensions):
+        raise HTTPException(status_code=400, detail="Измерения повторяются")
+    if source == "reports" and any(
+        ids for name, ids in (filters or {}).items() if name != "machine_ids"
+    ):
+        raise HTTPException(
+            status_code=400, detail="Для источника reports доступен только фильтр по автоматам"
+        )
+    if subtotals not in accounting_pivot_crud.PIVOT_SUBTOTALS:
+        raise HTTPException(status_code=400, detail=f"Неизвестный режим итогов: {subtotals}")
+
+    rows = accounting_pivot_crud.get_accounting_pivot(db, spec)
+    columns = {dim: [] for dim in dimensions}
+    columns.update(grouping=[], amount=[], income=[], expense=[], count=[])
+    for row in rows:
+        for dim in dimensions:
+            columns[dim].append(row._mapping[dim])
+        columns["grouping"].append(row.grouping)
+        columns["amount"].append(float(row.amount))
+        columns["income"].append(float(row.income))
+        columns["expense"].append(float(row.expense))
+        columns["count"].append(int(row.count))
+
+    return {
+        "success": True,
+        "source": source,
+        "period": spec.period,
+        "dimensions": dimensions,
+        "subtotals": subtotals,
+        "row_count": len(rows),
+        "columns": columns,
+    }
+
+
 def get_accounting_chart_data(
     db: Session,
     period: str = "monthly",
@@ -705,85 +561,36 @@ def get_accounting_chart_data(
     end_date: Optional[datetime] = None,
 ):
     """Получить данные для диаграммы доходов/расходов"""
-    from app.external.sqlalchemy.models import Transaction, TransactionCategory
-    from sqlalchemy import func, and_
-
-    # Базовый запрос для транзакций
-    query = (
-        db.query(
-            func.to_char(Transaction.date, _get_date_format(period)).label("period"),
-            TransactionCategory.name.label("category"),
-            func.sum(Transaction.amount).label("total_amount"),
-        )
-        .join(TransactionCategory)
-        .filter(Transaction.is_confirmed == True)
-        .filter(Transaction.transaction_type_id != 3)  # Исключаем переводы
+    # Доход и расход периода - по знаку сумм категорий, итоги считает БД
+    rows = accounting_pivot_crud.get_accounting_pivot(
+        db,
+        accounting_pivot_crud.PivotSpec(
+            ["period", "category"],
+            period=period,
+            start_date=start_date,
+            end_date=end_date,
+            grouping_sets=[("period",)],
+        ),
     )
+    totals = {row.period: row for row in rows}
+    sorted_periods = sorted(totals)
 
-    # Применяем фильтры по датам
-    if start_date:
-        query = query.filter(Transaction.date >= start_date)
-    if end_date:
-        query = query.filter(Transaction.date <= end_date)
-
-    # Группируем по периоду и категории
-    results = query.group_by("period", TransactionCategory.name).all()
-
-    # Организуем данные по периодам
-    periods = {}
-    categories = set()
-
-    for period_label, category, amount in results:
-        if period_label not in periods:
-            periods[period_label] = {}
-        periods[period_label][category] = float(amount)
-        categories.add(category)
-
-    # Сортируем периоды
-    sorted_periods = sorted(periods.keys())
-
-    # Создаем датасеты для диаграммы
-    datasets = []
-
-    # Доходы (положительные суммы)
-    income_data = []
-    expense_data = []
-
-    for period_label in sorted_periods:
-        period_data = periods.get(period_label, {})
-
-        income = 0
-        expense = 0
-
-        for category, amount in period_data.items():
-            if amount > 0:
-                income += amount
-            else:
-                expense += abs(amount)
-
-        income_data.append(income)
-        expense_data.append(expense)
-
-    # Создаем датасеты
-    datasets.append(
+    datasets = [
         {
             "label": "Доходы",
-            "data": income_data,
+            "data": [float(totals[label].income) for label in sorted_periods],
             "backgroundColor": "rgba(34, 197, 94, 0.8)",
             "borderColor": "rgba(34, 197, 94, 1)",
             "borderWidth": 1,
-        }
-    )
-
-    datasets.append(
+        },
         {
             "label": "Расходы",
-            "data": expense_data,
+            "data": [abs(float(totals[label].expense)) for label in sorted_periods],
             "backgroundColor": "rgba(239, 68, 68, 0.8)",
             "borderColor": "rgba(239, 68, 68, 1)",
             "borderWidth": 1,
-        }
-    )
+        },
+    ]
 
     chart_data = {"labels": sorted_periods, "datasets": datasets}
 
@@ -797,32 +604,10 @@ def get_transposed_sum_by_categories(
     end_date: Optional[datetime] = None,
 ):
     """Получить транспонированную таблицу сумм по категориям"""
-    from app.external.sqlalchemy.models import Transaction, TransactionCategory
-    from sqlalchemy import func
-
-    # Базовый запрос
-    query = (
-        db.query(
-            func.to_char(Transaction.date, _get_date_format(period)).label("period"),
-            TransactionCategory.name.label("category"),
-            func.sum(Transaction.amount).label("total_amount"),
-        )
-        .join(TransactionCategory)
-        .filter(Transaction.is_confirmed == True)
-        .filter(Transaction.transaction_type_id != 3)  # Исключаем переводы
+    return _build_transposed_response(
+        db, "transactions", "category", period, start_date, end_date
     )
 
-    # Применяем фильтры по датам
-    if start_date:
-        query = query.filter(Transaction.date >= start_date)
-    if end_date:
-        query = query.filter(Transaction.date <= end_date)
-
-    # Группируем по периоду и категории
-    results = query.group_by("period", TransactionCategory.name).all()
-
-    return _build_transposed_response(results, "category")
-
 
 def get_transposed_sum_by_counterparties(
     db: Session,
@@ -831,32 +616,10 @@ def get_transposed_sum_by_counterparties(
     end_date: Optional[datetime] = None,
 ):
     """Получить транспонированную таблицу сумм по контрагентам"""
-    from app.external.sqlalchemy.models import Transaction, Counterparty
-    from sqlalchemy import func
-
-    # Базовый запрос
-    query = (
-        db.query(
-            func.to_char(Transaction.date, _get_date_format(period)).label("period"),
-            Counterparty.name.label("counterparty"),
-            func.sum(Transaction.amount).label("total_amount"),
-        )
-        .join(Counterparty)
-        .filter(Transaction.is_confirmed == True)
-        .filter(Transaction.transaction_type_id != 3)  # Исключаем переводы
+    return _build_transposed_response(
+        db, "transactions", "counterparty", period, start_date, end_date
     )
 
-    # Применяем фильтры по датам
-    if start_date:
-        query = query.filter(Transaction.date >= start_date)
-    if end_date:
-        query = query.filter(Transaction.date <= end_date)
-
-    # Группируем по периоду и контрагенту
-    results = query.group_by("period", Counterparty.name).all()
-
-    return _build_transposed_response(results, "counterparty")
-
 
 def get_transposed_sum_by_machines(
     db: Session,
@@ -865,60 +628,44 @@ def get_transposed_sum_by_machines(
     end_date: Optional[datetime] = None,
 ):
     """Получить транспонированную таблицу сумм по автоматам"""
-    from app.external.sqlalchemy.models import Report, Machine
-    from sqlalchemy import func
-
-    # Базовый запрос по отчетам (Report содержит данные по автоматам)
-    query = db.query(
-        func.to_char(Report.report_date, _get_date_format(period)).label("period"),
-        Machine.name.label("machine"),
-        func.sum(Report.revenue).label("total_amount"),
-    ).join(Machine)
-
-    # Применяем фильтры по датам
-    if start_date:
-        query = query.filter(Report.report_date >= start_date)
-    if end_date:
-        query = query.filter(Report.report_date <= end_date)
-
-    # Группируем по периоду и автомату
-    results = query.group_by("period", Machine.name).all()
-
-    return _build_transposed_response(results, "machine")
-
+    # Выручка автоматов берется из дневных отчетов
+    return _build_transposed_response(
+        db, "reports", "machine", period, start_date, end_date
+    )
 
-def _get_date_format(period: str) -> str:
-    """Получить формат даты для PostgreSQL to_char"""
-    if period == "daily":
-        return "YYYY-MM-DD"
-    elif period == "weekly":
-        return "IYYY-IW"  # год-неделя (ISO)
-    elif period == "monthly":
-        return "YYYY-MM"
-    elif period == "quarterly":
-        return "YYYY-Q"  # год-квартал
-    elif period == "yearly":
-        return "YYYY"
-    else:
-        return "YYYY-MM"  # по умолчанию месяц
 
+def _build_transposed_response(
+    db: Session,
+    source: str,
+    entity_type: str,
+    period: str,
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+):
+    """Построить транспонированный ответ: ячейки и итоги периодов одним запросом"""
+    results = accounting_pivot_crud.get_accounting_pivot(
+        db,
+        accounting_pivot_crud.PivotSpec(
+            ["period", entity_type],
+            source=source,
+            period=period,
+            start_date=start_date,
+            end_date=end_date,
+            grouping_sets=[("period", entity_type), ("period",)],
+        ),
+    )
 
-def _build_transposed_response(results, entity_type: str):
-    """Построить транспонированный ответ из результатов запроса"""
-    # Организуем данные
-    periods_set = set()
     entities_data = {}
-
-    for period_label, entity_name, amount in results:
-        periods_set.add(period_label)
-
-        if entity_name not in entities_data:
-            entities_data[entity_name] = {}
-
-        entities_data[entity_name][period_label] = float(amount)
+    totals = {}
+    for row in results:
+        if row.grouping:
+            totals[row.period] = row
+            continue
+        entity_name = row._mapping[entity_type]
+        entities_data.setdefault(entity_name, {})[row.period] = float(row.amount)
 
     # Сортируем периоды
-    sorted_periods = sorted(periods_set)
+    sorted_periods = sorted(totals)
 
     # Создаем строки для таблицы
     rows = []
@@ -928,133 +675,118 @@ def _build_transposed_response(results, entity_type: str):
         entity_data = entities_data[entity_name]
 
         row = {"name": entity_name}
-        for period in sorted_periods:
-            row[period] = entity_data.get(period, 0)
+        for period_label in sorted_periods:
+            row[period_label] = entity_data.get(period_label, 0)
 
         rows.append(row)
 
     # Добавляем итоговые строки
     if rows:
-        # Строка доходов
         income_row = {"name": "Доход"}
-        # Строка расходов
         expense_row = {"name": "Расходы"}
-        # Итоговая строка
         total_row = {"name": "Итого"}
 
-        for period in sorted_periods:
-            income = 0
-            expense = 0
-
-            for entity_name, entity_data in entities_data.items():
-                amount = entity_data.get(period, 0)
-                if amount > 0:
-                    income += amount
-                else:
-                    expense += amount
-
-            income_row[period] = income
-            expense_row[period] = expense
-            total_row[period] = income + expense
+        for period_label in sorted_periods:
+            income_row[period_label] = float(totals[period_label].income)
+            expense_row[period_label] = float(totals[period_label].expense)
+            total_row[period_label] = float(totals[period_label].amount)
 
         rows.extend([income_row, expense_row, total_row])
 
     return {"success": True, "periods": sorted_periods, "rows": rows}
 
 
+def _detailed_report_row(row, period: str) -> dict:
+    """Проекция строки детального отчета для ответа"""
+    label = _period_key(row.period_start, period)
+    return {
+        "id": f"{row.machine_id}-{label}",
+        "period": label,
+        "report_date": row.report_date,
+        "machine_id": row.machine_id,
+        "revenue": row.revenue,
+        "toy_consumption": row.toy_consumption,
+        "plays_per_toy": row.plays_per_toy,
+        "profit": row.profit,
+        "days_count": row.days_count,
+        "rent_cost": row.rent_cost,
+        "machine": {"id": row.machine_id, "name": row.machine_name},
+    }
+
+
 def get_detailed_reports_by_period(
     db: Session,
     period: str = "daily",
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
     machine_id: Optional[int] = None,
-) -> List[Report]:
+    order_by: str = "report_date",
+    order_direction: str = "desc",
+    skip: int = 0,
+    limit: Optional[int] = None,
+) -> List[dict]:
     """Получить детальные отчеты по автоматам за указанный период"""
-    from sqlalchemy import func
-
-    # Базовый запрос
-    query = db.query(Report).join(Machine)
-
-    # Применяем фильтры по датам
-    if start_date is not None:
-        query = query.filter(Report.report_date >= start_date)
-    if end_date is not None:
-        query = query.filter(Report.report_date <= end_date)
+    query = reports_crud.machine_period_reports_query(
+        period, start_date, end_date, machine_id, order_by, order_direction, skip, limit
+    )
+    return [_detailed_report_row(row, period) for row in db.execute(query)]
 
-    # Применяем фильтр по автомату
-    if machine_id is not None:
-        query = query.filter(Report.machine_id == machine_id)
 
-    if period == "daily":
-        # Для ежедневных отчетов возвращаем как есть
-        return query.order_by(Report.report_date.desc(), Machine.name.asc()).all()
-    else:
-        # Для других периодов группируем данные по автоматам и периодам
-        # Создаем агрегированные записи для каждого автомата за каждый период
-        reports = []
+def _detailed_reports_json(rows, period: str) -> bytes:
+    """Элементы JSON-массива детальных отчетов для порции строк"""
+    return b",".join(
+        ReportPeriodOut.model_validate(_detailed_report_row(row, period))
+        .model_dump_json()
+        .encode()
+        for row in rows
+    )
 
-        # Получаем автоматы (все или только выбранный)
-        if machine_id is not None:
-            machines = db.query(Machine).filter(Machine.id == machine_id).all()
-        else:
-            machines = db.query(Machine).all()
-
-        for machine in machines:
-            # Получаем отчеты для конкретного автомата
-            machine_reports = query.filter(Report.machine_id == machine.id).all()
-
-            # Группируем по периодам
-            buckets = {}
-            for report in machine_reports:
-                key = _period_key(report.report_date, period)
-                if key not in buckets:
-                    # Получаем правильную дату формирования отчета для этого периода
-                    report_generation_date = _get_report_generation_date(report.report_date, period)
-                    buckets[key] = {
-                        "revenue": Decimal(0),
-                        "profit": Decimal(0),
-                        "toy_consumption": 0,
-                        "rent_cost": Decimal(0),
-                        "days_count": 0,
-                        "plays_per_toy": Decimal(0),
-                        "report_date": report_generation_date,  # Дата формирования отчета
-                    }
-
-                buckets[key]["revenue"] += Decimal(report.revenue or 0)
-                buckets[key]["profit"] += Decimal(report.profit or 0)
-                buckets[key]["toy_consumption"] += int(report.toy_consumption or 0)
-                buckets[key]["rent_cost"] += Decimal(report.rent_cost or 0)
-                buckets[key]["days_count"] += int(report.days_count or 1)
-
-            # Создаем агрегированные отчеты для каждого периода
-            for period_key, data in buckets.items():
-                # Рассчитываем среднее количество игр на игрушку
-                avg_plays_per_toy = (
-                    data["revenue"] / Decimal(10) / Decimal(data["toy_consumption"])
-                    if data["toy_consumption"] > 0
-                    else Decimal(0)
-                )
 
-                # Создаем новый отчет
-                aggregated_report = Report(
-                    id=hash(f"{machine.id}_{period_key}")
-                    % (2**31),  # Уникальный числовой ID
-                    machine_id=machine.id,
-                    report_date=data["report_date"],
-                    revenue=float(data["revenue"]),
-                    profit=float(data["profit"]),
-                    toy_consumption=data["toy_consumption"],
-                    rent_cost=float(data["rent_cost"]),
-                    days_count=data["days_count"],
-                    plays_per_toy=float(avg_plays_per_toy),
-                    machine=machine,  # Добавляем связь с машиной
-                )
+def _stream_detailed_reports(
+    db: Session, partitions: Iterator, first: bytes, period: str
+) -> Iterator[bytes]:
+    try:
+        yield b"[" + first
+        separator = b"," if first else b""
+        for rows in partitions:
+            yield separator + _detailed_reports_json(rows, period)
+            separator = b","
+        yield b"]"
+    except Exception as e:
+        # Без закрывающей скобки: соединение обрывается, и клиент не примет
+        # обрезанный массив за полный ответ
+        logger.error(f"Detailed reports stream aborted: {e}")
+        raise
+    finally:
+        db.close()
 
-                reports.append(aggregated_report)
 
-        # Сортируем по дате (убывание) и имени машины
-        return sorted(
-            reports,
-            key=lambda x: (x.report_date, x.machine.name if x.machine else ""),
-            reverse=True,
-        )
+def stream_detailed_reports_by_period(
+    period: str = "daily",
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    machine_id: Optional[int] = None,
+    order_by: str = "report_date",
+    order_direction: str = "desc",
+    skip: int = 0,
+    limit: Optional[int] = None,
+) -> Iterator[bytes]:
+    """Потоково отдать детальные отчеты JSON-массивом.
+
+    Строки читаются серверным курсором порциями, поэтому большой диапазон
+    не загружается в память целиком. Сессия своя: поток ответа живет
+    дольше зависимости get_db. Запрос выполняется и первая порция читается
+    до начала ответа, поэтому ошибка запроса возвращается кодом ошибки,
+    а не пустым массивом со статусом 200."""
+    query = reports_crud.machine_period_reports_query(
+        period, start_date, end_date, machine_id, order_by, order_direction, skip, limit
+    )
+    db = SessionLocal()
+    try:
+        result = db.execute(query.execution_options(yield_per=DETAILED_STREAM_BATCH))
+        partitions = result.partitions()
+        first = _detailed_reports_json(next(partitions, []), period)
+    except Exception:
+        db.close()
+        raise
+    return _stream_detailed_reports(db, partitions, first, period)
@@ -1,8 +1,8 @@
-from datetime import datetime
+from datetime import date, datetime
 from decimal import Decimal
-from typing import Optional
+from typing import List, Optional
 
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
 
 from app.api.machines.models import MachineOut
 
@@ -22,6 +22,25 @@ class ReportOut(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
+class ReportMachineRef(BaseModel):
+    id: int
+    name: str
+
+
+class ReportPeriodOut(BaseModel):
+    id: str  # автомат и метка периода
+    period: str
+    report_date: datetime
+    machine_id: int
+    revenue: Decimal
+    toy_consumption: int
+    plays_per_toy: Decimal
+    profit: Decimal
+    days_count: int
+    rent_cost: Decimal
+    machine: ReportMachineRef
+
+
 class ReportIn(BaseModel):
     report_date: datetime
 
@@ -31,6 +50,54 @@ class ReportComputeResponse(BaseModel):
     report_date: datetime
 
 
+class ReportRollupRebuildResponse(BaseModel):
+    rows: int
+
+
+class ReportBackfillIn(BaseModel):
+    start_date: date
+    end_date: date
+    machine_ids: Optional[List[int]] = None  # None - все автоматы
+    workers: Optional[int] = Field(None, ge=1, le=32)
+    chunk_size: Optional[int] = Field(None, ge=1, le=1000)  # автоматов в чанке
+
+
+class ReportBackfillOut(BaseModel):
+    id: str
+    # pending, running, completed, cancelled, failed;
+    # completed_with_errors - обход закончен, но failed_chunks чанков упали
+    # (их отчеты не пересчитаны, ошибка последнего - в last_error)
+    status: str
+    start_date: date
+    end_date: date
+    machine_ids: Optional[List[int]] = None
+    workers: int
+    total_chunks: int
+    done_chunks: int
+    failed_chunks: int
+    reports_processed: int
+    progress_percent: float
+    eta_seconds: Optional[float] = None
+    last_error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
+class ReportProfileConfigIn(BaseModel):
+    enabled: Optional[bool] = None  # None - не менять
+    reset: bool = False
+
+
+class ReportProfileOut(BaseModel):
+    enabled: bool
+    runs_recorded: int
+    phases: dict[str, dict]  # фаза -> runs, total_ms, avg_ms, max_ms, queries
+    slowest_runs: list[dict]
+    slowest_machines: list[dict]
+    recent_runs: list[dict]
+
+
 class ReportAggregateParams(BaseModel):
     period: str = "daily"  # daily, weekly, monthly, quarterly, halfyear, yearly
     start_date: Optional[datetime] = None
@@ -88,6 +155,18 @@ class TransposedSumResponse(BaseModel):
     rows: list[TransposedSumRow]
 
 
+class AccountingPivotResponse(BaseModel):
+    success: bool = True
+    source: str
+    period: str
+    dimensions: list[str]
+    subtotals: str
+    row_count: int
+    # Колонки: значения измерений, grouping (битовая маска свернутых измерений),
+    # amount, income, expense, count
+    columns: dict[str, list]
+
+
 class AccountingPeriodParams(BaseModel):
     period: str = "monthly"  # daily, weekly, monthly, quarterly, yearly
     start_date: Optional[datetime] = None
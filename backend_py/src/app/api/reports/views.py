@@ -1,18 +1,27 @@
 from datetime import datetime
 from typing import List
 
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
+from app.api.auth.middleware_dependencies import require_admin
 from app.external.sqlalchemy.session import get_db
-from app.external.sqlalchemy.models import Report
+from app.external.sqlalchemy.utils import reports as reports_crud
+from app.external.sqlalchemy.utils.accounting_pivot import PivotSpec
 from .models import (
     ReportOut, ReportIn, ReportComputeResponse, ReportAggregateParams, ReportAggregateResponse,
-    AccountingChartResponse, TransposedSumResponse, AccountingPeriodParams
+    AccountingChartResponse, TransposedSumResponse, AccountingPeriodParams,
+    AccountingPivotResponse,
+    ReportBackfillIn, ReportBackfillOut, ReportRollupRebuildResponse, ReportPeriodOut,
+    ReportProfileConfigIn, ReportProfileOut
 )
 from .controllers import (
-    compute_and_store_reports, aggregate_reports, get_detailed_reports_by_period,
-    get_accounting_chart_data, get_transposed_sum_by_categories,
+    compute_and_store_reports, aggregate_reports, stream_detailed_reports_by_period,
+    export_reports, start_reports_backfill, get_reports_backfill, list_reports_backfills,
+    cancel_reports_backfill, rebuild_reports_rollups,
+    get_reports_profile, configure_reports_profile,
+    get_accounting_pivot, get_accounting_chart_data, get_transposed_sum_by_categories,
     get_transposed_sum_by_counterparties, get_transposed_sum_by_machines
 )
 
@@ -25,12 +34,16 @@ def list_reports(
     report_date: datetime | None = Query(None, description="Filter by report date (day)"),
     db: Session = Depends(get_db),
 ):
-    query = db.query(Report).order_by(Report.report_date.desc())
-    if report_date:
-        # normalize to date-only and filter by that day
-        day = datetime(report_date.year, report_date.month, report_date.day)
-        query = query.filter(Report.report_date == day)
-    return query.all()
+    return reports_crud.reports_query(db, report_date).all()
+
+
+@router.get("/reports/export")
+def export_reports_view(
+    format: str = Query("csv", pattern="^(csv|parquet|arrow)$", description="csv|parquet|arrow"),
+    report_date: datetime | None = Query(None, description="Filter by report date (day)"),
+):
+    """Потоковая выгрузка отчетов"""
+    return export_reports(format, report_date)
 
 
 @router.post("/reports/compute", response_model=ReportComputeResponse)
@@ -50,6 +63,61 @@ def compute_reports_by_date(
     return ReportComputeResponse(processed=processed, report_date=date)
 
 
+@router.post("/reports/backfill", response_model=ReportBackfillOut)
+def create_reports_backfill(payload: ReportBackfillIn, request: Request):
+    """Запустить пересчет отчетов за период (только для администраторов)"""
+    require_admin(request)
+    return start_reports_backfill(
+        start_date=payload.start_date,
+        end_date=payload.end_date,
+        machine_ids=payload.machine_ids,
+        workers=payload.workers,
+        chunk_size=payload.chunk_size,
+    )
+
+
+@router.get("/reports/backfill", response_model=List[ReportBackfillOut])
+def read_reports_backfills(request: Request):
+    """Получить список задач пересчета отчетов (только для администраторов)"""
+    require_admin(request)
+    return list_reports_backfills()
+
+
+@router.get("/reports/backfill/{job_id}", response_model=ReportBackfillOut)
+def read_reports_backfill(job_id: str, request: Request):
+    """Получить прогресс и оценку времени задачи пересчета (только для администраторов)"""
+    require_admin(request)
+    return get_reports_backfill(job_id)
+
+
+@router.post("/reports/backfill/{job_id}/cancel", response_model=ReportBackfillOut)
+def cancel_reports_backfill_endpoint(job_id: str, request: Request):
+    """Отменить задачу пересчета отчетов (только для администраторов)"""
+    require_admin(request)
+    return cancel_reports_backfill(job_id)
+
+
+@router.post("/reports/rollups/rebuild", response_model=ReportRollupRebuildResponse)
+def rebuild_reports_rollups_endpoint(request: Request, db: Session = Depends(get_db)):
+    """Пересобрать суммы отчетов по периодам из дневных отчетов (только для администраторов)"""
+    require_admin(request)
+    return rebuild_reports_rollups(db)
+
+
+@router.get("/admin/reports/profile", response_model=ReportProfileOut, tags=["admin"])
+def read_reports_profile(request: Request):
+    """Профиль расчета отчетов по фазам (только для администраторов)"""
+    require_admin(request)
+    return get_reports_profile()
+
+
+@router.post("/admin/reports/profile", response_model=ReportProfileOut, tags=["admin"])
+def update_reports_profile(payload: ReportProfileConfigIn, request: Request):
+    """Включить/выключить профилирование расчета отчетов (только для администраторов)"""
+    require_admin(request)
+    return configure_reports_profile(enabled=payload.enabled, reset=payload.reset)
+
+
 @router.get("/reports/aggregate", response_model=ReportAggregateResponse)
 def aggregate_reports_endpoint(
     period: str = Query("daily", description="daily|weekly|monthly|quarterly|halfyear|yearly"),
@@ -67,21 +135,30 @@ def aggregate_reports_endpoint(
     )
 
 
-@router.get("/reports/detailed-by-period", response_model=List[ReportOut])
+@router.get("/reports/detailed-by-period", response_model=List[ReportPeriodOut])
 def detailed_reports_by_period(
     period: str = Query("daily", description="daily|weekly|monthly|quarterly|halfyear|yearly"),
     start_date: datetime | None = Query(None),
     end_date: datetime | None = Query(None),
     machine_id: int | None = Query(None, description="ID автомата для фильтрации"),
-    db: Session = Depends(get_db),
+    order_by: str = Query("report_date", description="Поле сортировки"),
+    order_direction: str = Query("desc", pattern="^(asc|desc)$", description="Направление"),
+    skip: int = Query(0, ge=0),
+    limit: int | None = Query(None, ge=1, description="Количество записей (по умолчанию все)"),
 ):
-    """Получить детальные отчеты по автоматам за указанный период"""
-    return get_detailed_reports_by_period(
-        db=db,
-        period=period,
-        start_date=start_date,
-        end_date=end_date,
-        machine_id=machine_id,
+    """Получить детальные отчеты по автоматам за указанный период (потоковый ответ)"""
+    return StreamingResponse(
+        stream_detailed_reports_by_period(
+            period=period,
+            start_date=start_date,
+            end_date=end_date,
+            machine_id=machine_id,
+            order_by=order_by,
+            order_direction=order_direction,
+            skip=skip,
+            limit=limit,
+        ),
+        media_type="application/json",
     )
 
 
@@ -103,6 +180,44 @@ def get_accounting_chart(
     )
 
 
+@router.get("/reports/accounting/pivot", response_model=AccountingPivotResponse, tags=["accounting"])
+def get_accounting_pivot_view(
+    dimensions: List[str] = Query(
+        ..., description="period|category|counterparty|machine|account|owner (для reports: period|machine)"
+    ),
+    source: str = Query("transactions", description="transactions|reports"),
+    period: str = Query("monthly", description="daily|weekly|monthly|quarterly|yearly"),
+    start_date: datetime | None = Query(None, description="Начальная дата"),
+    end_date: datetime | None = Query(None, description="Конечная дата"),
+    subtotals: str = Query("cube", description="cube|rollup|none"),
+    category_ids: List[int] | None = Query(None, description="Фильтр по категориям"),
+    counterparty_ids: List[int] | None = Query(None, description="Фильтр по контрагентам"),
+    machine_ids: List[int] | None = Query(None, description="Фильтр по автоматам"),
+    account_ids: List[int] | None = Query(None, description="Фильтр по счетам"),
+    owner_ids: List[int] | None = Query(None, description="Фильтр по владельцам"),
+    db: Session = Depends(get_db),
+):
+    """Сводная таблица по любым измерениям с промежуточными итогами одним запросом"""
+    return get_accounting_pivot(
+        db,
+        PivotSpec(
+            dimensions=dimensions,
+            source=source,
+            period=period,
+            start_date=start_date,
+            end_date=end_date,
+            filters={
+                "category_ids": category_ids,
+                "counterparty_ids": counterparty_ids,
+                "machine_ids": machine_ids,
+                "account_ids": account_ids,
+                "owner_ids": owner_ids,
+            },
+            subtotals=subtotals,
+        ),
+    )
+
+
 @router.get("/reports/accounting/pivot-transposed/categories", response_model=TransposedSumResponse, tags=["accounting"])
 def get_accounting_pivot_categories(
     period: str = Query("monthly", description="daily|weekly|monthly|quarterly|yearly"),
@@ -12,6 +12,8 @@ from sqlalchemy.orm import Session
 from app.external.sqlalchemy.utils import owners as owners_crud
 from app.external.sqlalchemy.utils import terminal_operations as terminal_ops_crud
 from app.external.sqlalchemy.utils import terminals as terminals_crud
+from app.external.sqlalchemy.models import TerminalOperation
+from app.services.table_export import export_response
 from app.settings.generated_settings import Settings
 
 from .models import (
@@ -52,6 +54,23 @@ def get_terminal_operations(
     )
 
 
+def export_terminal_operations(
+    fmt: str,
+    operation_date: Optional[date | datetime.datetime] = None,
+    terminal_id: Optional[int] = None,
+    is_closed: Optional[bool] = None,
+):
+    """Потоковая выгрузка операций терминалов с фильтрами списка"""
+    return export_response(
+        lambda db: terminal_ops_crud.terminal_operations_query(
+            db, operation_date, terminal_id, is_closed
+        ),
+        TerminalOperation.__table__,
+        fmt,
+        "terminal_operations",
+    )
+
+
 def create_terminal_operation(db: Session, operation_data: TerminalOperationCreate):
     """Создать новую операцию терминала"""
     try:
@@ -42,6 +42,24 @@ def read_terminal_operations(
     )
 
 
+@router.get("/export")
+def export_terminal_operations(
+    format: str = Query("csv", pattern="^(csv|parquet|arrow)$", description="csv|parquet|arrow"),
+    operation_date: Optional[date | datetime] = Query(
+        None, description="Дата операции"
+    ),
+    terminal_id: Optional[int] = Query(None, description="ID терминала"),
+    is_closed: Optional[bool] = Query(None, description="Закрыта ли операция"),
+):
+    """Потоковая выгрузка операций терминалов в CSV/Parquet/Arrow"""
+    return controllers.export_terminal_operations(
+        format,
+        operation_date=operation_date,
+        terminal_id=terminal_id,
+        is_closed=is_closed,
+    )
+
+
 @router.post("/", response_model=TerminalOperationOut)
 def create_terminal_operation(
     operation_data: TerminalOperationCreate,
@@ -2,6 +2,7 @@ from fastapi import HTTPException
 from sqlalchemy.orm import Session
 from .models import TransactionIn, TransactionUpdate, TransactionFilter
 from app.external.sqlalchemy.utils import transactions as transaction_crud
+from app.external.sqlalchemy.utils.pagination import InvalidCursorError
 from app.external.sqlalchemy.utils.reference_tables import (
     account_type_crud,
     transaction_type_crud,
@@ -13,6 +14,8 @@ from app.external.sqlalchemy.utils.counterparties import get_counterparty
 from app.external.sqlalchemy.utils.machines import get_machine
 from app.external.sqlalchemy.utils.rent import get_rent
 from app.external.sqlalchemy.utils.users import get_user_by_id
+from app.external.sqlalchemy.models import Transaction
+from app.services.table_export import export_response
 from typing import List
 from datetime import date, datetime
 
@@ -56,6 +59,55 @@ def get_transactions(
     )
 
 
+def get_transactions_page(
+    db: Session,
+    limit: int = 100,
+    skip: int = 0,
+    cursor: str = None,
+    total: str = None,
+    **filters,
+):
+    """Страница транзакций с курсором следующей страницы и итогами"""
+    try:
+        return transaction_crud.get_transactions_page(
+            db, limit=limit, skip=skip, cursor=cursor, total=total, **filters
+        )
+    except InvalidCursorError:
+        raise HTTPException(status_code=400, detail="Некорректный курсор страницы")
+
+
+def export_transactions(
+    fmt: str,
+    account_id: int = None,
+    category_id: int = None,
+    counterparty_id: int = None,
+    transaction_type_id: int = None,
+    machine_id: int = None,
+    date_from: date = None,
+    date_to: date = None,
+    is_confirmed: bool = None,
+    search: str = None,
+):
+    """Потоковая выгрузка транзакций с фильтрами списка"""
+    return export_response(
+        lambda db: transaction_crud.transactions_query(
+            db,
+            account_id=account_id,
+            category_id=category_id,
+            counterparty_id=counterparty_id,
+            transaction_type_id=transaction_type_id,
+            machine_id=machine_id,
+            date_from=date_from,
+            date_to=date_to,
+            is_confirmed=is_confirmed,
+            search=search,
+        ),
+        Transaction.__table__,
+        fmt,
+        "transactions",
+    )
+
+
 def get_transactions_by_account(
     db: Session, account_id: int, skip: int = 0, limit: int = 100
 ):
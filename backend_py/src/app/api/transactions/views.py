@@ -1,8 +1,9 @@
-from fastapi import APIRouter, Depends, Query, Path
+from fastapi import APIRouter, Depends, Query, Path, Response
 from sqlalchemy.orm import Session
 from .models import TransactionIn, TransactionOut, TransactionUpdate, TransactionSummary
 from . import controllers
 from app.external.sqlalchemy.session import get_db
+from app.external.sqlalchemy.utils.pagination import page_headers
 from typing import List, Optional
 from datetime import date, datetime
 
@@ -11,6 +12,7 @@ router = APIRouter()
 
 @router.get("/transactions", response_model=List[TransactionOut])
 def read_transactions(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     account_id: Optional[int] = Query(None, description="Фильтр по ID счета"),
@@ -28,13 +30,57 @@ def read_transactions(
     search: Optional[str] = Query(
         None, description="Поиск по описанию и номеру ссылки"
     ),
+    cursor: Optional[str] = Query(
+        None, description="Курсор страницы (пустой - первая); следующий - в X-Next-Cursor"
+    ),
+    total: Optional[str] = Query(
+        None, pattern="^(exact|estimate)$", description="Итог по фильтрам: exact|estimate"
+    ),
     db: Session = Depends(get_db),
 ):
     """Получить список транзакций с фильтрацией"""
-    return controllers.get_transactions(
+    page = controllers.get_transactions_page(
         db,
         skip=skip,
         limit=limit,
+        cursor=cursor,
+        total=total,
+        account_id=account_id,
+        category_id=category_id,
+        counterparty_id=counterparty_id,
+        transaction_type_id=transaction_type_id,
+        machine_id=machine_id,
+        date_from=date_from,
+        date_to=date_to,
+        is_confirmed=is_confirmed,
+        search=search,
+    )
+    response.headers.update(page_headers(page))
+    return page.items
+
+
+@router.get("/transactions/export")
+def export_transactions(
+    format: str = Query("csv", pattern="^(csv|parquet|arrow)$", description="csv|parquet|arrow"),
+    account_id: Optional[int] = Query(None, description="Фильтр по ID счета"),
+    category_id: Optional[int] = Query(None, description="Фильтр по ID категории"),
+    counterparty_id: Optional[int] = Query(
+        None, description="Фильтр по ID контрагента"
+    ),
+    transaction_type_id: Optional[int] = Query(
+        None, description="Фильтр по ID типа транзакций"
+    ),
+    machine_id: Optional[int] = Query(None, description="Фильтр по ID автомата"),
+    date_from: Optional[date | datetime] = Query(None, description="Фильтр по дате с"),
+    date_to: Optional[date | datetime] = Query(None, description="Фильтр по дате по"),
+    is_confirmed: Optional[bool] = Query(None, description="Фильтр по подтверждению"),
+    search: Optional[str] = Query(
+        None, description="Поиск по описанию и номеру ссылки"
+    ),
+):
+    """Потоковая выгрузка транзакций в CSV/Parquet/Arrow"""
+    return controllers.export_transactions(
+        format,
         account_id=account_id,
         category_id=category_id,
         counterparty_id=counterparty_id,
@@ -40,6 +40,9 @@ from .app_status import status_router
 from .middleware.audit import AuditMiddleware
 from .middleware.auth import AuthMiddleware
 from .middleware.temp_file_cleanup import TempFileCleanupMiddleware
+from .services.api_token_usage import api_token_usage
+from .services.audit_writer import audit_log_writer
+from .services.report_recompute import report_recompute_queue
 from .services.scheduler import task_scheduler
 from .settings import settings
 
@@ -188,6 +191,16 @@ app.add_middleware(
         "Access-Control-Allow-Headers",
         "Access-Control-Allow-Methods",
     ],  # Явно указываем заголовки
+    # Служебные заголовки пагинации списков доступны клиенту
+    expose_headers=[
+        "X-Next-Cursor",
+        "X-Total-Count",
+        "X-Total-Estimate",
+        "X-RateLimit-Limit",
+        "X-RateLimit-Remaining",
+        "X-RateLimit-Reset",
+        "Retry-After",
+    ],
 )
 
 # Добавляем Authentication middleware
@@ -233,6 +246,7 @@ def create_tables():
 
         # Инициализируем базу данных данными по умолчанию
         init_database()
+        init_derived_tables()
 
     except Exception as e:
         logger.error(f"Table creation failed: {e}")
@@ -402,6 +416,115 @@ def init_database():
         db.close()
 
 
+def init_derived_tables():
+    """Первичное заполнение производных таблиц (дневные срезы мониторинга,
+    суммы отчетов, итоги загрузок).
+
+    Каждый шаг выполняется отдельно: ошибка одного шага логируется и не
+    отменяет остальные. Перенос monitoring и audit_logs в секционированные
+    таблицы при старте не выполняется - это отдельные шаги администратора
+    (POST /api/admin/monitoring/partitions/migrate, POST /api/audit/partitions/migrate)."""
+    from app.external.sqlalchemy.models import (
+        AuditLog,
+        InventoryMovement,
+        Monitoring,
+        Transaction,
+    )
+    from app.external.sqlalchemy.session import SessionLocal
+    from app.external.sqlalchemy.utils import audit as audit_crud
+    from app.external.sqlalchemy.utils import audit_partitions
+    from app.external.sqlalchemy.utils import monitoring as monitoring_crud
+    from app.external.sqlalchemy.utils import monitoring_partitions
+    from app.external.sqlalchemy.utils import reports as reports_crud
+    from app.external.sqlalchemy.utils import toy_cost_ledger as toy_cost_ledger_crud
+
+    def ensure_monitoring_partitions(db):
+        if not monitoring_partitions.is_monitoring_partitioned(db):
+            logger.warning(
+                "Monitoring table is not partitioned, run "
+                "POST /api/admin/monitoring/partitions/migrate"
+            )
+            return
+        monitoring_partitions.ensure_monitoring_partitions(
+            db, months_ahead=settings.monitoring_partitions_ahead
+        )
+
+    def ensure_audit_partitions(db):
+        if not audit_partitions.is_audit_logs_partitioned(db):
+            logger.warning(
+                "Audit logs table is not partitioned, run POST /api/audit/partitions/migrate"
+            )
+            return
+        audit_partitions.ensure_audit_partitions(
+            db, months_ahead=settings.audit_partitions_ahead
+        )
+
+    def create_indexes(db):
+        # Индексы, добавленные к уже существующим таблицам, create_all не создает
+        for model in (Monitoring, Transaction, InventoryMovement, AuditLog):
+            for index in model.__table__.indexes:
+                index.create(engine, checkfirst=True)
+        if not audit_crud.ensure_audit_search_indexes(db):
+            logger.warning(
+                "pg_trgm is not available, audit log search will not use indexes"
+            )
+
+    def rebuild(name, needs_rebuild, rebuild_table):
+        def step(db):
+            if needs_rebuild(db):
+                rows = rebuild_table(db)
+                logger.info(f"{name} rebuilt: {rows} rows")
+
+        return step
+
+    steps = (
+        ("monitoring partitions", ensure_monitoring_partitions),
+        ("audit partitions", ensure_audit_partitions),
+        ("indexes", create_indexes),
+        (
+            "monitoring daily",
+            rebuild(
+                "Monitoring daily snapshots",
+                monitoring_crud.monitoring_daily_needs_rebuild,
+                monitoring_crud.rebuild_monitoring_daily,
+            ),
+        ),
+        (
+            "report rollups",
+            rebuild(
+                "Report rollups",
+                reports_crud.report_rollups_need_rebuild,
+                reports_crud.rebuild_report_rollups,
+            ),
+        ),
+        (
+            "audit hourly stats",
+            rebuild(
+                "Audit hourly stats",
+                audit_crud.audit_hourly_stats_need_rebuild,
+                audit_crud.rebuild_audit_hourly_stats,
+            ),
+        ),
+        (
+            "toy cost ledger",
+            rebuild(
+                "Toy cost ledger",
+                toy_cost_ledger_crud.toy_cost_ledger_needs_rebuild,
+                toy_cost_ledger_crud.rebuild_toy_cost_ledger,
+            ),
+        ),
+    )
+    for name, step in steps:
+        db = SessionLocal()
+        try:
+            step(db)
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Derived tables initialization step '{name}' failed: {e}")
+        finally:
+            db.close()
+
+
 async def start_scheduler():
     """Запустить планировщик задач"""
     await task_scheduler.start()
@@ -414,6 +537,36 @@ async def shutdown_scheduler():
     logger.info("Task scheduler stopped")
 
 
+async def start_report_recompute():
+    """Запустить воркер пересчета отчетов"""
+    await report_recompute_queue.start()
+
+
+async def shutdown_report_recompute():
+    """Остановить воркер пересчета отчетов с досчетом очереди"""
+    await report_recompute_queue.shutdown()
+
+
+async def start_api_token_usage():
+    """Запустить запись статистики API токенов"""
+    await api_token_usage.start()
+
+
+async def shutdown_api_token_usage():
+    """Остановить запись статистики API токенов с сохранением остатка"""
+    await api_token_usage.shutdown()
+
+
+async def start_audit_writer():
+    """Запустить запись журнала аудита"""
+    await audit_log_writer.start()
+
+
+async def shutdown_audit_writer():
+    """Остановить запись журнала аудита с сохранением остатка"""
+    await audit_log_writer.shutdown()
+
+
 def create_app():
     logger.configure(
         handlers=[
@@ -427,7 +580,13 @@ def create_app():
 
     app.add_event_handler("startup", create_tables)
     app.add_event_handler("startup", start_scheduler)
+    app.add_event_handler("startup", start_report_recompute)
+    app.add_event_handler("startup", start_api_token_usage)
+    app.add_event_handler("startup", start_audit_writer)
     app.add_event_handler("shutdown", shutdown_scheduler)
+    app.add_event_handler("shutdown", shutdown_report_recompute)
+    app.add_event_handler("shutdown", shutdown_api_token_usage)
+    app.add_event_handler("shutdown", shutdown_audit_writer)
     app.include_router(status_router)
     app.include_router(auth_router, prefix="/api/auth", tags=["auth"])
     app.include_router(user_router, prefix="/api", tags=["users"])
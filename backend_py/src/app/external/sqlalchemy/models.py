@@ -7,13 +7,17 @@ from sqlalchemy import (
     Column,
     Date,
     DateTime,
+    Float,
     ForeignKey,
+    Index,
     Integer,
     Numeric,
+    Sequence,
     String,
     Text,
     UniqueConstraint,
     JSON,
+    func,
 )
 from sqlalchemy.orm import declarative_base, relationship
 
@@ -215,6 +219,9 @@ class Transaction(Base):
         onupdate=datetime.now,
     )
 
+    # Порядок списка и keyset-пагинации
+    __table_args__ = (Index("ix_transactions_date_id", date, id),)
+
     # Relationships
     account = relationship(
         "Account", back_populates="transactions", foreign_keys=[account_id]
@@ -378,11 +385,24 @@ class Machine(Base):
     phone = relationship("Phone", back_populates="machine")
 
 
+# Общая последовательность id показаний: номер выдается при записи ключа
+monitoring_id_seq = Sequence("monitoring_id_seq")
+
+
 class Monitoring(Base):
+    """Показания мониторинга; таблица секционирована по месяцам (RANGE по date)"""
+
     __tablename__ = "monitoring"
-    id = Column(Integer, primary_key=True, autoincrement=True)
+    id = Column(
+        Integer,
+        monitoring_id_seq,
+        primary_key=True,
+        server_default=monitoring_id_seq.next_value(),
+    )
+    # Ключ секционирования входит в первичный ключ
     date = Column(
         DateTime(timezone=True),
+        primary_key=True,
         nullable=False,
         default=lambda: datetime.now(timezone.utc),
     )
@@ -393,11 +413,58 @@ class Monitoring(Base):
     )
     machine = relationship("Machine", back_populates="monitoring_records")
 
-    # Уникальный ключ для предотвращения дублирования
     __table_args__ = (
-        UniqueConstraint(
-            "machine_id", "coins", "toys", name="unique_machine_coins_toys"
-        ),
+        Index("ix_monitoring_machine_date", machine_id, date),
+        Index("ix_monitoring_date_id", date, id),
+        {"postgresql_partition_by": "RANGE (date)"},
+    )
+
+
+class MonitoringKey(Base):
+    """Ключ уникальности показания (machine_id, coins, toys).
+
+    В секционированной таблице уникальность без date невозможна, поэтому
+    дубликаты отсекаются здесь; ключи архивных показаний сохраняются."""
+
+    __tablename__ = "monitoring_keys"
+    machine_id = Column(
+        Integer, ForeignKey("machines.id", ondelete="CASCADE"), primary_key=True
+    )
+    coins = Column(Numeric(10, 2), primary_key=True)
+    toys = Column(Integer, primary_key=True)
+    monitoring_id = Column(
+        Integer, nullable=False, server_default=monitoring_id_seq.next_value()
+    )
+
+
+class MonitoringDaily(Base):
+    """Дневной срез мониторинга автомата (обновляется при поступлении показаний)"""
+
+    __tablename__ = "monitoring_daily"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    machine_id = Column(
+        Integer, ForeignKey("machines.id", ondelete="CASCADE"), nullable=False
+    )
+    day = Column(DateTime(timezone=True), nullable=False)  # Начало дня
+    readings_count = Column(Integer, nullable=False, default=0)
+    # Максимальное показание за день (по coins, toys, date)
+    max_monitoring_id = Column(Integer, nullable=False)
+    max_coins = Column(Numeric(10, 2), nullable=False)
+    max_toys = Column(Integer, nullable=False)
+    max_date = Column(DateTime(timezone=True), nullable=False)
+    # Первое показание за день
+    first_monitoring_id = Column(Integer, nullable=False)
+    first_coins = Column(Numeric(10, 2), nullable=False)
+    first_toys = Column(Integer, nullable=False)
+    first_date = Column(DateTime(timezone=True), nullable=False)
+    # Последнее показание за день
+    last_monitoring_id = Column(Integer, nullable=False)
+    last_coins = Column(Numeric(10, 2), nullable=False)
+    last_toys = Column(Integer, nullable=False)
+    last_date = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("machine_id", "day", name="unique_monitoring_daily_machine_day"),
     )
 
 
@@ -702,6 +769,11 @@ class InventoryMovement(Base):
     )  # Общая сумма документа
     currency = Column(String(3), nullable=False, default="RUB")  # Валюта
 
+    # Порядок списка и keyset-пагинации
+    __table_args__ = (
+        Index("ix_inventory_movements_document_date_id", document_date, id),
+    )
+
     # Relationships
     status = relationship("InventoryCountStatus")
     from_warehouse = relationship("Warehouse", foreign_keys=[from_warehouse_id])
@@ -738,6 +810,33 @@ class InventoryMovementItem(Base):
     item = relationship("Item")
 
 
+class MachineToyCostLedger(Base):
+    """Накопительный итог загрузок игрушек в автомат (для средней себестоимости)"""
+
+    __tablename__ = "machine_toy_cost_ledger"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    machine_id = Column(
+        Integer, ForeignKey("machines.id", ondelete="CASCADE"), nullable=False
+    )
+    movement_id = Column(
+        Integer,
+        ForeignKey("inventory_movements.id", ondelete="CASCADE"),
+        nullable=False,
+        unique=True,
+    )  # Проведенная загрузка автомата
+    document_date = Column(DateTime(timezone=True), nullable=False)
+    quantity = Column(Numeric(18, 3), nullable=False, default=0)  # Загружено (шт)
+    cost = Column(Numeric(20, 5), nullable=False, default=0)  # Стоимость загрузки
+    total_quantity = Column(
+        Numeric(18, 3), nullable=False, default=0
+    )  # Итого загружено на дату
+    total_cost = Column(Numeric(20, 5), nullable=False, default=0)  # Итого стоимость
+
+    __table_args__ = (
+        Index("ix_toy_cost_ledger_machine_date", machine_id, document_date, id),
+    )
+
+
 class Report(Base):
     __tablename__ = "reports"
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -765,6 +864,43 @@ class Report(Base):
     )
 
 
+class ReportRollup(Base):
+    """Предрассчитанные суммы отчетов за период (по автомату и по всему парку)"""
+
+    __tablename__ = "report_rollups"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    period = Column(
+        String(20), nullable=False
+    )  # weekly, monthly, quarterly, halfyear, yearly
+    period_start = Column(DateTime(timezone=True), nullable=False)  # Начало периода
+    period_end = Column(
+        DateTime(timezone=True), nullable=False
+    )  # Начало следующего периода
+    machine_id = Column(
+        Integer, ForeignKey("machines.id", ondelete="CASCADE"), nullable=True
+    )  # NULL - итог по всему парку
+    revenue = Column(Numeric(15, 2), nullable=False, default=0)
+    profit = Column(Numeric(15, 2), nullable=False, default=0)
+    toy_consumption = Column(BigInteger, nullable=False, default=0)
+    rent_cost = Column(Numeric(15, 2), nullable=False, default=0)
+    days_count = Column(
+        Integer, nullable=False, default=0
+    )  # Сумма дней (0 в отчете считается как 1)
+    records_count = Column(Integer, nullable=False, default=0)  # Дневных отчетов
+
+    machine = relationship("Machine")
+
+    __table_args__ = (
+        Index(
+            "unique_report_rollup",
+            period,
+            period_start,
+            func.coalesce(machine_id, 0),
+            unique=True,
+        ),
+    )
+
+
 class InfoCard(Base):
     __tablename__ = "info_cards"
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -851,12 +987,20 @@ class Document(Base):
     uploader = relationship("User")
 
 
+audit_logs_id_seq = Sequence("audit_logs_id_seq")
+
+
 class AuditLog(Base):
-    """Модель для хранения аудит-логов системы"""
+    """Модель для хранения аудит-логов системы (секционирована по месяцам created_at)"""
 
     __tablename__ = "audit_logs"
 
-    id = Column(Integer, primary_key=True, autoincrement=True)
+    id = Column(
+        Integer,
+        audit_logs_id_seq,
+        primary_key=True,
+        server_default=audit_logs_id_seq.next_value(),
+    )
     user_id = Column(
         Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True
     )
@@ -875,8 +1019,22 @@ class AuditLog(Base):
     duration_ms = Column(Integer, nullable=True)  # Длительность выполнения в мс
     status_code = Column(Integer, nullable=True)  # HTTP статус код ответа
     error_message = Column(Text, nullable=True)  # Сообщение об ошибке (если есть)
+    # Ключ секционирования входит в первичный ключ
     created_at = Column(
-        DateTime(timezone=True), nullable=False, default=datetime.utcnow, index=True
+        DateTime(timezone=True), primary_key=True, nullable=False, default=datetime.utcnow
+    )
+
+    __table_args__ = (
+        # Порядок списка и keyset-пагинации
+        Index("ix_audit_logs_created_at_id", created_at, id),
+        # Фильтры списка с сортировкой по времени
+        Index("ix_audit_logs_user_created_at", user_id, created_at, id),
+        Index("ix_audit_logs_action_created_at", action, created_at, id),
+        Index("ix_audit_logs_table_created_at", table_name, created_at, id),
+        Index("ix_audit_logs_status_created_at", status_code, created_at, id),
+        Index("ix_audit_logs_request_id", request_id),
+        Index("ix_audit_logs_duration_ms", duration_ms),
+        {"postgresql_partition_by": "RANGE (created_at)"},
     )
 
     # Отношения
@@ -886,6 +1044,33 @@ class AuditLog(Base):
         return f"<AuditLog(id={self.id}, action={self.action}, table={self.table_name}, user_id={self.user_id})>"
 
 
+class AuditHourlyStat(Base):
+    """Почасовой итог журнала аудита (ведется при записи логов)"""
+
+    __tablename__ = "audit_hourly_stats"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    hour = Column(DateTime(timezone=True), nullable=False)  # Начало часа
+    action = Column(String(50), nullable=False)
+    user_id = Column(Integer, nullable=True)  # Без FK: итоги удаленных пользователей сохраняются
+    table_name = Column(String(100), nullable=True)
+    status_class = Column(Integer, nullable=True)  # Класс статуса ответа: 2, 3, 4, 5
+    count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index(
+            "ux_audit_hourly_stats_key",
+            hour,
+            action,
+            user_id,
+            table_name,
+            status_class,
+            unique=True,
+            postgresql_nulls_not_distinct=True,
+        ),
+    )
+
+
 class ApiToken(Base):
     """Модель для API токенов"""
 
@@ -974,6 +1159,22 @@ class ApiToken(Base):
         return ip_address in self.ip_whitelist
 
 
+class ApiTokenRateLimit(Base):
+    """Состояние лимита запросов API токена и счетчик отклоненных запросов"""
+
+    __tablename__ = "api_token_rate_limits"
+
+    token_id = Column(
+        Integer, ForeignKey("api_tokens.id", ondelete="CASCADE"), primary_key=True
+    )
+    # Корзина токенов общего хранилища лимитов (postgres)
+    tokens = Column(Float, nullable=True)
+    updated_at = Column(DateTime(timezone=True), nullable=True)
+    # Запросы, отклоненные по лимиту
+    rejected_count = Column(Integer, nullable=False, default=0)
+    last_rejected_at = Column(DateTime(timezone=True), nullable=True)
+
+
 # Telegram Notifications Models
 class TelegramBot(Base):
     __tablename__ = "telegram_bots"
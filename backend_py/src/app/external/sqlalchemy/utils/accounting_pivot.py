@@ -0,0 +1,214 @@
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import Select, case, func, select, tuple_
+from sqlalchemy.orm import Session
+
+from ..models import (
+    Account,
+    Counterparty,
+    Machine,
+    Owner,
+    Report,
+    Transaction,
+    TransactionCategory,
+)
+
+PIVOT_SOURCES = ("transactions", "reports")
+
+# Измерения, доступные для каждого источника
+PIVOT_DIMENSIONS = {
+    "transactions": (
+        "period",
+        "category",
+        "counterparty",
+        "machine",
+        "account",
+        "owner",
+    ),
+    "reports": ("period", "machine"),
+}
+
+PIVOT_SUBTOTALS = ("cube", "rollup", "none")
+
+PIVOT_FILTERS = (
+    "category_ids",
+    "counterparty_ids",
+    "machine_ids",
+    "account_ids",
+    "owner_ids",
+)
+
+
+
+class PivotSpec(NamedTuple):
+    """Параметры сводной таблицы.
+
+    filters - списки id по ключам PIVOT_FILTERS (пустые списки не фильтруют);
+    grouping_sets - явные наборы группировки вместо subtotals."""
+
+    dimensions: Sequence[str]
+    source: str = "transactions"
+    period: str = "monthly"
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
+    filters: Optional[Dict[str, List[int]]] = None
+    subtotals: str = "cube"
+    grouping_sets: Optional[Sequence[Sequence[str]]] = None
+
+
+_TRANSACTION_JOINS = {
+    "category": (
+        (TransactionCategory, Transaction.category_id == TransactionCategory.id),
+    ),
+    "counterparty": ((Counterparty, Transaction.counterparty_id == Counterparty.id),),
+    "machine": ((Machine, Transaction.machine_id == Machine.id),),
+    "account": ((Account, Transaction.account_id == Account.id),),
+    "owner": (
+        (Account, Transaction.account_id == Account.id),
+        (Owner, Account.owner_id == Owner.id),
+    ),
+}
+
+_TRANSACTION_FILTER_COLUMNS = {
+    "category_ids": Transaction.category_id,
+    "counterparty_ids": Transaction.counterparty_id,
+    "machine_ids": Transaction.machine_id,
+    "account_ids": Transaction.account_id,
+    "owner_ids": Account.owner_id,
+}
+
+
+def _date_format(period: str) -> str:
+    """Формат to_char для метки периода"""
+    return {
+        "daily": "YYYY-MM-DD",
+        "weekly": "IYYY-IW",  # год-неделя (ISO)
+        "monthly": "YYYY-MM",
+        "quarterly": "YYYY-Q",  # год-квартал
+        "yearly": "YYYY",
+    }.get(period, "YYYY-MM")
+
+
+def _transactions_base(spec: PivotSpec, filters: Dict[str, List[int]]) -> Select:
+    """Подтвержденные транзакции без переводов с колонками измерений"""
+    dimensions = spec.dimensions
+    labels = {
+        "period": func.to_char(Transaction.date, _date_format(spec.period)),
+        "category": TransactionCategory.name,
+        "counterparty": Counterparty.name,
+        "machine": Machine.name,
+        "account": Account.name,
+        "owner": Owner.name,
+    }
+    query = select(
+        *[labels[dim].label(dim) for dim in dimensions],
+        Transaction.amount.label("amount"),
+    ).select_from(Transaction)
+
+    # Транзакции без значения измерения в срез не попадают (внутреннее соединение)
+    joined = set()
+    needed = [*dimensions, "account"] if "owner_ids" in filters else dimensions
+    for dim in needed:
+        for target, onclause in _TRANSACTION_JOINS.get(dim, ()):
+            if target not in joined:
+                query = query.join(target, onclause)
+                joined.add(target)
+
+    query = query.where(
+        Transaction.is_confirmed.is_(True),
+        Transaction.transaction_type_id != 3,  # Исключаем переводы
+    )
+    if spec.start_date:
+        query = query.where(Transaction.date >= spec.start_date)
+    if spec.end_date:
+        query = query.where(Transaction.date <= spec.end_date)
+    for name, ids in filters.items():
+        query = query.where(_TRANSACTION_FILTER_COLUMNS[name].in_(ids))
+    return query
+
+
+def _reports_base(spec: PivotSpec, filters: Dict[str, List[int]]) -> Select:
+    """Выручка автоматов из дневных отчетов с колонками измерений"""
+    labels = {
+        "period": func.to_char(Report.report_date, _date_format(spec.period)),
+        "machine": Machine.name,
+    }
+    query = (
+        select(
+            *[labels[dim].label(dim) for dim in spec.dimensions],
+            Report.revenue.label("amount"),
+        )
+        .select_from(Report)
+        .join(Machine, Report.machine_id == Machine.id)
+    )
+    if spec.start_date:
+        query = query.where(Report.report_date >= spec.start_date)
+    if spec.end_date:
+        query = query.where(Report.report_date <= spec.end_date)
+    if "machine_ids" in filters:
+        query = query.where(Report.machine_id.in_(filters["machine_ids"]))
+    return query
+
+
+def accounting_pivot_query(spec: PivotSpec) -> Select:
+    """Сводная таблица одним запросом: ячейки и все промежуточные итоги.
+
+    Внутренний запрос группирует строки источника по всем измерениям (ячейки),
+    внешний агрегирует ячейки через GROUPING SETS / CUBE / ROLLUP. Доход и расход
+    считаются по знаку суммы ячейки. Колонка grouping - битовая маска
+    свернутых измерений (старший бит - первое измерение), 0 - ячейка.
+    При явных grouping_sets в ответ попадают только измерения из наборов."""
+    dimensions, subtotals, grouping_sets = spec.dimensions, spec.subtotals, spec.grouping_sets
+    filters = {name: ids for name, ids in (spec.filters or {}).items() if ids}
+    base = (_transactions_base if spec.source == "transactions" else _reports_base)(
+        spec, filters
+    )
+    base = base.subquery("rows")
+    dims = [base.c[dim] for dim in dimensions]
+    cells = (
+        select(
+            *dims,
+            func.sum(base.c.amount).label("amount"),
+            func.count().label("count"),
+        )
+        .group_by(*dims)
+        .subquery("cells")
+    )
+    cols = [cells.c[dim] for dim in dimensions]
+
+    if grouping_sets is not None:
+        # Измерения вне наборов группировки только дробят ячейки
+        cols = [
+            cells.c[dim]
+            for dim in dimensions
+            if any(dim in grouping_set for grouping_set in grouping_sets)
+        ]
+        group_by = func.grouping_sets(
+            *[
+                tuple_(*[cells.c[dim] for dim in grouping_set])
+                for grouping_set in grouping_sets
+            ]
+        )
+    elif subtotals == "cube":
+        group_by = func.cube(*cols)
+    elif subtotals == "rollup":
+        group_by = func.rollup(*cols)
+    else:
+        group_by = None
+
+    query = select(
+        *cols,
+        func.grouping(*cols).label("grouping"),
+        func.sum(cells.c.amount).label("amount"),
+        func.sum(case((cells.c.amount > 0, cells.c.amount), else_=0)).label("income"),
+        func.sum(case((cells.c.amount < 0, cells.c.amount), else_=0)).label("expense"),
+        func.sum(cells.c.count).label("count"),
+    )
+    query = query.group_by(group_by) if group_by is not None else query.group_by(*cols)
+    return query.order_by(func.grouping(*cols), *cols)
+
+
+def get_accounting_pivot(db: Session, spec: PivotSpec) -> List[Tuple]:
+    """Строки сводной таблицы: (*измерения, grouping, amount, income, expense, count)"""
+    return db.execute(accounting_pivot_query(spec)).all()
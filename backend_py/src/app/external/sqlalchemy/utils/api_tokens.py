@@ -3,9 +3,10 @@ import secrets
 from datetime import datetime
 from typing import List, Optional, Dict, Any, Tuple
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import and_, or_, func
+from sqlalchemy import DateTime, Integer, and_, column, func, or_, select, update, values
+from sqlalchemy.dialects.postgresql import insert
 
-from app.external.sqlalchemy.models import ApiToken, User
+from app.external.sqlalchemy.models import ApiToken, ApiTokenRateLimit, User
 from app.api.api_tokens.models import (
     ApiTokenCreateRequest, 
     ApiTokenUpdateRequest,
@@ -207,19 +208,103 @@ def delete_api_token(
     return True
 
 
-def update_token_usage(db: Session, token_hash: str, ip_address: str) -> bool:
-    """Обновить статистику использования токена"""
-    
-    db_token = db.query(ApiToken).filter(ApiToken.token_hash == token_hash).first()
-    if not db_token:
-        return False
-    
-    db_token.last_used_at = datetime.utcnow()
-    db_token.usage_count += 1
-    
+def add_tokens_usage(db: Session, usage: Dict[int, Tuple[int, datetime]]) -> int:
+    """Прибавить накопленную статистику использования токенов одним UPDATE.
+
+    usage: id токена -> (число использований, время последнего использования)"""
+    if not usage:
+        return 0
+    # Порядок по id: параллельные сбросы блокируют строки в одном порядке
+    batch = values(
+        column("id", Integer),
+        column("count", Integer),
+        column("last_used_at", DateTime(timezone=True)),
+        name="usage",
+    ).data([(token_id, *usage[token_id]) for token_id in sorted(usage)])
+    result = db.execute(
+        update(ApiToken)
+        .where(ApiToken.id == batch.c.id)
+        .values(
+            usage_count=ApiToken.usage_count + batch.c.count,
+            last_used_at=func.greatest(ApiToken.last_used_at, batch.c.last_used_at),
+        )
+        .execution_options(synchronize_session=False)
+    )
     db.commit()
-    
-    return True
+    return result.rowcount
+
+
+def add_tokens_rejections(db: Session, rejections: Dict[int, Tuple[int, datetime]]) -> int:
+    """Прибавить накопленные отклонения по лимиту запросов одним INSERT ... ON CONFLICT.
+
+    rejections: id токена -> (число отклонений, время последнего отклонения)"""
+    if not rejections:
+        return 0
+    batch = values(
+        column("token_id", Integer),
+        column("count", Integer),
+        column("last_rejected_at", DateTime(timezone=True)),
+        name="rejections",
+    ).data([(token_id, *rejections[token_id]) for token_id in sorted(rejections)])
+    # Токен могли удалить, пока отклонения копились в памяти
+    stmt = insert(ApiTokenRateLimit).from_select(
+        ["token_id", "rejected_count", "last_rejected_at"],
+        select(batch.c.token_id, batch.c.count, batch.c.last_rejected_at).join(
+            ApiToken, ApiToken.id == batch.c.token_id
+        ),
+    )
+    result = db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[ApiTokenRateLimit.token_id],
+            set_={
+                "rejected_count": ApiTokenRateLimit.rejected_count
+                + stmt.excluded.rejected_count,
+                "last_rejected_at": func.greatest(
+                    ApiTokenRateLimit.last_rejected_at, stmt.excluded.last_rejected_at
+                ),
+            },
+        )
+    )
+    db.commit()
+    return result.rowcount
+
+
+def _available_rate_limit_tokens(capacity: int, refill_per_second: float):
+    """Токены корзины на текущий момент: остаток плюс пополнение, не больше capacity"""
+    elapsed = func.extract("epoch", func.now() - ApiTokenRateLimit.updated_at)
+    return func.least(
+        capacity,
+        func.coalesce(ApiTokenRateLimit.tokens + elapsed * refill_per_second, capacity),
+    )
+
+
+def acquire_rate_limit_token(
+    db: Session, token_id: int, capacity: int, refill_per_second: float
+) -> Tuple[bool, float]:
+    """Взять токен из корзины лимита в БД атомарно (общий лимит для всех воркеров).
+
+    Возвращает (разрешено, остаток токенов). Строка корзины блокируется
+    только на время одного INSERT ... ON CONFLICT"""
+    available = _available_rate_limit_tokens(capacity, refill_per_second)
+    stmt = insert(ApiTokenRateLimit).values(
+        token_id=token_id, tokens=capacity - 1, updated_at=func.now()
+    )
+    taken = db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[ApiTokenRateLimit.token_id],
+            set_={"tokens": available - 1, "updated_at": func.now()},
+            where=available >= 1,
+        ).returning(ApiTokenRateLimit.tokens)
+    ).scalar()
+    if taken is None:
+        # Корзина пуста: состояние не меняется, читаем текущий остаток
+        remaining = db.execute(
+            select(available).where(ApiTokenRateLimit.token_id == token_id)
+        ).scalar()
+    db.commit()
+    if taken is None:
+        return False, float(remaining or 0)
+    return True, float(taken)
 
 
 def get_api_tokens_stats(db: Session, created_by: Optional[int] = None) -> ApiTokenStats:
@@ -278,6 +363,34 @@ def get_api_tokens_stats(db: Session, created_by: Optional[int] = None) -> ApiTo
         for token in recent_usage_query.all()
     ]
     
+    # Отклонения по лимиту запросов
+    rate_limited_query = db.query(
+        ApiToken.id,
+        ApiToken.name,
+        ApiToken.rate_limit,
+        ApiTokenRateLimit.rejected_count,
+        ApiTokenRateLimit.last_rejected_at,
+    ).join(ApiTokenRateLimit, ApiTokenRateLimit.token_id == ApiToken.id).filter(
+        ApiTokenRateLimit.rejected_count > 0
+    )
+    if created_by is not None:
+        rate_limited_query = rate_limited_query.filter(ApiToken.created_by == created_by)
+
+    rate_limited_requests = rate_limited_query.with_entities(
+        func.coalesce(func.sum(ApiTokenRateLimit.rejected_count), 0)
+    ).scalar()
+    most_rate_limited_tokens = [
+        {
+            'id': token_id,
+            'name': name,
+            'rate_limit': rate_limit,
+            'rejected_count': rejected_count,
+            'last_rejected_at': last_rejected_at
+        }
+        for token_id, name, rate_limit, rejected_count, last_rejected_at in
+        rate_limited_query.order_by(ApiTokenRateLimit.rejected_count.desc()).limit(10).all()
+    ]
+
     return ApiTokenStats(
         total_tokens=total_tokens,
         active_tokens=active_tokens,
@@ -286,14 +399,17 @@ def get_api_tokens_stats(db: Session, created_by: Optional[int] = None) -> ApiTo
         total_usage=total_usage,
         tokens_by_user=tokens_by_user,
         most_used_tokens=most_used_tokens,
-        recent_usage=recent_usage
+        recent_usage=recent_usage,
+        rate_limited_requests=rate_limited_requests,
+        most_rate_limited_tokens=most_rate_limited_tokens
     )
 
 
 def validate_api_token(db: Session, token: str, ip_address: str) -> Optional[ApiToken]:
     """
     Проверить валидность API токена
-    Возвращает объект токена если валиден, иначе None
+    Возвращает объект токена если валиден, иначе None.
+    Статистику использования учитывает вызывающий (api_token_usage)
     """
     
     token_hash = hash_token(token)
@@ -302,18 +418,9 @@ def validate_api_token(db: Session, token: str, ip_address: str) -> Optional[Api
     if not db_token:
         return None
     
-    # Проверяем валидность
-    if not db_token.is_valid():
-        return None
-    
-    # Проверяем IP whitelist
-    if not db_token.is_ip_allowed(ip_address):
-        return None
-    
-    # Обновляем статистику использования (в фоновом режиме)
-    try:
-        update_token_usage(db, token_hash, ip_address)
-    except Exception:
-        pass  # Не ломаем основной процесс из-за ошибки в статистике
-    
-    return db_token
+    return db_token if is_api_token_allowed(db_token, ip_address) else None
+
+
+def is_api_token_allowed(db_token: ApiToken, ip_address: str) -> bool:
+    """Токен активен, не истек и допускает IP адрес"""
+    return db_token.is_valid() and db_token.is_ip_allowed(ip_address)
@@ -1,8 +1,15 @@
-from datetime import datetime, timedelta
-from typing import List, Optional, Dict, Any
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Dict, Any, Tuple
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func, desc, asc, and_, or_
-from app.external.sqlalchemy.models import AuditLog, User
+from sqlalchemy import DateTime, Integer, String, cast, column, delete, func, desc, asc, and_, or_, select, text, values
+from sqlalchemy.dialects.postgresql import insert
+from app.external.sqlalchemy.models import AuditHourlyStat, AuditLog, User
+from .audit_partitions import drop_audit_partitions, is_audit_logs_partitioned
+from .pagination import Page, PageRequest, paginate
+
+
+# Поля поиска по подстроке (фильтр search)
+SEARCH_COLUMNS = ("ip_address", "user_agent", "endpoint", "error_message")
 
 
 def create_audit_log(
@@ -43,25 +50,143 @@ def create_audit_log(
     )
     
     db.add(audit_log)
+    _add_hourly_stats(db, _entries_hourly_stats([
+        {
+            "created_at": audit_log.created_at,
+            "action": action,
+            "user_id": user_id,
+            "table_name": table_name,
+            "status_code": status_code,
+        }
+    ]))
     db.commit()
     db.refresh(audit_log)
     return audit_log
 
 
-def get_audit_logs(
+def add_audit_logs(db: Session, entries: List[Dict[str, Any]]) -> int:
+    """Записать пачку записей аудита одним executemany и одним commit
+    (вместе с почасовыми итогами)"""
+    if not entries:
+        return 0
+    db.execute(insert(AuditLog), entries)
+    _add_hourly_stats(db, _entries_hourly_stats(entries))
+    db.commit()
+    return len(entries)
+
+
+_HOURLY_STATS_COLUMNS = ["hour", "action", "user_id", "table_name", "status_class", "count"]
+
+
+def _hourly_stats_select(source, *where):
+    """Итоги по часам из источника с колонками audit_logs"""
+    hour = func.date_trunc("hour", source.c.created_at)
+    status_class = source.c.status_code // 100
+    keys = (hour, source.c.action, source.c.user_id, source.c.table_name, status_class)
+    # Порядок ключей: параллельные записи блокируют строки итогов в одном порядке
+    return (
+        select(*keys, func.count())
+        .where(*where)
+        .group_by(*keys)
+        .order_by(*keys)
+    )
+
+
+def _entries_hourly_stats(entries: List[Dict[str, Any]]):
+    """Итоги по часам для пачки записей (без чтения audit_logs)"""
+    batch = values(
+        column("created_at", DateTime(timezone=True)),
+        column("action", String),
+        column("user_id", Integer),
+        column("table_name", String),
+        column("status_code", Integer),
+        name="batch",
+    ).data(
+        [
+            (
+                entry["created_at"],
+                entry["action"],
+                entry.get("user_id"),
+                entry.get("table_name"),
+                entry.get("status_code"),
+            )
+            for entry in entries
+        ]
+    )
+    # Колонка VALUES из одних NULL получает тип text - типы задаются явно
+    typed = select(
+        batch.c.created_at,
+        batch.c.action,
+        cast(batch.c.user_id, Integer).label("user_id"),
+        batch.c.table_name,
+        cast(batch.c.status_code, Integer).label("status_code"),
+    ).subquery("batch")
+    return _hourly_stats_select(typed)
+
+
+def _add_hourly_stats(db: Session, query) -> None:
+    """Прибавить итоги запроса к почасовым итогам"""
+    stmt = insert(AuditHourlyStat).from_select(_HOURLY_STATS_COLUMNS, query)
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[
+                AuditHourlyStat.hour,
+                AuditHourlyStat.action,
+                AuditHourlyStat.user_id,
+                AuditHourlyStat.table_name,
+                AuditHourlyStat.status_class,
+            ],
+            set_={"count": AuditHourlyStat.count + stmt.excluded.count},
+        )
+    )
+
+
+def rebuild_audit_hourly_stats(
+    db: Session, date_from: Optional[datetime] = None, date_to: Optional[datetime] = None
+) -> int:
+    """Пересобрать почасовые итоги по audit_logs за часы [date_from, date_to) (None - без границы)"""
+    stats_where, logs_where = [], []
+    if date_from:
+        hour_from = func.date_trunc("hour", date_from)
+        stats_where.append(AuditHourlyStat.hour >= hour_from)
+        logs_where.append(AuditLog.created_at >= hour_from)
+    if date_to:
+        hour_to = func.date_trunc("hour", date_to)
+        stats_where.append(AuditHourlyStat.hour < hour_to)
+        logs_where.append(AuditLog.created_at < hour_to)
+    db.execute(delete(AuditHourlyStat).where(*stats_where))
+    result = db.execute(
+        insert(AuditHourlyStat).from_select(
+            _HOURLY_STATS_COLUMNS, _hourly_stats_select(AuditLog.__table__, *logs_where)
+        )
+    )
+    db.commit()
+    return result.rowcount
+
+
+def audit_hourly_stats_need_rebuild(db: Session) -> bool:
+    """Есть аудит-логи, но почасовые итоги еще не собраны"""
+    has_stats = db.query(AuditHourlyStat.id).limit(1).first() is not None
+    has_logs = db.query(AuditLog.id).limit(1).first() is not None
+    return has_logs and not has_stats
+
+
+def audit_logs_query(
     db: Session,
-    skip: int = 0,
-    limit: int = 100,
     user_id: Optional[int] = None,
     action: Optional[str] = None,
     table_name: Optional[str] = None,
     date_from: Optional[datetime] = None,
     date_to: Optional[datetime] = None,
     search: Optional[str] = None,
-    order_by: str = "created_at",
-    order_direction: str = "desc",
-) -> List[AuditLog]:
-    """Получить список аудит-логов с фильтрацией"""
+    request_id: Optional[str] = None,
+    status_code: Optional[int] = None,
+    status_code_from: Optional[int] = None,
+    status_code_to: Optional[int] = None,
+    duration_ms_from: Optional[int] = None,
+    duration_ms_to: Optional[int] = None,
+):
+    """Запрос аудит-логов с фильтрами списка (без сортировки)"""
     
     query = db.query(AuditLog)
     
@@ -83,18 +208,78 @@ def get_audit_logs(
         end_of_day = date_to.replace(hour=23, minute=59, second=59, microsecond=999999)
         query = query.filter(AuditLog.created_at <= end_of_day)
     
+    if request_id:
+        query = query.filter(AuditLog.request_id == request_id)
+    
+    if status_code is not None:
+        query = query.filter(AuditLog.status_code == status_code)
+    
+    if status_code_from is not None:
+        query = query.filter(AuditLog.status_code >= status_code_from)
+    
+    if status_code_to is not None:
+        query = query.filter(AuditLog.status_code <= status_code_to)
+    
+    if duration_ms_from is not None:
+        query = query.filter(AuditLog.duration_ms >= duration_ms_from)
+    
+    if duration_ms_to is not None:
+        query = query.filter(AuditLog.duration_ms <= duration_ms_to)
+    
     if search:
-        # Поиск по IP адресу или User-Agent
-        search_pattern = f"%{search}%"
+        # Подстрока в IP, User-Agent, эндпоинте или ошибке; при pg_trgm
+        # каждое условие ILIKE использует свой триграммный индекс
+        search_pattern = f"%{_escape_like(search)}%"
         query = query.filter(
             or_(
-                AuditLog.ip_address.ilike(search_pattern),
-                AuditLog.user_agent.ilike(search_pattern),
-                AuditLog.endpoint.ilike(search_pattern),
-                AuditLog.error_message.ilike(search_pattern),
+                *(
+                    getattr(AuditLog, name).ilike(search_pattern, escape="\\")
+                    for name in SEARCH_COLUMNS
+                )
             )
         )
     
+    return query
+
+
+def _escape_like(value: str) -> str:
+    """Экранировать спецсимволы LIKE: поиск идет по буквальной подстроке"""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def ensure_audit_search_indexes(db: Session) -> bool:
+    """Создать триграммные GIN-индексы для поиска по подстроке.
+
+    Нужно расширение pg_trgm; если его нельзя установить, поиск остается
+    последовательным чтением. Возвращает, доступны ли индексы."""
+    try:
+        db.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        for name in SEARCH_COLUMNS:
+            db.execute(
+                text(
+                    f"CREATE INDEX IF NOT EXISTS ix_audit_logs_{name}_trgm "
+                    f"ON audit_logs USING gin ({name} gin_trgm_ops)"
+                )
+            )
+        db.commit()
+        return True
+    except Exception:
+        db.rollback()
+        return False
+
+
+def get_audit_logs(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    order_by: str = "created_at",
+    order_direction: str = "desc",
+    **filters,
+) -> List[AuditLog]:
+    """Получить список аудит-логов с фильтрацией"""
+    
+    query = audit_logs_query(db, **filters)
+    
     # Сортировка
     if order_direction.lower() == "desc":
         query = query.order_by(desc(getattr(AuditLog, order_by, AuditLog.created_at)))
@@ -104,53 +289,32 @@ def get_audit_logs(
     return query.offset(skip).limit(limit).all()
 
 
+def get_audit_logs_page(
+    db: Session,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    total: Optional[str] = None,
+    order_direction: str = "desc",
+    **filters,
+) -> Page:
+    """Страница аудит-логов по курсору (created_at, id)"""
+    return paginate(
+        db,
+        audit_logs_query(db, **filters),
+        (AuditLog.created_at, AuditLog.id),
+        PageRequest(limit, cursor=cursor, total=total),
+        descending=order_direction.lower() == "desc",
+    )
+
+
 def get_audit_log_by_id(db: Session, audit_log_id: int) -> Optional[AuditLog]:
     """Получить аудит-лог по ID"""
     return db.query(AuditLog).filter(AuditLog.id == audit_log_id).first()
 
 
-def count_audit_logs(
-    db: Session,
-    user_id: Optional[int] = None,
-    action: Optional[str] = None,
-    table_name: Optional[str] = None,
-    date_from: Optional[datetime] = None,
-    date_to: Optional[datetime] = None,
-    search: Optional[str] = None,
-) -> int:
+def count_audit_logs(db: Session, **filters) -> int:
     """Подсчитать количество аудит-логов с фильтрацией"""
-    
-    query = db.query(func.count(AuditLog.id))
-    
-    # Применяем те же фильтры что и в get_audit_logs
-    if user_id:
-        query = query.filter(AuditLog.user_id == user_id)
-    
-    if action:
-        query = query.filter(AuditLog.action == action)
-    
-    if table_name:
-        query = query.filter(AuditLog.table_name == table_name)
-    
-    if date_from:
-        query = query.filter(AuditLog.created_at >= date_from)
-    
-    if date_to:
-        end_of_day = date_to.replace(hour=23, minute=59, second=59, microsecond=999999)
-        query = query.filter(AuditLog.created_at <= end_of_day)
-    
-    if search:
-        search_pattern = f"%{search}%"
-        query = query.filter(
-            or_(
-                AuditLog.ip_address.ilike(search_pattern),
-                AuditLog.user_agent.ilike(search_pattern),
-                AuditLog.endpoint.ilike(search_pattern),
-                AuditLog.error_message.ilike(search_pattern),
-            )
-        )
-    
-    return query.scalar() or 0
+    return audit_logs_query(db, **filters).with_entities(func.count(AuditLog.id)).scalar() or 0
 
 
 def get_audit_statistics(
@@ -158,40 +322,42 @@ def get_audit_statistics(
     date_from: Optional[datetime] = None,
     date_to: Optional[datetime] = None,
 ) -> Dict[str, Any]:
-    """Получить статистику по аудит-логам"""
+    """Получить статистику по аудит-логам (из почасовых итогов)"""
     
     # Базовый запрос
-    base_query = db.query(AuditLog)
+    base_query = db.query(AuditHourlyStat)
     
     if date_from:
-        base_query = base_query.filter(AuditLog.created_at >= date_from)
+        base_query = base_query.filter(AuditHourlyStat.hour >= func.date_trunc("hour", date_from))
     
     if date_to:
         end_of_day = date_to.replace(hour=23, minute=59, second=59, microsecond=999999)
-        base_query = base_query.filter(AuditLog.created_at <= end_of_day)
+        base_query = base_query.filter(AuditHourlyStat.hour <= end_of_day)
+
+    count = func.sum(AuditHourlyStat.count)
     
     # Общее количество
-    total_count = base_query.count()
+    total_count = base_query.with_entities(func.coalesce(count, 0)).scalar()
     
     # Статистика по действиям
     action_stats = (
         base_query.with_entities(
-            AuditLog.action,
-            func.count(AuditLog.id).label('count')
+            AuditHourlyStat.action,
+            count.label('count')
         )
-        .group_by(AuditLog.action)
+        .group_by(AuditHourlyStat.action)
         .order_by(desc('count'))
         .all()
     )
     
     # Статистика по пользователям
     user_stats = (
-        base_query.join(User, AuditLog.user_id == User.id, isouter=True)
+        base_query.join(User, AuditHourlyStat.user_id == User.id, isouter=True)
         .with_entities(
             User.id.label('user_id'),
             User.username,
             User.full_name,
-            func.count(AuditLog.id).label('count')
+            count.label('count')
         )
         .group_by(User.id, User.username, User.full_name)
         .order_by(desc('count'))
@@ -201,12 +367,12 @@ def get_audit_statistics(
     
     # Статистика по таблицам
     table_stats = (
-        base_query.filter(AuditLog.table_name.isnot(None))
+        base_query.filter(AuditHourlyStat.table_name.isnot(None))
         .with_entities(
-            AuditLog.table_name,
-            func.count(AuditLog.id).label('count')
+            AuditHourlyStat.table_name,
+            count.label('count')
         )
-        .group_by(AuditLog.table_name)
+        .group_by(AuditHourlyStat.table_name)
         .order_by(desc('count'))
         .all()
     )
@@ -214,12 +380,11 @@ def get_audit_statistics(
     # Статистика по часам (за последние 24 часа)
     hours_ago_24 = datetime.utcnow() - timedelta(hours=24)
     
-    # Используем PostgreSQL-совместимую функцию для группировки по часам
     hourly_stats = (
-        base_query.filter(AuditLog.created_at >= hours_ago_24)
+        base_query.filter(AuditHourlyStat.hour >= func.date_trunc("hour", hours_ago_24))
         .with_entities(
-            func.to_char(AuditLog.created_at, 'YYYY-MM-DD HH24:00:00').label('hour'),
-            func.count(AuditLog.id).label('count')
+            func.to_char(AuditHourlyStat.hour, 'YYYY-MM-DD HH24:00:00').label('hour'),
+            count.label('count')
         )
         .group_by('hour')
         .order_by('hour')
@@ -227,9 +392,9 @@ def get_audit_statistics(
     )
     
     return {
-        'total_count': total_count,
+        'total_count': int(total_count),
         'action_stats': [
-            {'action': action, 'count': count} 
+            {'action': action, 'count': int(count)}
             for action, count in action_stats
         ],
         'user_stats': [
@@ -239,16 +404,16 @@ def get_audit_statistics(
                     'username': username,
                     'full_name': full_name,
                 } if user_id else None,
-                'count': count
+                'count': int(count)
             }
             for user_id, username, full_name, count in user_stats
         ],
         'table_stats': [
-            {'table_name': table_name, 'count': count}
+            {'table_name': table_name, 'count': int(count)}
             for table_name, count in table_stats
         ],
         'hourly_stats': [
-            {'hour': hour, 'count': count}  # hour уже строка после to_char
+            {'hour': hour, 'count': int(count)}  # hour уже строка после to_char
             for hour, count in hourly_stats
         ]
     }
@@ -277,20 +442,26 @@ def get_available_tables(db: Session) -> List[str]:
     return [table[0] for table in tables if table[0]]
 
 
-def cleanup_old_audit_logs(db: Session, days_to_keep: int = 90) -> int:
-    """Удалить старые аудит-логи (старше указанного количества дней)"""
+def cleanup_old_audit_logs(db: Session, days_to_keep: int = 90) -> Tuple[int, datetime]:
+    """Удалить старые аудит-логи (старше указанного количества дней).
+
+    Секционированная таблица очищается удалением целых секций месяцев -
+    без DELETE по строкам. Возвращает (число удаленных записей, граница хранения)"""
+    if is_audit_logs_partitioned(db):
+        result = drop_audit_partitions(db, days_to_keep)
+        return result["deleted_count"], result["cutoff_date"]
+
     cutoff_date = datetime.utcnow() - timedelta(days=days_to_keep)
-    
     deleted_count = (
         db.query(AuditLog)
         .filter(AuditLog.created_at < cutoff_date)
-        .count()
+        .delete(synchronize_session=False)
     )
-    
-    db.query(AuditLog).filter(AuditLog.created_at < cutoff_date).delete()
     db.commit()
-    
-    return deleted_count
+    # Итоги до границы: удаленные часы сбрасываются, час границы пересчитывается
+    rebuild_audit_hourly_stats(db, date_to=cutoff_date + timedelta(hours=1))
+
+    return deleted_count, cutoff_date.replace(tzinfo=timezone.utc)
 
 
 def log_user_action(
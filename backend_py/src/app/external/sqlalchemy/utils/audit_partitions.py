@@ -0,0 +1,224 @@
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterable, List, Optional
+
+from sqlalchemy import delete, exists, func, insert, select, text
+from sqlalchemy.orm import Session
+
+from ..models import AuditHourlyStat, AuditLog
+from .monitoring_partitions import (
+    PartitionMigrationInProgress,
+    _add_months,
+    _bounds,
+    _data_months,
+    _drop_indexes,
+    _like,
+    _month_start,
+    _move_rows,
+    _table_kind,
+)
+
+PARTITION_PREFIX = "audit_logs_p"
+DEFAULT_PARTITION = "audit_logs_default"
+_LEGACY_TABLE = "audit_logs_legacy"
+# Ключ advisory-блокировки переноса audit_logs в секционированную таблицу
+_MIGRATION_LOCK_KEY = 7303
+
+
+def partition_name(month: date) -> str:
+    return f"{PARTITION_PREFIX}{month:%Y_%m}"
+
+
+def _partition_month(name: str) -> Optional[date]:
+    """Месяц секции по имени audit_logs_pYYYY_MM"""
+    if not name.startswith(PARTITION_PREFIX):
+        return None
+    try:
+        return datetime.strptime(name[len(PARTITION_PREFIX) :], "%Y_%m").date()
+    except ValueError:
+        return None
+
+
+def is_audit_logs_partitioned(db: Session) -> bool:
+    return _table_kind(db, "audit_logs") == "p"
+
+
+def list_audit_partitions(db: Session) -> List[dict]:
+    """Секции audit_logs с оценкой числа строк и размером"""
+    rows = db.execute(
+        text(
+            """
+            SELECT child.relname AS name,
+                   pg_get_expr(child.relpartbound, child.oid) AS bound,
+                   greatest(child.reltuples, 0)::bigint AS rows_estimate,
+                   pg_total_relation_size(child.oid) AS size_bytes
+            FROM pg_inherits
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = to_regclass('audit_logs')
+            ORDER BY child.relname
+            """
+        )
+    ).all()
+    return [
+        {
+            "name": row.name,
+            "month": _partition_month(row.name),
+            "is_default": row.name == DEFAULT_PARTITION,
+            "bound": row.bound,
+            "rows_estimate": row.rows_estimate,
+            "size_bytes": row.size_bytes,
+        }
+        for row in rows
+    ]
+
+
+def _attached_months(db: Session) -> set:
+    return {
+        partition["month"]
+        for partition in list_audit_partitions(db)
+        if partition["month"] is not None
+    }
+
+
+def _create_partition(db: Session, month: date) -> None:
+    """Создать секцию месяца; строки месяца из секции по умолчанию переносятся в нее"""
+    name = partition_name(month)
+    default = _like(DEFAULT_PARTITION, AuditLog.__table__)
+    period = (
+        default.c.created_at >= month,
+        default.c.created_at < _add_months(month, 1),
+    )
+    has_default_rows = db.execute(select(exists().where(*period))).scalar()
+    if not has_default_rows:
+        db.execute(
+            text(
+                f"CREATE TABLE {name} PARTITION OF audit_logs FOR VALUES {_bounds(month)}"
+            )
+        )
+        return
+    # Секция по умолчанию не допускает новой секции со своими строками:
+    # строки переносятся в отдельную таблицу, которая затем присоединяется
+    db.execute(text(f"CREATE TABLE {name} (LIKE audit_logs INCLUDING DEFAULTS)"))
+    _move_rows(db, default, _like(name, AuditLog.__table__), period)
+    db.execute(
+        text(
+            f"ALTER TABLE audit_logs ATTACH PARTITION {name} FOR VALUES {_bounds(month)}"
+        )
+    )
+
+
+def ensure_audit_partitions(
+    db: Session, months: Optional[Iterable[date]] = None, months_ahead: int = 0
+) -> List[str]:
+    """Создать секцию по умолчанию и недостающие секции месяцев.
+
+    Без months - текущий месяц и months_ahead следующих. Возвращает имена
+    созданных секций."""
+    created = []
+    if _table_kind(db, DEFAULT_PARTITION) is None:
+        db.execute(
+            text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF audit_logs DEFAULT")
+        )
+        created.append(DEFAULT_PARTITION)
+    if months is None:
+        current = _month_start(datetime.now(timezone.utc))
+        months = [_add_months(current, offset) for offset in range(months_ahead + 1)]
+    attached = _attached_months(db)
+    for month in sorted({_month_start(month) for month in months} - attached):
+        _create_partition(db, month)
+        created.append(partition_name(month))
+    db.commit()
+    return created
+
+
+def drain_default_partition(db: Session) -> List[str]:
+    """Разнести записи из секции по умолчанию по секциям их месяцев"""
+    months = _data_months(db, _like(DEFAULT_PARTITION, AuditLog.__table__), "created_at")
+    return ensure_audit_partitions(db, months=months)
+
+
+def drop_audit_partitions(db: Session, days_to_keep: int) -> dict:
+    """Отсоединить и удалить секции, целиком старше days_to_keep дней.
+
+    Записи месяца, в который попадает граница, хранятся до удаления всей
+    секции. Число удаленных записей - оценка по статистике секций, без
+    подсчета строк. Возвращает имена удаленных секций, число записей и
+    фактическую границу хранения (начало самой старой оставшейся секции).
+    Почасовые итоги удаленного периода удаляются вместе с секциями."""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=days_to_keep)
+    first_kept = _month_start(cutoff)
+    dropped, deleted = [], 0
+    for partition in list_audit_partitions(db):
+        month = partition["month"]
+        if month is None or month >= first_kept:
+            continue
+        db.execute(text(f"ALTER TABLE audit_logs DETACH PARTITION {partition['name']}"))
+        db.execute(text(f"DROP TABLE {partition['name']}"))
+        db.commit()
+        dropped.append(partition["name"])
+        deleted += partition["rows_estimate"]
+    # В секции по умолчанию только записи вне созданных секций - их немного
+    default = _like(DEFAULT_PARTITION, AuditLog.__table__)
+    deleted += db.execute(
+        delete(default).where(default.c.created_at < first_kept)
+    ).rowcount
+    db.execute(delete(AuditHourlyStat).where(AuditHourlyStat.hour < first_kept))
+    db.commit()
+    return {
+        "dropped": dropped,
+        "deleted_count": deleted,
+        "cutoff_date": datetime.combine(first_kept, datetime.min.time(), timezone.utc),
+    }
+
+
+def maintain_audit_partitions(
+    db: Session, months_ahead: int, retention_days: int = 0
+) -> dict:
+    """Плановое обслуживание: секции наперед, разбор секции по умолчанию,
+    удаление старых секций (retention_days = 0 - хранить все)"""
+    created = ensure_audit_partitions(db, months_ahead=months_ahead)
+    created += drain_default_partition(db)
+    dropped = (
+        drop_audit_partitions(db, retention_days)["dropped"] if retention_days > 0 else []
+    )
+    return {"created": created, "dropped": dropped}
+
+
+def migrate_audit_logs_to_partitions(db: Session) -> Optional[int]:
+    """Перенести обычную таблицу audit_logs в секционированную.
+
+    Выполняется одной транзакцией под advisory-блокировкой (второй процесс
+    получает PartitionMigrationInProgress): старая таблица переименовывается,
+    создается секционированная с секциями по месяцам данных и переносятся
+    записи. Возвращает число перенесенных строк или None, если таблица уже
+    секционирована."""
+    if not db.execute(select(func.pg_try_advisory_xact_lock(_MIGRATION_LOCK_KEY))).scalar():
+        raise PartitionMigrationInProgress("audit_logs")
+    if _table_kind(db, "audit_logs") != "r":
+        db.rollback()
+        return None
+    db.execute(text(f"ALTER TABLE audit_logs RENAME TO {_LEGACY_TABLE}"))
+    # Имена индексов и ограничений общие для схемы - освобождаем их
+    db.execute(text(f"ALTER TABLE {_LEGACY_TABLE} DROP CONSTRAINT IF EXISTS audit_logs_pkey"))
+    _drop_indexes(db, _LEGACY_TABLE)
+    # Последовательность id остается общей и не удаляется со старой таблицей
+    db.execute(text(f"ALTER TABLE {_LEGACY_TABLE} ALTER COLUMN id DROP DEFAULT"))
+    db.execute(text("ALTER SEQUENCE audit_logs_id_seq OWNED BY NONE"))
+    AuditLog.__table__.create(bind=db.connection(), checkfirst=True)
+    db.execute(
+        text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF audit_logs DEFAULT")
+    )
+    legacy = _like(_LEGACY_TABLE, AuditLog.__table__)
+    for month in sorted(_data_months(db, legacy, "created_at")):
+        db.execute(
+            text(
+                f"CREATE TABLE {partition_name(month)} PARTITION OF audit_logs "
+                f"FOR VALUES {_bounds(month)}"
+            )
+        )
+    rows = db.execute(
+        insert(AuditLog.__table__).from_select(list(legacy.c.keys()), select(*legacy.c))
+    ).rowcount
+    db.execute(text(f"DROP TABLE {_LEGACY_TABLE}"))
+    db.execute(text("ALTER SEQUENCE audit_logs_id_seq OWNED BY audit_logs.id"))
+    db.commit()
+    return rows
@@ -1,6 +1,7 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 from sqlalchemy.exc import IntegrityError
-from ..models import CashlessPayment
+from sqlalchemy.dialects.postgresql import insert
+from ..models import CashlessPayment, Machine
 from typing import List, Optional
 from datetime import datetime, date
 from decimal import Decimal
@@ -51,21 +52,81 @@ def create_or_update_cashless_payment(db: Session, machine_id: int, payment_date
         else:
             raise
 
+def _accumulate_cashless(rows: List[dict]):
+    """INSERT ... ON CONFLICT (machine_id, date) DO UPDATE: прибавить суммы и
+    количества к дневным записям атомарно, без чтения перед записью"""
+    stmt = insert(CashlessPayment).values(rows)
+    return stmt.on_conflict_do_update(
+        constraint="unique_machine_date",
+        set_={
+            "amount": CashlessPayment.amount + stmt.excluded.amount,
+            "transactions_count": CashlessPayment.transactions_count
+            + stmt.excluded.transactions_count,
+        },
+    )
+
 def add_cashless_transaction(db: Session, machine_id: int, amount: Decimal) -> CashlessPayment:
-    """Добавить новую безналичную транзакцию к существующей записи или создать новую"""
+    """Добавить новую безналичную транзакцию к записи автомата за сегодня одним запросом"""
+    stmt = _accumulate_cashless(
+        [
+            {
+                "machine_id": machine_id,
+                "date": date.today(),
+                "amount": amount,
+                "transactions_count": 1,
+            }
+        ]
+    )
+    payment_id = db.execute(stmt.returning(CashlessPayment.id)).scalar_one()
+    db.commit()
+    # Запись из сессии вместе с автоматом: ответ включает machine, как прежде
+    return (
+        db.query(CashlessPayment)
+        .options(joinedload(CashlessPayment.machine))
+        .filter(CashlessPayment.id == payment_id)
+        .one()
+    )
+
+def add_cashless_transactions(db: Session, transactions: List[dict]) -> List[Optional[str]]:
+    """Добавить пачку безналичных транзакций: суммы по (автомат, день) накапливаются
+    одним INSERT ... ON CONFLICT DO UPDATE. Возвращает по транзакции текст ошибки или None"""
+    machine_ids = {t["machine_id"] for t in transactions}
+    known_machines = {
+        machine_id
+        for (machine_id,) in db.query(Machine.id).filter(Machine.id.in_(machine_ids))
+    }
     today = date.today()
-    existing = get_cashless_payment(db, machine_id, today)
-    
-    if existing:
-        # Обновляем существующую запись
-        existing.amount += amount
-        existing.transactions_count += 1
-        db.commit()
-        db.refresh(existing)
-        return existing
-    else:
-        # Создаем новую запись
-        return create_cashless_payment(db, machine_id, today, amount, 1)
+    totals = {}
+    errors: List[Optional[str]] = []
+    for transaction in transactions:
+        if transaction["machine_id"] not in known_machines:
+            errors.append("Machine not found")
+            continue
+        payment_date = transaction.get("date")
+        key = (transaction["machine_id"], payment_date.date() if payment_date else today)
+        amount, count = totals.get(key, (Decimal(0), 0))
+        totals[key] = (amount + Decimal(transaction["amount"]), count + 1)
+        errors.append(None)
+
+    if totals:
+        # Строки в порядке ключа: параллельные пачки блокируют записи в одном порядке
+        db.execute(
+            _accumulate_cashless(
+                [
+                    {
+                        "machine_id": machine_id,
+                        "date": payment_date,
+                        "amount": amount,
+                        "transactions_count": count,
+                    }
+                    for (machine_id, payment_date), (amount, count) in sorted(
+                        totals.items()
+                    )
+                ]
+            )
+        )
+    db.commit()
+    return errors
 
 def get_cashless_summary(db: Session, machine_id: int, start_date: date, end_date: date) -> dict:
     """Получить сводку безналичных платежей за период"""
@@ -0,0 +1,107 @@
+from typing import List
+
+from sqlalchemy import func, select, true
+from sqlalchemy.orm import Session
+
+from ..models import CashlessPayment, Machine, MachineStock, MonitoringDaily
+from .monitoring import _day_start
+
+
+def get_fleet_status_rows(db: Session) -> List[dict]:
+    """Состояние всех автоматов одним запросом.
+
+    Последнее показание берется из последнего дневного среза автомата,
+    показатели дня - из срезов за сегодня и предыдущий день с данными, как
+    в отчетах. Срезы читаются LATERAL по каждому автомату с LIMIT 1 по
+    уникальному индексу (machine_id, day), без чтения всей истории."""
+    today = _day_start(func.now())
+
+    latest = (
+        select(
+            MonitoringDaily.machine_id,
+            MonitoringDaily.last_monitoring_id,
+            MonitoringDaily.last_coins,
+            MonitoringDaily.last_toys,
+            MonitoringDaily.last_date,
+        )
+        .where(MonitoringDaily.machine_id == Machine.id)
+        .order_by(MonitoringDaily.day.desc())
+        .limit(1)
+        .lateral("latest")
+    )
+    today_max = (
+        select(
+            MonitoringDaily.machine_id,
+            MonitoringDaily.max_coins,
+            MonitoringDaily.max_toys,
+            MonitoringDaily.readings_count,
+        )
+        .where(MonitoringDaily.day == today)
+        .subquery("today_max")
+    )
+    prev_max = (
+        select(
+            MonitoringDaily.machine_id,
+            MonitoringDaily.max_coins,
+            MonitoringDaily.max_toys,
+        )
+        # Предыдущий день нужен только автоматам с показаниями за сегодня
+        .where(
+            MonitoringDaily.machine_id == today_max.c.machine_id,
+            MonitoringDaily.day < today,
+        )
+        .order_by(MonitoringDaily.day.desc())
+        .limit(1)
+        .lateral("prev_max")
+    )
+    stocks = (
+        select(
+            MachineStock.machine_id,
+            func.sum(MachineStock.quantity).label("total_quantity"),
+            func.sum(MachineStock.capacity).label("total_capacity"),
+            func.count().label("total_items"),
+            func.count().filter(MachineStock.quantity <= MachineStock.min_quantity)
+            .label("low_stock_items"),
+        )
+        .group_by(MachineStock.machine_id)
+        .subquery("stocks")
+    )
+    cashless = (
+        select(
+            CashlessPayment.machine_id,
+            CashlessPayment.amount,
+            CashlessPayment.transactions_count,
+        )
+        .where(CashlessPayment.date == today)
+        .subquery("cashless")
+    )
+
+    rows = db.execute(
+        select(
+            Machine.id.label("machine_id"),
+            Machine.name,
+            latest.c.last_monitoring_id.label("monitoring_id"),
+            latest.c.last_coins.label("coins"),
+            latest.c.last_toys.label("toys"),
+            latest.c.last_date.label("date"),
+            today_max.c.max_coins.label("today_coins"),
+            today_max.c.max_toys.label("today_toys"),
+            today_max.c.readings_count.label("today_readings"),
+            prev_max.c.max_coins.label("prev_coins"),
+            prev_max.c.max_toys.label("prev_toys"),
+            stocks.c.total_quantity,
+            stocks.c.total_capacity,
+            stocks.c.total_items,
+            stocks.c.low_stock_items,
+            cashless.c.amount.label("cashless_amount"),
+            cashless.c.transactions_count.label("cashless_count"),
+        )
+        .select_from(Machine)
+        .outerjoin(latest, true())
+        .outerjoin(today_max, today_max.c.machine_id == Machine.id)
+        .outerjoin(prev_max, true())
+        .outerjoin(stocks, stocks.c.machine_id == Machine.id)
+        .outerjoin(cashless, cashless.c.machine_id == Machine.id)
+        .order_by(Machine.id)
+    ).all()
+    return [dict(row._mapping) for row in rows]
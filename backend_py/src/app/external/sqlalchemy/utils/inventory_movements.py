@@ -19,6 +19,8 @@ from ..models import (
 from .accounts import update_account_balance as _update_account_balance
 from .reference_tables import inventory_count_status_crud
 from .machine_stocks import get_machine_stock_by_item
+from .pagination import Page, PageRequest, paginate
+from .toy_cost_ledger import record_machine_load
 from .warehouse_stocks import get_warehouse_stock_by_item
 
 
@@ -31,10 +33,8 @@ def get_inventory_movement(
     )
 
 
-def get_inventory_movements(
+def inventory_movements_query(
     db: Session,
-    skip: int = 0,
-    limit: int = 100,
     movement_type: Optional[str] = None,
     status_id: Optional[int] = None,
     counterparty_id: Optional[int] = None,
@@ -47,8 +47,8 @@ def get_inventory_movements(
     to_warehouse_id: Optional[int] = None,
     from_machine_id: Optional[int] = None,
     to_machine_id: Optional[int] = None,
-) -> List[InventoryMovement]:
-    """Получить список движений товаров с фильтрацией"""
+):
+    """Запрос движений товаров с фильтрами списка, новые сверху"""
     query = db.query(InventoryMovement)
 
     # Фильтр по типу движения
@@ -93,75 +93,40 @@ def get_inventory_movements(
         )
         query = query.filter(search_filter)
 
-    return (
-        query.order_by(InventoryMovement.document_date.desc())
-        .offset(skip)
-        .limit(limit)
-        .all()
-    )
+    return query.order_by(InventoryMovement.document_date.desc())
 
 
-def get_inventory_movements_count(
+def get_inventory_movements(
     db: Session,
-    movement_type: Optional[str] = None,
-    status_id: Optional[int] = None,
-    counterparty_id: Optional[int] = None,
-    created_by: Optional[int] = None,
-    date_from: Optional[datetime] = None,
-    date_to: Optional[datetime] = None,
-    search: Optional[str] = None,
-    # Новые параметры для фильтрации по местам
-    from_warehouse_id: Optional[int] = None,
-    to_warehouse_id: Optional[int] = None,
-    from_machine_id: Optional[int] = None,
-    to_machine_id: Optional[int] = None,
-) -> int:
-    """Получить общее количество движений товаров с фильтрацией"""
-    query = db.query(InventoryMovement)
-
-    # Фильтр по типу движения
-    if movement_type is not None:
-        query = query.filter(InventoryMovement.movement_type == movement_type)
-
-    # Фильтр по статусу
-    if status_id is not None:
-        query = query.filter(InventoryMovement.status_id == status_id)
-
-    # Фильтры по местам отправления и назначения
-    if from_warehouse_id is not None:
-        query = query.filter(InventoryMovement.from_warehouse_id == from_warehouse_id)
-    
-    if to_warehouse_id is not None:
-        query = query.filter(InventoryMovement.to_warehouse_id == to_warehouse_id)
-    
-    if from_machine_id is not None:
-        query = query.filter(InventoryMovement.from_machine_id == from_machine_id)
-    
-    if to_machine_id is not None:
-        query = query.filter(InventoryMovement.to_machine_id == to_machine_id)
-
-    # Фильтр по контрагенту
-    if counterparty_id is not None:
-        query = query.filter(InventoryMovement.counterparty_id == counterparty_id)
+    skip: int = 0,
+    limit: int = 100,
+    **filters,
+) -> List[InventoryMovement]:
+    """Получить список движений товаров с фильтрацией"""
+    query = inventory_movements_query(db, **filters)
+    return query.offset(skip).limit(limit).all()
 
-    # Фильтр по создателю
-    if created_by is not None:
-        query = query.filter(InventoryMovement.created_by == created_by)
 
-    # Фильтр по дате
-    if date_from is not None:
-        query = query.filter(InventoryMovement.document_date >= date_from)
-    if date_to is not None:
-        query = query.filter(InventoryMovement.document_date <= date_to)
+def get_inventory_movements_page(
+    db: Session,
+    limit: int = 100,
+    skip: int = 0,
+    cursor: Optional[str] = None,
+    total: Optional[str] = None,
+    **filters,
+) -> Page:
+    """Страница движений товаров: offset или курсор по (document_date, id)"""
+    return paginate(
+        db,
+        inventory_movements_query(db, **filters),
+        (InventoryMovement.document_date, InventoryMovement.id),
+        PageRequest(limit, skip=skip, cursor=cursor, total=total),
+    )
 
-    # Поиск по номеру документа, описанию
-    if search:
-        search_filter = or_(
-            InventoryMovement.description.ilike(f"%{search}%"),
-        )
-        query = query.filter(search_filter)
 
-    return query.count()
+def get_inventory_movements_count(db: Session, **filters) -> int:
+    """Получить общее количество движений товаров с фильтрацией"""
+    return inventory_movements_query(db, **filters).order_by(None).count()
 
 
 def create_inventory_movement(
@@ -369,6 +334,9 @@ def execute_inventory_movement(
     # Выполняем операции по остаткам в зависимости от типа движения
     _execute_movement_operations(db, movement)
 
+    # Загрузка автомата попадает в накопительный итог для себестоимости игрушек
+    record_machine_load(db, movement)
+
     # Обновляем статус на "executed", если доступен
     try:
         executed_status = inventory_count_status_crud.get_by_name(db, "executed")
@@ -1,7 +1,8 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Query, Session
 from sqlalchemy import or_, and_, func
 import sqlalchemy as sa
 from ..models import MachineStock, Item, Machine, WarehouseStock
+from .pagination import Page, PageRequest, paginate
 from typing import List, Optional
 from datetime import datetime
 from decimal import Decimal
@@ -23,17 +24,15 @@ def get_machine_stock_by_item(
     )
 
 
-def get_machine_stocks(
+def machine_stocks_query(
     db: Session,
-    skip: int = 0,
-    limit: int = 100,
     machine_id: Optional[int] = None,
     item_id: Optional[int] = None,
     category_id: Optional[int] = None,
     low_stock: Optional[bool] = None,
     search: Optional[str] = None,
-) -> List[MachineStock]:
-    """Получить список остатков в автоматах с фильтрацией"""
+) -> Query:
+    """Запрос остатков в автоматах с фильтрами списка"""
     query = db.query(MachineStock)
 
     # Фильтр по автомату
@@ -73,7 +72,35 @@ def get_machine_stocks(
                 )
             )
 
-    return query.offset(skip).limit(limit).all()
+    return query
+
+
+def get_machine_stocks(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    **filters,
+) -> List[MachineStock]:
+    """Получить список остатков в автоматах с фильтрацией"""
+    return machine_stocks_query(db, **filters).offset(skip).limit(limit).all()
+
+
+def get_machine_stocks_page(
+    db: Session,
+    limit: int = 100,
+    skip: int = 0,
+    cursor: Optional[str] = None,
+    total: Optional[str] = None,
+    **filters,
+) -> Page:
+    """Страница остатков в автоматах: offset или курсор по id"""
+    return paginate(
+        db,
+        machine_stocks_query(db, **filters),
+        (MachineStock.id,),
+        PageRequest(limit, skip=skip, cursor=cursor, total=total),
+        descending=False,
+    )
 
 
 def get_machine_stocks_count(
@@ -1,11 +1,31 @@
-from datetime import datetime, timezone
-from decimal import Decimal
-from typing import List, Optional
+from datetime import datetime, timedelta, timezone
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Iterable, List, Optional, Tuple
 
-from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import (
+    DateTime,
+    Integer,
+    and_,
+    case,
+    column,
+    delete,
+    func,
+    literal_column,
+    or_,
+    select,
+    tuple_,
+    values,
+)
+from sqlalchemy.dialects.postgresql import aggregate_order_by, array_agg, insert
+from sqlalchemy.orm import Session, aliased, joinedload
 
-from ..models import Monitoring, Machine
+from ..models import Machine, Monitoring, MonitoringDaily, MonitoringKey
+from .pagination import Page, PageRequest, paginate
+
+# Строк в одном INSERT при пакетной загрузке показаний
+_BULK_INSERT_CHUNK = 1000
+_MAX_COINS = Decimal("1e8")  # Numeric(10, 2)
+_MIN_INT, _MAX_INT = -(2**31), 2**31 - 1
 
 
 def get_monitoring(
@@ -17,13 +37,23 @@ def get_monitoring(
     date_to: Optional[str] = None,
 ) -> List[Monitoring]:
     """Получить записи мониторинга для конкретного автомата"""
-    query = (
-        db.query(Monitoring)
-        .options(joinedload(Monitoring.machine))
-        .filter(Monitoring.machine_id == machine_id)
-        .order_by(Monitoring.date.desc())
+    query = monitoring_query(db, machine_id, date_from, date_to).options(
+        joinedload(Monitoring.machine)
     )
+    return query.offset(skip).limit(limit).all()
+
 
+def monitoring_query(
+    db: Session,
+    machine_id: Optional[int] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+):
+    """Запрос показаний мониторинга с фильтрами списка, новые сверху"""
+    query = db.query(Monitoring).order_by(Monitoring.date.desc())
+
+    if machine_id is not None:
+        query = query.filter(Monitoring.machine_id == machine_id)
     if date_from:
         try:
             from_date = datetime.fromisoformat(date_from.replace("Z", "+00:00"))
@@ -36,8 +66,7 @@ def get_monitoring(
             query = query.filter(Monitoring.date <= to_date)
         except ValueError:
             pass
-
-    return query.offset(skip).limit(limit).all()
+    return query
 
 
 def get_monitoring_all(
@@ -49,46 +78,64 @@ def get_monitoring_all(
     date_to: Optional[str] = None,
 ) -> List[Monitoring]:
     """Получить записи мониторинга с фильтрацией"""
-    query = (
-        db.query(Monitoring)
-        .options(joinedload(Monitoring.machine))
-        .order_by(Monitoring.date.desc())
+    query = monitoring_query(db, machine_id, date_from, date_to).options(
+        joinedload(Monitoring.machine)
     )
+    return query.offset(skip).limit(limit).all()
 
-    if machine_id is not None:
-        query = query.filter(Monitoring.machine_id == machine_id)
-    if date_from:
-        try:
-            from_date = datetime.fromisoformat(date_from.replace("Z", "+00:00"))
-            query = query.filter(Monitoring.date >= from_date)
-        except ValueError:
-            pass
-    if date_to:
-        try:
-            to_date = datetime.fromisoformat(date_to.replace("Z", "+00:00"))
-            query = query.filter(Monitoring.date <= to_date)
-        except ValueError:
-            pass
 
-    return query.offset(skip).limit(limit).all()
+def get_monitoring_page(
+    db: Session,
+    limit: int = 100,
+    skip: int = 0,
+    cursor: Optional[str] = None,
+    total: Optional[str] = None,
+    machine_id: Optional[int] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+) -> Page:
+    """Страница показаний мониторинга: offset или курсор по (date, id)"""
+    query = monitoring_query(db, machine_id, date_from, date_to).options(
+        joinedload(Monitoring.machine)
+    )
+    return paginate(
+        db,
+        query,
+        (Monitoring.date, Monitoring.id),
+        PageRequest(limit, skip=skip, cursor=cursor, total=total),
+    )
 
 
-def get_monitoring_by_id(db: Session, monitoring_id: int) -> Optional[Monitoring]:
-    """Получить запись мониторинга по ID"""
-    return db.query(Monitoring).filter(Monitoring.id == monitoring_id).first()
+def get_monitoring_by_id(
+    db: Session, monitoring_id: int, date: Optional[datetime] = None
+) -> Optional[Monitoring]:
+    """Получить запись мониторинга по ID; с датой читается только ее секция"""
+    query = db.query(Monitoring).filter(Monitoring.id == monitoring_id)
+    if date is not None:
+        query = query.filter(Monitoring.date == date)
+    return query.first()
 
 
 def create_monitoring(
     db: Session, machine_id: int, coins: Decimal, toys: int, date: Optional[datetime]
 ) -> Monitoring:
     """Создать новую запись мониторинга"""
+    # Повтор ключа дает IntegrityError, как и прежний UNIQUE в monitoring
+    monitoring_id = db.execute(
+        insert(MonitoringKey)
+        .values(machine_id=machine_id, coins=coins, toys=toys)
+        .returning(MonitoringKey.monitoring_id)
+    ).scalar_one()
     db_monitoring = Monitoring(
+        id=monitoring_id,
         machine_id=machine_id,
         coins=coins,
         toys=toys,
         date=date if date else datetime.now(timezone.utc),
     )
     db.add(db_monitoring)
+    db.flush()
+    upsert_monitoring_daily(db, db_monitoring)
     db.commit()
     db.refresh(db_monitoring)
     return db_monitoring
@@ -101,12 +148,23 @@ def update_monitoring(
     db_monitoring = db.query(Monitoring).filter(Monitoring.id == monitoring_id).first()
     if not db_monitoring:
         return None
+    old_key = (db_monitoring.machine_id, db_monitoring.date)
+    db.query(MonitoringKey).filter(
+        MonitoringKey.monitoring_id == monitoring_id
+    ).update(
+        {"machine_id": machine_id, "coins": coins, "toys": toys},
+        synchronize_session=False,
+    )
     
     db_monitoring.machine_id = machine_id
     db_monitoring.coins = coins
     db_monitoring.toys = toys
     if date:
         db_monitoring.date = date
+    db.flush()
+    refresh_monitoring_daily(
+        db, [old_key, (db_monitoring.machine_id, db_monitoring.date)]
+    )
     
     db.commit()
     db.refresh(db_monitoring)
@@ -118,43 +176,164 @@ def delete_monitoring(db: Session, monitoring_id: int) -> bool:
     db_monitoring = db.query(Monitoring).filter(Monitoring.id == monitoring_id).first()
     if not db_monitoring:
         return False
+    key = (db_monitoring.machine_id, db_monitoring.date)
+    db.query(MonitoringKey).filter(
+        MonitoringKey.monitoring_id == monitoring_id
+    ).delete(synchronize_session=False)
     
     db.delete(db_monitoring)
+    db.flush()
+    refresh_monitoring_daily(db, [key])
     db.commit()
     return True
 
 
 def create_or_update_monitoring(
     db: Session, machine_id: int, coins: Decimal, toys: int, date: Optional[datetime]
-) -> tuple[Monitoring, bool]:
-    """Создать новую запись или обновить существующую по уникальному ключу
-    Возвращает (monitoring_record, was_created)"""
-    try:
-        # Пытаемся создать новую запись
-        monitoring = create_monitoring(
-            db, machine_id, coins, toys, date if date else datetime.now(timezone.utc)
-        )
-        return monitoring, True  # Новая запись была создана
-    except IntegrityError:
-        # Если запись с таким ключом уже существует, обновляем дату
-        db.rollback()
-        existing = (
-            db.query(Monitoring)
-            .filter(
-                Monitoring.machine_id == machine_id,
-                Monitoring.coins == coins,
-                Monitoring.toys == toys,
+) -> tuple[Optional[Monitoring], bool]:
+    """Создать новую запись или вернуть существующую по уникальному ключу
+    Возвращает (monitoring_record, was_created); запись None - автомат не найден"""
+    result = bulk_create_monitoring(
+        db, [{"machine_id": machine_id, "coins": coins, "toys": toys, "date": date}]
+    )[0]
+    monitoring = (
+        get_monitoring_by_id(db, result["id"], result["date"]) if result["id"] else None
+    )
+    return monitoring, result["status"] == "created"
+
+
+def _normalize_reading(reading: dict, known_machines: set) -> Tuple[dict, Optional[str]]:
+    """Привести показание к виду колонок таблицы; вторым элементом - ошибка"""
+    if reading["machine_id"] not in known_machines:
+        return reading, "Machine not found"
+    # Округление как у Numeric(10, 2), чтобы ключ совпал с RETURNING
+    coins = Decimal(reading["coins"]).quantize(Decimal("0.01"), ROUND_HALF_UP)
+    if abs(coins) >= _MAX_COINS:
+        return reading, "Coins value out of range"
+    if not _MIN_INT <= reading["toys"] <= _MAX_INT:
+        return reading, "Toys value out of range"
+    return {
+        "machine_id": reading["machine_id"],
+        "coins": coins,
+        "toys": reading["toys"],
+        "date": reading.get("date") or datetime.now(timezone.utc),
+    }, None
+
+
+def bulk_create_monitoring(db: Session, readings: List[dict]) -> List[dict]:
+    """Вставить пачку показаний через INSERT ... ON CONFLICT DO NOTHING RETURNING.
+
+    Уникальность проверяется по monitoring_keys: новые ключи получают id
+    показаний, затем вставляются сами показания. Дневные срезы обновляются одним слиянием по новым показаниям, коммит один.
+    Возвращает по элементу на показание: status (created, duplicate, error),
+    id записи, machine_id, date и detail с текстом ошибки."""
+    results: List[Optional[dict]] = [None] * len(readings)
+    machine_ids = {reading["machine_id"] for reading in readings}
+    known_machines = {
+        machine_id
+        for (machine_id,) in db.query(Machine.id).filter(Machine.id.in_(machine_ids))
+    }
+
+    rows = []
+    for index, reading in enumerate(readings):
+        row, error = _normalize_reading(reading, known_machines)
+        if error:
+            results[index] = {
+                "status": "error",
+                "id": None,
+                "machine_id": reading["machine_id"],
+                "date": reading.get("date"),
+                "detail": error,
+            }
+        else:
+            rows.append((index, row))
+
+    # Единый порядок вставки снижает риск взаимных блокировок параллельных пачек;
+    # сортировка устойчивая, из дубликатов внутри пачки сохраняется первый
+    ordered = sorted(
+        (row for _, row in rows),
+        key=lambda row: (row["machine_id"], row["coins"], row["toys"]),
+    )
+    created = {}
+    for start in range(0, len(ordered), _BULK_INSERT_CHUNK):
+        chunk = ordered[start : start + _BULK_INSERT_CHUNK]
+        inserted = db.execute(
+            insert(MonitoringKey)
+            .values(
+                [
+                    {"machine_id": r["machine_id"], "coins": r["coins"], "toys": r["toys"]}
+                    for r in chunk
+                ]
+            )
+            .on_conflict_do_nothing()
+            .returning(
+                MonitoringKey.monitoring_id,
+                MonitoringKey.machine_id,
+                MonitoringKey.coins,
+                MonitoringKey.toys,
+            )
+        ).all()
+        keys = {(r.machine_id, r.coins, r.toys): r.monitoring_id for r in inserted}
+        new_rows = []
+        for row in chunk:
+            key = (row["machine_id"], row["coins"], row["toys"])
+            if key in keys and key not in created:
+                created[key] = keys[key]
+                new_rows.append({**row, "id": keys[key]})
+        if new_rows:
+            db.execute(insert(Monitoring).values(new_rows))
+
+    # Дубликаты: id уже сохраненных записей одним запросом
+    duplicate_keys = {
+        (row["machine_id"], row["coins"], row["toys"])
+        for _, row in rows
+        if (row["machine_id"], row["coins"], row["toys"]) not in created
+    }
+    existing = {}
+    if duplicate_keys:
+        existing = {
+            (r.machine_id, r.coins, r.toys): r.monitoring_id
+            for r in db.query(
+                MonitoringKey.monitoring_id,
+                MonitoringKey.machine_id,
+                MonitoringKey.coins,
+                MonitoringKey.toys,
+            ).filter(
+                tuple_(
+                    MonitoringKey.machine_id, MonitoringKey.coins, MonitoringKey.toys
+                ).in_(duplicate_keys)
             )
-            .first()
+        }
+
+    if created:
+        created_dates = [
+            row["date"]
+            for _, row in rows
+            if (row["machine_id"], row["coins"], row["toys"]) in created
+        ]
+        query, names = _monitoring_daily_select(
+            monitoring_ids=list(created.values()),
+            date_from=min(created_dates),
+            date_to=max(created_dates) + timedelta(microseconds=1),
         )
-        return existing, False  # Существующая запись была найдена
-        # if existing:
-        #     existing.date = datetime.now()
-        #     db.commit()
-        #     db.refresh(existing)
-        #     return existing, False  # Существующая запись была обновлена
-        # else:
-        # raise
+        db.execute(
+            _merge_monitoring_daily(insert(MonitoringDaily).from_select(names, query))
+        )
+    db.commit()
+
+    claimed = set()
+    for index, row in rows:
+        key = (row["machine_id"], row["coins"], row["toys"])
+        is_created = key in created and key not in claimed
+        claimed.add(key)
+        results[index] = {
+            "status": "created" if is_created else "duplicate",
+            "id": created.get(key) or existing.get(key),
+            "machine_id": row["machine_id"],
+            "date": row["date"],
+            "detail": None,
+        }
+    return results
 
 
 def get_latest_monitoring(db: Session, machine_id: int) -> Optional[Monitoring]:
@@ -167,22 +346,229 @@ def get_latest_monitoring(db: Session, machine_id: int) -> Optional[Monitoring]:
     )
 
 
+def _day_start(value):
+    """Начало дня в часовом поясе сессии (как у отчетов)"""
+    return func.date_trunc(literal_column("'day'"), value)
+
+
+def upsert_monitoring_daily(db: Session, monitoring: Monitoring) -> None:
+    """Учесть новое показание в дневном срезе одним INSERT ... ON CONFLICT DO UPDATE"""
+    reading = {
+        "coins": monitoring.coins,
+        "toys": monitoring.toys,
+        "date": monitoring.date,
+    }
+    stmt = insert(MonitoringDaily).values(
+        machine_id=monitoring.machine_id,
+        day=_day_start(monitoring.date),
+        readings_count=1,
+        max_monitoring_id=monitoring.id,
+        first_monitoring_id=monitoring.id,
+        last_monitoring_id=monitoring.id,
+        **{
+            f"{kind}_{field}": value
+            for kind in ("max", "first", "last")
+            for field, value in reading.items()
+        },
+    )
+    db.execute(_merge_monitoring_daily(stmt))
+
+
+def _merge_monitoring_daily(stmt):
+    """ON CONFLICT DO UPDATE: слить новые показания дня с существующим срезом"""
+    new, old = stmt.excluded, MonitoringDaily
+    is_max = tuple_(new.max_coins, new.max_toys, new.max_date) > tuple_(
+        old.max_coins, old.max_toys, old.max_date
+    )
+    is_first = new.first_date < old.first_date
+    is_last = new.last_date >= old.last_date
+    set_ = {"readings_count": old.readings_count + new.readings_count}
+    for kind, condition in (("max", is_max), ("first", is_first), ("last", is_last)):
+        for field in ("monitoring_id", "coins", "toys", "date"):
+            name = f"{kind}_{field}"
+            set_[name] = case((condition, getattr(new, name)), else_=getattr(old, name))
+    return stmt.on_conflict_do_update(
+        constraint="unique_monitoring_daily_machine_day", set_=set_
+    )
+
+
+def _monitoring_daily_select(
+    touched=None, monitoring_ids=None, date_from=None, date_to=None
+):
+    """SELECT дневных срезов из сырых показаний.
+
+    По всем показаниям, по затронутым дням или только по указанным показаниям.
+    Границы [date_from, date_to) ограничивают чтение нужными секциями."""
+    day = _day_start(Monitoring.date)
+
+    def first_id(*order_by):
+        return array_agg(aggregate_order_by(Monitoring.id, *order_by))[1]
+
+    ids = select(
+        Monitoring.machine_id,
+        day.label("day"),
+        func.count().label("readings_count"),
+        first_id(
+            Monitoring.coins.desc(), Monitoring.toys.desc(), Monitoring.date.desc()
+        ).label("max_id"),
+        first_id(Monitoring.date, Monitoring.id).label("first_id"),
+        first_id(Monitoring.date.desc(), Monitoring.id.desc()).label("last_id"),
+    )
+    if touched is not None:
+        ids = ids.join(
+            touched,
+            and_(
+                Monitoring.machine_id == touched.c.machine_id,
+                Monitoring.date >= touched.c.day,
+                Monitoring.date < touched.c.day + timedelta(days=1),
+            ),
+        )
+    if monitoring_ids is not None:
+        ids = ids.where(Monitoring.id.in_(monitoring_ids))
+    if date_from is not None:
+        ids = ids.where(Monitoring.date >= date_from)
+    if date_to is not None:
+        ids = ids.where(Monitoring.date < date_to)
+    ids = ids.group_by(Monitoring.machine_id, day).subquery("daily_ids")
+
+    columns = [ids.c.machine_id, ids.c.day, ids.c.readings_count]
+    names = ["machine_id", "day", "readings_count"]
+    query = select().select_from(ids)
+    for kind in ("max", "first", "last"):
+        reading = aliased(Monitoring, name=f"{kind}_reading")
+        columns += [reading.id, reading.coins, reading.toys, reading.date]
+        names += [
+            f"{kind}_{field}" for field in ("monitoring_id", "coins", "toys", "date")
+        ]
+        condition = reading.id == ids.c[f"{kind}_id"]
+        if date_from is not None:
+            condition &= reading.date >= date_from
+        if date_to is not None:
+            condition &= reading.date < date_to
+        query = query.join(reading, condition)
+    return query.add_columns(*columns), names
+
+
+def refresh_monitoring_daily(
+    db: Session, machine_dates: Iterable[Tuple[int, datetime]]
+) -> None:
+    """Пересчитать дневные срезы по сырым показаниям для пар (автомат, момент дня).
+
+    Используется при изменении и удалении показаний."""
+    machine_dates = list(machine_dates)
+    if not machine_dates:
+        return
+    touched_values = values(
+        column("machine_id", Integer),
+        column("ts", DateTime(timezone=True)),
+        name="touched",
+    ).data(machine_dates)
+    touched = (
+        select(
+            touched_values.c.machine_id, _day_start(touched_values.c.ts).label("day")
+        )
+        .distinct()
+        .subquery("touched_days")
+    )
+    db.execute(
+        delete(MonitoringDaily).where(
+            tuple_(MonitoringDaily.machine_id, MonitoringDaily.day).in_(
+                select(touched.c.machine_id, touched.c.day)
+            )
+        )
+    )
+    query, names = _monitoring_daily_select(touched)
+    db.execute(insert(MonitoringDaily).from_select(names, query))
+
+
+def rebuild_monitoring_daily(db: Session) -> int:
+    """Пересобрать дневные срезы по всем показаниям мониторинга.
+
+    Дни, сырые показания которых уже архивированы, сохраняются."""
+    day = _day_start(Monitoring.date)
+    db.execute(
+        delete(MonitoringDaily).where(
+            tuple_(MonitoringDaily.machine_id, MonitoringDaily.day).in_(
+                select(Monitoring.machine_id, day).distinct()
+            )
+        )
+    )
+    query, names = _monitoring_daily_select()
+    result = db.execute(insert(MonitoringDaily).from_select(names, query))
+    db.commit()
+    return result.rowcount
+
+
+def monitoring_daily_needs_rebuild(db: Session) -> bool:
+    """Есть показания мониторинга, но дневные срезы еще не собраны"""
+    has_daily = db.query(MonitoringDaily.id).limit(1).first() is not None
+    has_readings = db.query(Monitoring.id).limit(1).first() is not None
+    return has_readings and not has_daily
+
+
+def get_monitoring_daily(
+    db: Session,
+    machine_id: int,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+) -> List[MonitoringDaily]:
+    """Получить дневные срезы мониторинга автомата за период"""
+    query = db.query(MonitoringDaily).filter(MonitoringDaily.machine_id == machine_id)
+    if date_from:
+        query = query.filter(MonitoringDaily.day >= _day_start(date_from))
+    if date_to:
+        query = query.filter(MonitoringDaily.day <= date_to)
+    return query.order_by(MonitoringDaily.day.asc()).all()
+
+
 def get_monitoring_summary(
     db: Session, machine_id: int, start_date: datetime, end_date: datetime
 ) -> dict:
-    """Получить сводку мониторинга за период"""
-    records = (
-        db.query(Monitoring)
+    """Получить сводку мониторинга за период.
+
+    Полные дни берутся из monitoring_daily, неполные дни на краях периода -
+    из сырых показаний."""
+    days = (
+        db.query(MonitoringDaily)
         .filter(
-            Monitoring.machine_id == machine_id,
-            Monitoring.date >= start_date,
-            Monitoring.date <= end_date,
+            MonitoringDaily.machine_id == machine_id,
+            MonitoringDaily.day >= start_date,
+            MonitoringDaily.day + timedelta(days=1) <= end_date,
         )
-        .order_by(Monitoring.date.asc())
+        .order_by(MonitoringDaily.day.asc())
         .all()
     )
+    edge = db.query(Monitoring.id, Monitoring.date).filter(
+        Monitoring.machine_id == machine_id,
+        Monitoring.date >= start_date,
+        Monitoring.date <= end_date,
+    )
+    if days:
+        edge = edge.filter(
+            or_(
+                Monitoring.date < days[0].day,
+                Monitoring.date >= days[-1].day + timedelta(days=1),
+            )
+        )
+    edge = edge.order_by(Monitoring.date.asc(), Monitoring.id.asc()).all()
 
-    if not records:
+    candidates = [(row.date, row.id) for row in edge]
+    # Показания архивных секций восстанавливаются по дневному срезу
+    from_daily = {}
+    if days:
+        for kind, day in (("first", days[0]), ("last", days[-1])):
+            record = Monitoring(
+                id=getattr(day, f"{kind}_monitoring_id"),
+                machine_id=machine_id,
+                date=getattr(day, f"{kind}_date"),
+                coins=getattr(day, f"{kind}_coins"),
+                toys=getattr(day, f"{kind}_toys"),
+            )
+            candidates.append((record.date, record.id))
+            from_daily[record.id] = record
+    records_count = len(edge) + sum(day.readings_count for day in days)
+
+    if not records_count:
         return {
             "total_coins": 0,
             "total_toys": 0,
@@ -191,13 +577,22 @@ def get_monitoring_summary(
             "last_record": None,
         }
 
-    first_record = records[0]
-    last_record = records[-1]
+    first = min(candidates)
+    last = max(candidates)
+    records = {
+        record.id: record
+        for record in db.query(Monitoring).filter(
+            Monitoring.id.in_([first[1], last[1]]),
+            Monitoring.date.in_([first[0], last[0]]),
+        )
+    }
+    first_record = records.get(first[1]) or from_daily[first[1]]
+    last_record = records.get(last[1]) or from_daily[last[1]]
 
     return {
         "total_coins": float(last_record.coins - first_record.coins),
         "total_toys": last_record.toys - first_record.toys,
-        "records_count": len(records),
+        "records_count": records_count,
         "first_record": first_record,
         "last_record": last_record,
     }
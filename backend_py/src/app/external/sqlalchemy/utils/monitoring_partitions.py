@@ -0,0 +1,291 @@
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterable, List, Optional
+
+from sqlalchemy import (
+    Date,
+    Table,
+    cast,
+    column,
+    delete,
+    exists,
+    func,
+    select,
+    table,
+    text,
+)
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from ..models import Monitoring, MonitoringDaily, MonitoringKey
+from .monitoring import _monitoring_daily_select
+
+PARTITION_PREFIX = "monitoring_p"
+DEFAULT_PARTITION = "monitoring_default"
+_LEGACY_TABLE = "monitoring_legacy"
+# Ключ advisory-блокировки переноса monitoring в секционированную таблицу
+_MIGRATION_LOCK_KEY = 7302
+
+
+class PartitionMigrationInProgress(Exception):
+    """Перенос таблицы в секционированную уже выполняет другой процесс"""
+
+
+def _month_start(value) -> date:
+    return date(value.year, value.month, 1)
+
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARTITION_PREFIX}{month:%Y_%m}"
+
+
+def _partition_month(name: str) -> Optional[date]:
+    """Месяц секции по имени monitoring_pYYYY_MM"""
+    if not name.startswith(PARTITION_PREFIX):
+        return None
+    try:
+        return datetime.strptime(name[len(PARTITION_PREFIX) :], "%Y_%m").date()
+    except ValueError:
+        return None
+
+
+def _like(name: str, source: Table):
+    """Таблица name с колонками source - для запросов к секциям и старой таблице
+    (имя экранируется при компиляции запроса)"""
+    return table(name, *(column(c.name, c.type) for c in source.columns))
+
+
+def _data_months(db: Session, source, date_column: str) -> List[date]:
+    """Месяцы, в которые попадают строки source"""
+    month = cast(func.date_trunc("month", source.c[date_column]), Date)
+    return list(db.execute(select(month).distinct()).scalars())
+
+
+def _move_rows(db: Session, source, target, where) -> None:
+    """Перенести строки source, подходящие под where, в target одним запросом"""
+    moved = delete(source).where(*where).returning(*source.c).cte("moved")
+    db.execute(
+        insert(target)
+        .from_select(list(target.c.keys()), select(*moved.c))
+        .add_cte(moved)
+    )
+
+
+def _table_kind(db: Session, name: str) -> Optional[str]:
+    """relkind таблицы: 'p' - секционированная, 'r' - обычная, None - нет таблицы"""
+    return db.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:name)"),
+        {"name": name},
+    ).scalar()
+
+
+def _drop_indexes(db: Session, table_name: str) -> None:
+    """Удалить индексы таблицы (их имена нужны индексам новой таблицы)"""
+    quote = db.get_bind().dialect.identifier_preparer.quote
+    indexes = db.execute(
+        text("SELECT indexname FROM pg_indexes WHERE tablename = :table"),
+        {"table": table_name},
+    ).scalars()
+    for index in list(indexes):
+        db.execute(text(f"DROP INDEX IF EXISTS {quote(index)}"))
+
+
+def is_monitoring_partitioned(db: Session) -> bool:
+    return _table_kind(db, "monitoring") == "p"
+
+
+def list_monitoring_partitions(db: Session) -> List[dict]:
+    """Секции monitoring с оценкой числа строк и размером"""
+    rows = db.execute(
+        text(
+            """
+            SELECT child.relname AS name,
+                   pg_get_expr(child.relpartbound, child.oid) AS bound,
+                   greatest(child.reltuples, 0)::bigint AS rows_estimate,
+                   pg_total_relation_size(child.oid) AS size_bytes
+            FROM pg_inherits
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = to_regclass('monitoring')
+            ORDER BY child.relname
+            """
+        )
+    ).all()
+    partitions = []
+    for row in rows:
+        month = _partition_month(row.name)
+        partitions.append(
+            {
+                "name": row.name,
+                "month": month,
+                "is_default": row.name == DEFAULT_PARTITION,
+                "bound": row.bound,
+                "rows_estimate": row.rows_estimate,
+                "size_bytes": row.size_bytes,
+            }
+        )
+    return partitions
+
+
+def _attached_months(db: Session) -> set:
+    return {
+        partition["month"]
+        for partition in list_monitoring_partitions(db)
+        if partition["month"] is not None
+    }
+
+
+def _bounds(month: date) -> str:
+    # Границы - начало месяца в часовом поясе сессии, как у дневных срезов
+    return f"FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+
+
+def _create_partition(db: Session, month: date) -> None:
+    """Создать секцию месяца; строки месяца из секции по умолчанию переносятся в нее"""
+    name = partition_name(month)
+    default = _like(DEFAULT_PARTITION, Monitoring.__table__)
+    period = (default.c.date >= month, default.c.date < _add_months(month, 1))
+    has_default_rows = db.execute(select(exists().where(*period))).scalar()
+    if not has_default_rows:
+        db.execute(
+            text(
+                f"CREATE TABLE {name} PARTITION OF monitoring FOR VALUES {_bounds(month)}"
+            )
+        )
+        return
+    # Секция по умолчанию не допускает новой секции со своими строками:
+    # строки переносятся в отдельную таблицу, которая затем присоединяется
+    db.execute(text(f"CREATE TABLE {name} (LIKE monitoring INCLUDING DEFAULTS)"))
+    _move_rows(db, default, _like(name, Monitoring.__table__), period)
+    db.execute(
+        text(
+            f"ALTER TABLE monitoring ATTACH PARTITION {name} FOR VALUES {_bounds(month)}"
+        )
+    )
+
+
+def ensure_monitoring_partitions(
+    db: Session, months: Optional[Iterable[date]] = None, months_ahead: int = 0
+) -> List[str]:
+    """Создать секцию по умолчанию и недостающие секции месяцев.
+
+    Без months - текущий месяц и months_ahead следующих. Возвращает имена
+    созданных секций."""
+    created = []
+    if _table_kind(db, DEFAULT_PARTITION) is None:
+        db.execute(
+            text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF monitoring DEFAULT")
+        )
+        created.append(DEFAULT_PARTITION)
+    if months is None:
+        current = _month_start(datetime.now(timezone.utc))
+        months = [_add_months(current, offset) for offset in range(months_ahead + 1)]
+    attached = _attached_months(db)
+    for month in sorted({_month_start(month) for month in months} - attached):
+        _create_partition(db, month)
+        created.append(partition_name(month))
+    db.commit()
+    return created
+
+
+def drain_default_partition(db: Session) -> List[str]:
+    """Разнести показания из секции по умолчанию по секциям их месяцев"""
+    months = _data_months(db, _like(DEFAULT_PARTITION, Monitoring.__table__), "date")
+    return ensure_monitoring_partitions(db, months=months)
+
+
+def archive_monitoring_partitions(db: Session, retention_days: int) -> List[str]:
+    """Отсоединить и удалить секции, целиком старше retention_days.
+
+    Дневные срезы ведутся при записи показаний; перед удалением в них
+    дописываются дни секции, которых там нет, поэтому история отчетов
+    и графиков сохраняется в monitoring_daily."""
+    cutoff = _month_start(datetime.now(timezone.utc) - timedelta(days=retention_days))
+    archived = []
+    for month in sorted(_attached_months(db)):
+        if _add_months(month, 1) > cutoff:
+            break
+        name = partition_name(month)
+        query, names = _monitoring_daily_select(
+            date_from=month, date_to=_add_months(month, 1)
+        )
+        db.execute(
+            insert(MonitoringDaily)
+            .from_select(names, query)
+            .on_conflict_do_nothing(constraint="unique_monitoring_daily_machine_day")
+        )
+        db.execute(text(f"ALTER TABLE monitoring DETACH PARTITION {name}"))
+        db.execute(text(f"DROP TABLE {name}"))
+        db.commit()
+        archived.append(name)
+    return archived
+
+
+def maintain_monitoring_partitions(
+    db: Session, months_ahead: int, retention_days: int = 0
+) -> dict:
+    """Плановое обслуживание: секции наперед, разбор секции по умолчанию,
+    архивирование старых секций (retention_days = 0 - без архивирования)"""
+    created = ensure_monitoring_partitions(db, months_ahead=months_ahead)
+    created += drain_default_partition(db)
+    archived = (
+        archive_monitoring_partitions(db, retention_days) if retention_days > 0 else []
+    )
+    return {"created": created, "archived": archived}
+
+
+def migrate_monitoring_to_partitions(db: Session) -> Optional[int]:
+    """Перенести обычную таблицу monitoring в секционированную.
+
+    Выполняется одной транзакцией под advisory-блокировкой (второй процесс
+    получает PartitionMigrationInProgress): старая таблица переименовывается,
+    создается секционированная с секциями по месяцам данных, переносятся
+    показания и ключи уникальности. Возвращает число перенесенных строк
+    или None, если таблица уже секционирована."""
+    if not db.execute(select(func.pg_try_advisory_xact_lock(_MIGRATION_LOCK_KEY))).scalar():
+        raise PartitionMigrationInProgress("monitoring")
+    if _table_kind(db, "monitoring") != "r":
+        db.rollback()
+        return None
+    connection = db.connection()
+    for statement in (
+        f"ALTER TABLE monitoring RENAME TO {_LEGACY_TABLE}",
+        # Имена индексов и ограничений общие для схемы - освобождаем их
+        f"ALTER TABLE {_LEGACY_TABLE} DROP CONSTRAINT IF EXISTS unique_machine_coins_toys",
+        f"ALTER TABLE {_LEGACY_TABLE} DROP CONSTRAINT IF EXISTS monitoring_pkey",
+        # Последовательность id остается общей и не удаляется со старой таблицей
+        f"ALTER TABLE {_LEGACY_TABLE} ALTER COLUMN id DROP DEFAULT",
+        "ALTER SEQUENCE monitoring_id_seq OWNED BY NONE",
+    ):
+        db.execute(text(statement))
+    _drop_indexes(db, _LEGACY_TABLE)
+    Monitoring.__table__.create(bind=connection, checkfirst=True)
+    db.execute(
+        text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF monitoring DEFAULT")
+    )
+    legacy = _like(_LEGACY_TABLE, Monitoring.__table__)
+    for month in sorted(_data_months(db, legacy, "date")):
+        db.execute(
+            text(
+                f"CREATE TABLE {partition_name(month)} PARTITION OF monitoring "
+                f"FOR VALUES {_bounds(month)}"
+            )
+        )
+    rows = db.execute(
+        insert(Monitoring.__table__).from_select(list(legacy.c.keys()), select(*legacy.c))
+    ).rowcount
+    db.execute(
+        insert(MonitoringKey)
+        .from_select(
+            ["machine_id", "coins", "toys", "monitoring_id"],
+            select(legacy.c.machine_id, legacy.c.coins, legacy.c.toys, legacy.c.id),
+        )
+        .on_conflict_do_nothing()
+    )
+    db.execute(text(f"DROP TABLE {_LEGACY_TABLE}"))
+    db.execute(text("ALTER SEQUENCE monitoring_id_seq OWNED BY monitoring.id"))
+    db.commit()
+    return rows
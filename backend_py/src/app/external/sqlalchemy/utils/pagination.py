@@ -0,0 +1,135 @@
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+
+from sqlalchemy import Column, tuple_
+from sqlalchemy.orm import Query, Session
+
+
+class InvalidCursorError(ValueError):
+    """Курсор поврежден или выдан для другого списка"""
+
+
+class Page(NamedTuple):
+    """Страница списка: записи, курсор следующей страницы и итоги по запросу"""
+
+    items: List[Any]
+    next_cursor: Optional[str] = None
+    total: Optional[int] = None
+    total_estimate: Optional[int] = None
+
+
+class PageRequest(NamedTuple):
+    """Параметры запрошенной страницы"""
+
+    limit: int
+    skip: int = 0
+    cursor: Optional[str] = None  # "" - первая страница в режиме курсора
+    total: Optional[str] = None  # exact | estimate
+
+
+def _encode_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def _decode_value(column: Column, value):
+    python_type = column.type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is date:
+        return date.fromisoformat(value)
+    return python_type(value)
+
+
+def encode_cursor(keys: Sequence[Column], item) -> str:
+    """Непрозрачный курсор из значений ключей сортировки записи"""
+    values = [_encode_value(getattr(item, column.key)) for column in keys]
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(keys: Sequence[Column], cursor: str) -> List:
+    """Значения ключей из курсора"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise ValueError
+        return [_decode_value(column, value) for column, value in zip(keys, values)]
+    except (ValueError, TypeError):
+        raise InvalidCursorError("Invalid cursor")
+
+
+def estimate_count(db: Session, query: Query) -> int:
+    """Оценка числа строк запроса по статистике планировщика (EXPLAIN, без выполнения)"""
+    statement = query.order_by(None).statement
+    # Параметры IN (...) раскрываются при компиляции, иначе в SQL останется
+    # заглушка __[POSTCOMPILE_...]
+    compiled = statement.compile(
+        dialect=db.get_bind().dialect, compile_kwargs={"render_postcompile": True}
+    )
+    plan = (
+        db.connection()
+        .exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params)
+        .scalar()
+    )
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def paginate(
+    db: Session,
+    query: Query,
+    keys: Sequence[Column],
+    request: PageRequest,
+    descending: bool = True,
+) -> Page:
+    """Страница запроса в порядке keys (последний ключ - уникальный id).
+
+    С курсором страница читается по условию (ключи) < (значения курсора),
+    поэтому время не зависит от глубины; без курсора - через offset.
+    Пустой курсор - первая страница в режиме курсора. total: exact -
+    COUNT(*) по тем же фильтрам, estimate - оценка планировщика."""
+    limit, skip, cursor, total = request
+    page_query = query.order_by(None).order_by(
+        *[column.desc() if descending else column.asc() for column in keys]
+    )
+    if cursor:
+        values = decode_cursor(keys, cursor)
+        row, bound = tuple_(*keys), tuple_(*values)
+        page_query = page_query.filter(row < bound if descending else row > bound)
+    elif cursor is None and skip:
+        page_query = page_query.offset(skip)
+
+    # Лишняя запись показывает, что есть следующая страница
+    items = page_query.limit(limit + 1).all()
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(keys, items[-1])
+
+    return Page(
+        items=items,
+        next_cursor=next_cursor,
+        total=query.order_by(None).count() if total == "exact" else None,
+        total_estimate=estimate_count(db, query) if total == "estimate" else None,
+    )
+
+
+def page_headers(page: Page) -> Dict[str, str]:
+    """Заголовки ответа со служебными данными страницы"""
+    headers = {}
+    if page.next_cursor:
+        headers["X-Next-Cursor"] = page.next_cursor
+    if page.total is not None:
+        headers["X-Total-Count"] = str(page.total)
+    if page.total_estimate is not None:
+        headers["X-Total-Estimate"] = str(page.total_estimate)
+    return headers
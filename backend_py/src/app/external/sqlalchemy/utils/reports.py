@@ -0,0 +1,723 @@
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import (
+    DateTime,
+    Integer,
+    case,
+    column,
+    delete,
+    exists,
+    func,
+    literal,
+    literal_column,
+    or_,
+    select,
+    tuple_,
+    union_all,
+    values,
+)
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.settings import settings
+
+from ..models import (
+    InventoryMovement,
+    InventoryMovementItem,
+    Machine,
+    MachineStock,
+    MonitoringDaily,
+    Rent,
+    Report,
+    ReportRollup,
+)
+
+def reports_query(db: Session, report_date: Optional[datetime] = None):
+    """Запрос дневных отчетов с фильтром списка, новые сверху"""
+    query = db.query(Report).order_by(Report.report_date.desc())
+    if report_date:
+        # normalize to date-only and filter by that day
+        day = datetime(report_date.year, report_date.month, report_date.day)
+        query = query.filter(Report.report_date == day)
+    return query
+
+
+# Периоды, для которых хранятся предрассчитанные суммы отчетов
+ROLLUP_PERIODS = ("weekly", "monthly", "quarterly", "halfyear", "yearly")
+_PERIOD_MONTHS = {"monthly": 1, "quarterly": 3, "halfyear": 6, "yearly": 12}
+_ROLLUP_FIELDS = (
+    "revenue",
+    "profit",
+    "toy_consumption",
+    "rent_cost",
+    "days_count",
+    "records_count",
+)
+# Ключ advisory-блокировки записи отчетов (второй ключ - номер дня)
+_REPORTS_LOCK_KEY = 7301
+
+
+def _day_max_monitoring(day_start: datetime, machine_ids: Optional[List[int]]):
+    """CTE: запись с максимальными coins/toys за день по каждому автомату"""
+    query = select(
+        MonitoringDaily.machine_id,
+        MonitoringDaily.max_coins.label("coins"),
+        MonitoringDaily.max_toys.label("toys"),
+        MonitoringDaily.max_date.label("date"),
+    ).where(MonitoringDaily.day == day_start)
+    if machine_ids is not None:
+        query = query.where(MonitoringDaily.machine_id.in_(machine_ids))
+    return query.cte("today_max")
+
+
+def _prev_day_max_monitoring(day_start: datetime, today):
+    """CTE: максимальная запись за предыдущий день с данными по каждому автомату"""
+    return (
+        select(
+            MonitoringDaily.machine_id,
+            MonitoringDaily.max_coins.label("coins"),
+            MonitoringDaily.max_toys.label("toys"),
+            MonitoringDaily.max_date.label("date"),
+        )
+        .where(
+            MonitoringDaily.day < day_start,
+            MonitoringDaily.machine_id.in_(select(today.c.machine_id)),
+        )
+        .distinct(MonitoringDaily.machine_id)
+        .order_by(MonitoringDaily.machine_id, MonitoringDaily.day.desc())
+        .cte("prev_max")
+    )
+
+
+def get_daily_report_inputs(
+    db: Session, report_date: datetime, machine_ids: Optional[List[int]] = None
+) -> List[dict]:
+    """Получить исходные данные для отчета за день по всем автоматам одним запросом.
+
+    Для каждого автомата, у которого есть мониторинг за день, возвращает
+    максимальные показания за день и за предыдущий день с данными."""
+    today = _day_max_monitoring(report_date, machine_ids)
+    prev = _prev_day_max_monitoring(report_date, today)
+
+    rows = db.execute(
+        select(
+            Machine.id.label("machine_id"),
+            Machine.name,
+            Machine.game_cost,
+            Machine.rent_id,
+            today.c.coins,
+            today.c.toys,
+            today.c.date,
+            prev.c.coins.label("prev_coins"),
+            prev.c.toys.label("prev_toys"),
+            prev.c.date.label("prev_date"),
+        )
+        .join(today, today.c.machine_id == Machine.id)
+        .outerjoin(prev, prev.c.machine_id == Machine.id)
+        .order_by(Machine.id)
+    ).all()
+    return [dict(row._mapping) for row in rows]
+
+
+def get_next_monitoring_days(
+    db: Session, machine_days: Iterable[Tuple[int, date]]
+) -> Set[Tuple[int, date]]:
+    """Для пар (автомат, день) найти следующий день с мониторингом этого автомата.
+
+    Отчет за следующий день считается от максимума текущего, поэтому он тоже
+    зависит от изменения показаний. Выполняется одним запросом."""
+    machine_days = list(machine_days)
+    if not machine_days:
+        return set()
+    dirty = values(
+        column("machine_id", Integer), column("day", DateTime), name="dirty"
+    ).data(
+        [
+            (machine_id, datetime(day.year, day.month, day.day))
+            for machine_id, day in machine_days
+        ]
+    )
+    next_day = (
+        select(func.min(MonitoringDaily.day))
+        .where(
+            MonitoringDaily.machine_id == dirty.c.machine_id,
+            MonitoringDaily.day > dirty.c.day,
+        )
+        .scalar_subquery()
+    )
+    rows = db.execute(select(dirty.c.machine_id, next_day.label("next_day"))).all()
+    return {
+        (machine_id, next_day.date())
+        for machine_id, next_day in rows
+        if next_day is not None
+    }
+
+
+def delete_reports_without_monitoring(
+    db: Session, report_date: datetime, machine_ids: List[int]
+) -> int:
+    """Удалить отчеты автоматов за день, по которому больше нет показаний мониторинга"""
+    if not machine_ids:
+        return 0
+    _lock_report_days(db, [report_date])
+    has_monitoring = exists().where(
+        MonitoringDaily.machine_id == Report.machine_id,
+        MonitoringDaily.day == report_date,
+    )
+    deleted = db.execute(
+        delete(Report)
+        .where(
+            Report.report_date == report_date,
+            Report.machine_id.in_(machine_ids),
+            ~has_monitoring,
+        )
+        .returning(*_report_rollup_columns())
+        .execution_options(synchronize_session=False)
+    ).all()
+    _apply_rollup_deltas(db, _rollup_deltas(old=deleted, new=[]))
+    return len(deleted)
+
+
+def get_active_rents(
+    db: Session, rent_ids: List[int], on_date: datetime
+) -> Dict[int, Rent]:
+    """Получить аренды, действующие на дату, по списку ID"""
+    if not rent_ids:
+        return {}
+    rents = (
+        db.query(Rent)
+        .filter(
+            Rent.id.in_(rent_ids),
+            Rent.start_date <= on_date,
+            Rent.end_date >= on_date,
+        )
+        .all()
+    )
+    return {rent.id: rent for rent in rents}
+
+
+def get_machine_stocks_by_machine(
+    db: Session, machine_ids: List[int]
+) -> Dict[int, List[MachineStock]]:
+    """Получить положительные остатки в автоматах, сгруппированные по автомату"""
+    if not machine_ids:
+        return {}
+    stocks = (
+        db.query(MachineStock)
+        .filter(MachineStock.machine_id.in_(machine_ids), MachineStock.quantity > 0)
+        .order_by(MachineStock.machine_id, MachineStock.id)
+        .all()
+    )
+    result: Dict[int, List[MachineStock]] = {}
+    for stock in stocks:
+        result.setdefault(stock.machine_id, []).append(stock)
+    return result
+
+
+def get_report_issue_movements(
+    db: Session, machine_ids: List[int], report_date: datetime
+) -> Dict[int, InventoryMovement]:
+    """Получить автоматические движения "выдача" по отчету за день для автоматов"""
+    if not machine_ids:
+        return {}
+    movements = (
+        db.query(InventoryMovement)
+        .filter(
+            InventoryMovement.movement_type == "issue",
+            InventoryMovement.document_date == report_date,
+            InventoryMovement.from_machine_id.in_(machine_ids),
+            InventoryMovement.description.like(
+                f"%отчету мониторинга за {report_date.strftime('%d.%m.%Y')}%"
+            ),
+        )
+        .order_by(InventoryMovement.id)
+        .all()
+    )
+    result: Dict[int, InventoryMovement] = {}
+    for movement in movements:
+        result.setdefault(movement.from_machine_id, movement)
+    return result
+
+
+def delete_movement_items(db: Session, movement_ids: List[int]) -> None:
+    """Удалить позиции у списка движений одним запросом"""
+    if not movement_ids:
+        return
+    db.query(InventoryMovementItem).filter(
+        InventoryMovementItem.movement_id.in_(movement_ids)
+    ).delete(synchronize_session=False)
+
+
+def upsert_reports(db: Session, rows: List[dict]) -> None:
+    """Записать отчеты одним INSERT ... ON CONFLICT (report_date, machine_id) DO UPDATE.
+
+    Суммы в report_rollups обновляются на разницу между старыми и новыми значениями."""
+    if not rows:
+        return
+    _lock_report_days(db, [row["report_date"] for row in rows])
+    old = db.execute(
+        select(*_report_rollup_columns()).where(
+            tuple_(Report.report_date, Report.machine_id).in_(
+                [(row["report_date"], row["machine_id"]) for row in rows]
+            )
+        )
+    ).all()
+    stmt = insert(Report).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        constraint="unique_report_per_day_machine",
+        set_={
+            "revenue": stmt.excluded.revenue,
+            "toy_consumption": stmt.excluded.toy_consumption,
+            "plays_per_toy": stmt.excluded.plays_per_toy,
+            "profit": stmt.excluded.profit,
+            "days_count": stmt.excluded.days_count,
+            "rent_cost": stmt.excluded.rent_cost,
+        },
+    )
+    new = db.execute(stmt.returning(*_report_rollup_columns())).all()
+    _apply_rollup_deltas(db, _rollup_deltas(old=old, new=new))
+
+
+def _lock_report_days(db: Session, days: Iterable[datetime]) -> None:
+    """Блокировка записи отчетов за дни до конца транзакции.
+
+    Разница старых и новых значений считается вне БД, поэтому параллельные
+    записи одного дня не должны пересекаться."""
+    for day in sorted({d.date() for d in days}):
+        db.execute(
+            select(func.pg_advisory_xact_lock(_REPORTS_LOCK_KEY, day.toordinal()))
+        )
+
+
+def _report_rollup_columns():
+    return (
+        Report.report_date,
+        Report.machine_id,
+        Report.revenue,
+        Report.profit,
+        Report.toy_consumption,
+        Report.rent_cost,
+        Report.days_count,
+    )
+
+
+def period_bounds(day: datetime, period: str) -> Tuple[datetime, datetime]:
+    """Начало периода и начало следующего периода для дня"""
+    day = datetime(day.year, day.month, day.day)
+    if period == "weekly":
+        start = day - timedelta(days=day.weekday())
+        return start, start + timedelta(days=7)
+    months = _PERIOD_MONTHS[period]
+    first_month = (day.month - 1) // months * months
+    next_month = first_month + months
+    return (
+        datetime(day.year, first_month + 1, 1),
+        datetime(day.year + next_month // 12, next_month % 12 + 1, 1),
+    )
+
+
+def period_start_expr(column, period: str):
+    """SQL-выражение начала периода (в часовом поясе сессии) для даты отчета"""
+    if period == "weekly":
+        return func.date_trunc(literal_column("'week'"), column)
+    if period == "monthly":
+        return func.date_trunc(literal_column("'month'"), column)
+    if period == "quarterly":
+        return func.date_trunc(literal_column("'quarter'"), column)
+    if period == "halfyear":
+        return func.date_trunc(literal_column("'year'"), column) + case(
+            (func.extract("month", column) > 6, literal_column("interval '6 months'")),
+            else_=literal_column("interval '0 months'"),
+        )
+    if period == "yearly":
+        return func.date_trunc(literal_column("'year'"), column)
+    return func.date_trunc(literal_column("'day'"), column)
+
+
+def period_end_expr(start, period: str):
+    """SQL-выражение начала следующего периода"""
+    if period == "weekly":
+        return start + literal_column("interval '7 days'")
+    if period in _PERIOD_MONTHS:
+        return start + literal_column(f"interval '{_PERIOD_MONTHS[period]} months'")
+    return start + literal_column("interval '1 day'")
+
+
+def _rollup_deltas(old, new) -> Dict[Tuple[str, datetime, Optional[int]], dict]:
+    """Изменения сумм по периодам (по автомату и по парку) для замененных отчетов"""
+    deltas: Dict[Tuple[str, datetime, Optional[int]], dict] = {}
+
+    def add(row, sign: int):
+        # Дата отчета приходит в часовом поясе сессии - берем локальный день
+        day = row.report_date.replace(tzinfo=None)
+        values_ = {
+            "revenue": Decimal(row.revenue or 0) * sign,
+            "profit": Decimal(row.profit or 0) * sign,
+            "toy_consumption": int(row.toy_consumption or 0) * sign,
+            "rent_cost": Decimal(row.rent_cost or 0) * sign,
+            "days_count": int(row.days_count or 1) * sign,
+            "records_count": sign,
+        }
+        for period in ROLLUP_PERIODS:
+            start, end = period_bounds(day, period)
+            for machine_id in (row.machine_id, None):
+                bucket = deltas.setdefault(
+                    (period, start, machine_id),
+                    {"period_end": end, **{f: 0 for f in _ROLLUP_FIELDS}},
+                )
+                for field in _ROLLUP_FIELDS:
+                    bucket[field] += values_[field]
+
+    for row in old:
+        add(row, -1)
+    for row in new:
+        add(row, 1)
+    return deltas
+
+
+def _apply_rollup_deltas(
+    db: Session, deltas: Dict[Tuple[str, datetime, Optional[int]], dict]
+) -> None:
+    """Прибавить изменения к суммам периодов одним INSERT ... ON CONFLICT DO UPDATE"""
+    rows = [
+        {"period": period, "period_start": start, "machine_id": machine_id, **bucket}
+        for (period, start, machine_id), bucket in deltas.items()
+        if any(bucket[field] for field in _ROLLUP_FIELDS)
+    ]
+    if not rows:
+        return
+    # Единый порядок строк снижает риск взаимных блокировок параллельных записей
+    rows.sort(key=lambda r: (r["period"], r["period_start"], r["machine_id"] or 0))
+    stmt = insert(ReportRollup).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[
+            ReportRollup.period,
+            ReportRollup.period_start,
+            func.coalesce(ReportRollup.machine_id, 0),
+        ],
+        set_={
+            field: getattr(ReportRollup, field) + getattr(stmt.excluded, field)
+            for field in _ROLLUP_FIELDS
+        },
+    )
+    db.execute(stmt)
+
+
+def rebuild_report_rollups(db: Session) -> int:
+    """Пересобрать суммы периодов по всем отчетам (начальное заполнение и сверка)"""
+    db.execute(delete(ReportRollup))
+    total = 0
+    for period in ROLLUP_PERIODS:
+        buckets = select(
+            period_start_expr(Report.report_date, period).label("period_start"),
+            Report.machine_id,
+            Report.revenue,
+            Report.profit,
+            Report.toy_consumption,
+            Report.rent_cost,
+            func.coalesce(func.nullif(Report.days_count, 0), 1).label("days_count"),
+        ).subquery()
+        query = select(
+            literal(period),
+            buckets.c.period_start,
+            period_end_expr(buckets.c.period_start, period),
+            buckets.c.machine_id,
+            func.sum(buckets.c.revenue),
+            func.sum(buckets.c.profit),
+            func.sum(buckets.c.toy_consumption),
+            func.sum(buckets.c.rent_cost),
+            func.sum(buckets.c.days_count),
+            func.count(),
+        ).group_by(
+            func.grouping_sets(
+                tuple_(buckets.c.period_start, buckets.c.machine_id),
+                tuple_(buckets.c.period_start),
+            )
+        )
+        result = db.execute(
+            insert(ReportRollup).from_select(
+                ["period", "period_start", "period_end", "machine_id", *_ROLLUP_FIELDS],
+                query,
+            )
+        )
+        total += result.rowcount
+    db.commit()
+    return total
+
+
+def report_rollups_need_rebuild(db: Session) -> bool:
+    """Есть отчеты, но суммы периодов еще не собраны (первый запуск)"""
+    has_rollups = db.query(exists().where(ReportRollup.id.isnot(None))).scalar()
+    has_reports = db.query(exists().where(Report.id.isnot(None))).scalar()
+    return has_reports and not has_rollups
+
+
+def get_report_period_totals(
+    db: Session,
+    period: str,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    machine_id: Optional[int] = None,
+) -> List[dict]:
+    """Суммы отчетов по периодам.
+
+    Периоды, целиком попадающие в диапазон, читаются из report_rollups;
+    неполные периоды на краях диапазона досчитываются по дневным отчетам.
+    Без machine_id возвращается итог по всему парку."""
+    totals: Dict[Tuple[datetime, Optional[int]], dict] = {}
+
+    def add(row):
+        key = (row.period_start, row.machine_id)
+        bucket = totals.setdefault(
+            key,
+            {
+                "period_start": row.period_start,
+                "machine_id": row.machine_id,
+                **{f: 0 for f in _ROLLUP_FIELDS},
+            },
+        )
+        for field in _ROLLUP_FIELDS:
+            bucket[field] += getattr(row, field) or 0
+
+    full_range = None
+    if period in ROLLUP_PERIODS:
+        query = select(
+            ReportRollup.period_start,
+            ReportRollup.period_end,
+            ReportRollup.machine_id,
+            *(getattr(ReportRollup, f) for f in _ROLLUP_FIELDS),
+        ).where(ReportRollup.period == period, ReportRollup.records_count > 0)
+        if machine_id is not None:
+            query = query.where(ReportRollup.machine_id == machine_id)
+        else:
+            query = query.where(ReportRollup.machine_id.is_(None))
+        if start_date:
+            query = query.where(ReportRollup.period_start >= start_date)
+        if end_date:
+            # Последний день периода должен попадать в диапазон
+            query = query.where(
+                ReportRollup.period_end - literal_column("interval '1 day'") <= end_date
+            )
+        rows = db.execute(query).all()
+        for row in rows:
+            add(row)
+        if rows:
+            full_range = (
+                min(row.period_start for row in rows),
+                max(row.period_end for row in rows),
+            )
+
+    day_rows = select(
+        period_start_expr(Report.report_date, period).label("period_start"),
+        Report.machine_id,
+        Report.revenue,
+        Report.profit,
+        Report.toy_consumption,
+        Report.rent_cost,
+        func.coalesce(func.nullif(Report.days_count, 0), 1).label("days_count"),
+    )
+    if machine_id is not None:
+        day_rows = day_rows.where(Report.machine_id == machine_id)
+    if start_date:
+        day_rows = day_rows.where(Report.report_date >= start_date)
+    if end_date:
+        day_rows = day_rows.where(Report.report_date <= end_date)
+    if full_range:
+        # Все отчеты между первым и последним полным периодом уже учтены в суммах
+        day_rows = day_rows.where(
+            or_(
+                Report.report_date < full_range[0],
+                Report.report_date >= full_range[1],
+            )
+        )
+    day_rows = day_rows.subquery()
+    edge_query = select(
+        day_rows.c.period_start,
+        literal(machine_id, Integer).label("machine_id"),
+        func.sum(day_rows.c.revenue).label("revenue"),
+        func.sum(day_rows.c.profit).label("profit"),
+        func.sum(day_rows.c.toy_consumption).label("toy_consumption"),
+        func.sum(day_rows.c.rent_cost).label("rent_cost"),
+        func.sum(day_rows.c.days_count).label("days_count"),
+        func.count().label("records_count"),
+    ).group_by(day_rows.c.period_start)
+    for row in db.execute(edge_query).all():
+        add(row)
+
+    return sorted(
+        totals.values(), key=lambda t: (t["period_start"], t["machine_id"] or 0)
+    )
+
+
+# Поля сортировки детальных отчетов по периодам
+DETAILED_ORDER_FIELDS = (
+    "report_date",
+    "machine_name",
+    "revenue",
+    "profit",
+    "toy_consumption",
+    "rent_cost",
+    "plays_per_toy",
+    "days_count",
+)
+
+
+def _machine_period_buckets(
+    period: str,
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+    machine_id: Optional[int],
+):
+    """Подзапрос сумм по автоматам и периодам.
+
+    Полные периоды берутся из report_rollups, неполные на краях диапазона
+    группируются по дневным отчетам в том же запросе."""
+    full = select(
+        ReportRollup.machine_id,
+        ReportRollup.period_start,
+        ReportRollup.period_end,
+        ReportRollup.revenue,
+        ReportRollup.profit,
+        ReportRollup.toy_consumption,
+        ReportRollup.rent_cost,
+        ReportRollup.days_count,
+    ).where(
+        ReportRollup.period == period,
+        ReportRollup.machine_id.isnot(None),
+        ReportRollup.records_count > 0,
+    )
+    if machine_id is not None:
+        full = full.where(ReportRollup.machine_id == machine_id)
+    if start_date:
+        full = full.where(ReportRollup.period_start >= start_date)
+    if end_date:
+        full = full.where(
+            ReportRollup.period_end - literal_column("interval '1 day'") <= end_date
+        )
+    full = full.cte("full_periods")
+    bounds = select(
+        func.min(full.c.period_start).label("lo"),
+        func.max(full.c.period_end).label("hi"),
+    ).cte("full_bounds")
+
+    day_rows = (
+        select(
+            period_start_expr(Report.report_date, period).label("period_start"),
+            Report.machine_id,
+            Report.revenue,
+            Report.profit,
+            Report.toy_consumption,
+            Report.rent_cost,
+            func.coalesce(func.nullif(Report.days_count, 0), 1).label("days_count"),
+        )
+        .select_from(Report)
+        .join(bounds, literal(True))
+        .where(
+            # Отчеты между первым и последним полным периодом уже учтены в суммах
+            or_(
+                bounds.c.lo.is_(None),
+                Report.report_date < bounds.c.lo,
+                Report.report_date >= bounds.c.hi,
+            )
+        )
+    )
+    if machine_id is not None:
+        day_rows = day_rows.where(Report.machine_id == machine_id)
+    if start_date:
+        day_rows = day_rows.where(Report.report_date >= start_date)
+    if end_date:
+        day_rows = day_rows.where(Report.report_date <= end_date)
+    day_rows = day_rows.subquery("day_rows")
+    edge = select(
+        day_rows.c.machine_id,
+        day_rows.c.period_start,
+        period_end_expr(day_rows.c.period_start, period),
+        func.sum(day_rows.c.revenue),
+        func.sum(day_rows.c.profit),
+        func.sum(day_rows.c.toy_consumption),
+        func.sum(day_rows.c.rent_cost),
+        func.sum(day_rows.c.days_count),
+    ).group_by(day_rows.c.machine_id, day_rows.c.period_start)
+
+    return union_all(select(full), edge).subquery("buckets")
+
+
+def machine_period_reports_query(
+    period: str,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    machine_id: Optional[int] = None,
+    order_by: str = "report_date",
+    order_direction: str = "desc",
+    skip: int = 0,
+    limit: Optional[int] = None,
+):
+    """Запрос отчетов по автоматам за период: одна строка на автомат и период.
+
+    Для периодов из ROLLUP_PERIODS строки - суммы за период с датой формирования
+    (последний день периода или текущий момент), для остальных - дневные отчеты.
+    Сортировка и пагинация выполняются в БД."""
+    if period in ROLLUP_PERIODS:
+        buckets = _machine_period_buckets(period, start_date, end_date, machine_id)
+        revenue = buckets.c.revenue
+        toy_consumption = buckets.c.toy_consumption
+        rows = select(
+            buckets.c.machine_id,
+            Machine.name.label("machine_name"),
+            buckets.c.period_start,
+            func.least(
+                buckets.c.period_end - literal_column("interval '1 day'"), func.now()
+            ).label("report_date"),
+            revenue.label("revenue"),
+            buckets.c.profit.label("profit"),
+            toy_consumption.label("toy_consumption"),
+            buckets.c.rent_cost.label("rent_cost"),
+            buckets.c.days_count.label("days_count"),
+            case(
+                (
+                    toy_consumption > 0,
+                    revenue / settings.coin_price_rub / toy_consumption,
+                ),
+                else_=0,
+            ).label("plays_per_toy"),
+        ).join(Machine, Machine.id == buckets.c.machine_id)
+    else:
+        rows = select(
+            Report.machine_id,
+            Machine.name.label("machine_name"),
+            Report.report_date.label("period_start"),
+            Report.report_date,
+            Report.revenue,
+            Report.profit,
+            Report.toy_consumption,
+            Report.rent_cost,
+            Report.days_count,
+            Report.plays_per_toy,
+        ).join(Machine, Machine.id == Report.machine_id)
+        if machine_id is not None:
+            rows = rows.where(Report.machine_id == machine_id)
+        if start_date:
+            rows = rows.where(Report.report_date >= start_date)
+        if end_date:
+            rows = rows.where(Report.report_date <= end_date)
+    rows = rows.subquery("rows")
+
+    if order_by not in DETAILED_ORDER_FIELDS:
+        order_by = "report_date"
+    descending = order_direction.lower() == "desc"
+    primary = rows.c[order_by]
+    # Дневные отчеты по умолчанию идут по имени автомата по возрастанию
+    name_descending = descending and period in ROLLUP_PERIODS
+    query = select(rows).order_by(
+        primary.desc() if descending else primary.asc(),
+        rows.c.machine_name.desc() if name_descending else rows.c.machine_name.asc(),
+        rows.c.machine_id.desc() if name_descending else rows.c.machine_id.asc(),
+        rows.c.period_start.desc() if descending else rows.c.period_start.asc(),
+    )
+    if skip:
+        query = query.offset(skip)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
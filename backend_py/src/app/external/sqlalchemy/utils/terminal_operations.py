@@ -29,15 +29,13 @@ def get_terminal_operation(
     )
 
 
-def get_terminal_operations(
+def terminal_operations_query(
     db: Session,
-    skip: int = 0,
-    limit: int = 100,
     operation_date: Optional[date | datetime] = None,
     terminal_id: Optional[int] = None,
     is_closed: Optional[bool] = None,
-) -> List[TerminalOperation]:
-    """Получить список операций терминалов с фильтрацией"""
+):
+    """Запрос операций терминалов с фильтрами списка"""
     query = db.query(TerminalOperation)
 
     if operation_date is not None:
@@ -49,16 +47,24 @@ def get_terminal_operations(
     if is_closed is not None:
         query = query.filter(TerminalOperation.is_closed == is_closed)
 
-    return (
-        query.order_by(
-            TerminalOperation.operation_date.desc(), TerminalOperation.terminal_id
-        )
-        .offset(skip)
-        .limit(limit)
-        .all()
+    return query.order_by(
+        TerminalOperation.operation_date.desc(), TerminalOperation.terminal_id
     )
 
 
+def get_terminal_operations(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    operation_date: Optional[date | datetime] = None,
+    terminal_id: Optional[int] = None,
+    is_closed: Optional[bool] = None,
+) -> List[TerminalOperation]:
+    """Получить список операций терминалов с фильтрацией"""
+    query = terminal_operations_query(db, operation_date, terminal_id, is_closed)
+    return query.offset(skip).limit(limit).all()
+
+
 def create_terminal_operation(
     db: Session, operation_data: TerminalOperationCreate
 ) -> TerminalOperation:
@@ -0,0 +1,177 @@
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, List, Tuple
+
+from sqlalchemy import Integer, column, delete, func, select, true, values
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from ..models import (
+    InventoryMovement,
+    InventoryMovementItem,
+    Machine,
+    MachineToyCostLedger,
+)
+
+
+def record_machine_load(db: Session, movement: InventoryMovement) -> None:
+    """Добавить проведенную загрузку автомата в накопительный итог.
+
+    Загрузка задним числом сдвигает итоги всех более поздних записей автомата."""
+    if movement.movement_type != "load_machine" or not movement.to_machine_id:
+        return
+
+    quantity = Decimal(0)
+    cost = Decimal(0)
+    for item in movement.items:
+        item_qty = Decimal(item.quantity or 0)
+        quantity += item_qty
+        cost += item_qty * Decimal(item.price or 0)
+
+    # Записи одного автомата добавляются последовательно
+    db.query(Machine.id).filter(
+        Machine.id == movement.to_machine_id
+    ).with_for_update().one()
+
+    previous = (
+        db.query(MachineToyCostLedger)
+        .filter(
+            MachineToyCostLedger.machine_id == movement.to_machine_id,
+            MachineToyCostLedger.document_date <= movement.document_date,
+        )
+        .order_by(
+            MachineToyCostLedger.document_date.desc(), MachineToyCostLedger.id.desc()
+        )
+        .first()
+    )
+    db.query(MachineToyCostLedger).filter(
+        MachineToyCostLedger.machine_id == movement.to_machine_id,
+        MachineToyCostLedger.document_date > movement.document_date,
+    ).update(
+        {
+            MachineToyCostLedger.total_quantity: MachineToyCostLedger.total_quantity
+            + quantity,
+            MachineToyCostLedger.total_cost: MachineToyCostLedger.total_cost + cost,
+        },
+        synchronize_session=False,
+    )
+    db.add(
+        MachineToyCostLedger(
+            machine_id=movement.to_machine_id,
+            movement_id=movement.id,
+            document_date=movement.document_date,
+            quantity=quantity,
+            cost=cost,
+            total_quantity=(previous.total_quantity if previous else 0) + quantity,
+            total_cost=(previous.total_cost if previous else 0) + cost,
+        )
+    )
+    db.flush()
+
+
+def get_toy_cost_totals(
+    db: Session, machine_ids: List[int], on_date: datetime
+) -> Dict[int, Tuple[Decimal, Decimal]]:
+    """Итог загрузок автоматов на дату: одна индексная выборка на автомат.
+
+    Возвращает {machine_id: (total_qty, total_cost)}."""
+    if not machine_ids:
+        return {}
+    machines = values(column("machine_id", Integer), name="machines").data(
+        [(machine_id,) for machine_id in machine_ids]
+    )
+    latest = (
+        select(MachineToyCostLedger.total_quantity, MachineToyCostLedger.total_cost)
+        .where(
+            MachineToyCostLedger.machine_id == machines.c.machine_id,
+            MachineToyCostLedger.document_date <= on_date,
+        )
+        .order_by(
+            MachineToyCostLedger.document_date.desc(), MachineToyCostLedger.id.desc()
+        )
+        .limit(1)
+        .lateral("latest")
+    )
+    rows = db.execute(
+        select(machines.c.machine_id, latest.c.total_quantity, latest.c.total_cost)
+        .select_from(machines)
+        .join(latest, true())
+    ).all()
+    return {
+        machine_id: (Decimal(total_qty), Decimal(total_cost))
+        for machine_id, total_qty, total_cost in rows
+    }
+
+
+def rebuild_toy_cost_ledger(db: Session) -> int:
+    """Пересобрать накопительный итог по всем проведенным загрузкам автоматов"""
+    db.execute(delete(MachineToyCostLedger))
+    item_qty = func.coalesce(InventoryMovementItem.quantity, 0)
+    loads = (
+        select(
+            InventoryMovement.to_machine_id.label("machine_id"),
+            InventoryMovement.id.label("movement_id"),
+            InventoryMovement.document_date,
+            func.coalesce(func.sum(item_qty), 0).label("quantity"),
+            func.coalesce(
+                func.sum(item_qty * func.coalesce(InventoryMovementItem.price, 0)), 0
+            ).label("cost"),
+        )
+        .outerjoin(
+            InventoryMovementItem,
+            InventoryMovementItem.movement_id == InventoryMovement.id,
+        )
+        .where(
+            InventoryMovement.movement_type == "load_machine",
+            InventoryMovement.to_machine_id.isnot(None),
+            InventoryMovement.executed_at.isnot(None),
+        )
+        .group_by(InventoryMovement.id)
+        .subquery()
+    )
+    running = {
+        "partition_by": loads.c.machine_id,
+        "order_by": (loads.c.document_date, loads.c.movement_id),
+    }
+    result = db.execute(
+        insert(MachineToyCostLedger).from_select(
+            [
+                "machine_id",
+                "movement_id",
+                "document_date",
+                "quantity",
+                "cost",
+                "total_quantity",
+                "total_cost",
+            ],
+            select(
+                loads.c.machine_id,
+                loads.c.movement_id,
+                loads.c.document_date,
+                loads.c.quantity,
+                loads.c.cost,
+                func.sum(loads.c.quantity).over(**running),
+                func.sum(loads.c.cost).over(**running),
+            )
+            # id записей идут в том же порядке, что и накопительный итог
+            .order_by(loads.c.document_date, loads.c.movement_id),
+        )
+    )
+    db.commit()
+    return result.rowcount
+
+
+def toy_cost_ledger_needs_rebuild(db: Session) -> bool:
+    """Есть проведенные загрузки автоматов, но накопительный итог пуст"""
+    has_ledger = db.query(MachineToyCostLedger.id).limit(1).first() is not None
+    has_loads = (
+        db.query(InventoryMovement.id)
+        .filter(
+            InventoryMovement.movement_type == "load_machine",
+            InventoryMovement.executed_at.isnot(None),
+        )
+        .limit(1)
+        .first()
+        is not None
+    )
+    return has_loads and not has_ledger
@@ -5,6 +5,7 @@ from typing import List, Optional
 from datetime import datetime, date
 from decimal import Decimal
 from .accounts import update_account_balance as _update_account_balance
+from .pagination import Page, PageRequest, paginate
 
 
 def get_transaction(db: Session, transaction_id: int) -> Optional[Transaction]:
@@ -12,10 +13,8 @@ def get_transaction(db: Session, transaction_id: int) -> Optional[Transaction]:
     return db.query(Transaction).filter(Transaction.id == transaction_id).first()
 
 
-def get_transactions(
+def transactions_query(
     db: Session,
-    skip: int = 0,
-    limit: int = 100,
     account_id: Optional[int] = None,
     category_id: Optional[int] = None,
     counterparty_id: Optional[int] = None,
@@ -25,8 +24,8 @@ def get_transactions(
     date_to: Optional[date | datetime] = None,
     is_confirmed: Optional[bool] = None,
     search: Optional[str] = None,
-) -> List[Transaction]:
-    """Получить список транзакций с фильтрацией"""
+):
+    """Запрос транзакций с фильтрами списка, новые сверху"""
     query = db.query(Transaction)
 
     # Фильтры
@@ -62,7 +61,54 @@ def get_transactions(
         )
         query = query.filter(search_filter)
 
-    return query.order_by(Transaction.date.desc()).offset(skip).limit(limit).all()
+    return query.order_by(Transaction.date.desc())
+
+
+def get_transactions(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    account_id: Optional[int] = None,
+    category_id: Optional[int] = None,
+    counterparty_id: Optional[int] = None,
+    transaction_type_id: Optional[int] = None,
+    machine_id: Optional[int] = None,
+    date_from: Optional[date | datetime] = None,
+    date_to: Optional[date | datetime] = None,
+    is_confirmed: Optional[bool] = None,
+    search: Optional[str] = None,
+) -> List[Transaction]:
+    """Получить список транзакций с фильтрацией"""
+    query = transactions_query(
+        db,
+        account_id=account_id,
+        category_id=category_id,
+        counterparty_id=counterparty_id,
+        transaction_type_id=transaction_type_id,
+        machine_id=machine_id,
+        date_from=date_from,
+        date_to=date_to,
+        is_confirmed=is_confirmed,
+        search=search,
+    )
+    return query.offset(skip).limit(limit).all()
+
+
+def get_transactions_page(
+    db: Session,
+    limit: int = 100,
+    skip: int = 0,
+    cursor: Optional[str] = None,
+    total: Optional[str] = None,
+    **filters,
+) -> Page:
+    """Страница транзакций: offset или курсор по (date, id)"""
+    return paginate(
+        db,
+        transactions_query(db, **filters),
+        (Transaction.date, Transaction.id),
+        PageRequest(limit, skip=skip, cursor=cursor, total=total),
+    )
 
 
 def get_transactions_by_account(
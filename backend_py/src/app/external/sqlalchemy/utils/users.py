@@ -1,4 +1,4 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 from ..models import User, UserOwner, Role
 from typing import List, Optional
 from datetime import datetime
@@ -9,6 +9,16 @@ def get_user_by_id(db: Session, user_id: int) -> Optional[User]:
     return db.query(User).filter(User.id == user_id).first()
 
 
+# Получить пользователя по id вместе с ролью (одним запросом)
+def get_user_with_role(db: Session, user_id: int) -> Optional[User]:
+    return (
+        db.query(User)
+        .options(joinedload(User.role))
+        .filter(User.id == user_id)
+        .first()
+    )
+
+
 # Получить пользователя по username
 def get_user_by_username(db: Session, username: str) -> Optional[User]:
     return db.query(User).filter(User.username == username).first()
@@ -1,19 +1,72 @@
 import time
 import uuid
 import json
-from typing import Optional, Dict, Any, Tuple
-from starlette.middleware.base import BaseHTTPMiddleware
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Tuple
 from starlette.requests import Request
-from starlette.responses import Response
-from starlette.types import ASGIApp
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from sqlalchemy.orm import Session
 
-from app.external.sqlalchemy.session import SessionLocal
 from app.external.sqlalchemy.utils.audit import log_user_action
+from app.services.audit_changes import bind_request, data_change_capture, reset_request
+from app.services.audit_writer import audit_log_writer
 
+# Маппинг API эндпоинтов на таблицы
+TABLE_MAPPING = {
+    'auth': None,  # Добавляем auth для избежания ошибок
+    'users': 'users',
+    'machines': 'machines',
+    'terminals': 'terminals',
+    'owners': 'owners',
+    'counterparties': 'counterparties',
+    'transactions': 'transactions',
+    'accounts': 'accounts',
+    'items': 'items',
+    'warehouses': 'warehouses',
+    'inventory-movements': 'inventory_movements',
+    'reports': 'reports',
+    'info-cards': 'info_cards',
+    'terminal-operations': 'terminal_operations',
+    'documents': 'documents',
+    'audit': None,  # Аудит не привязан к конкретной таблице
+    'status': None,  # Статус системы
+}
 
-class AuditMiddleware(BaseHTTPMiddleware):
-    """Middleware для автоматического логирования HTTP запросов"""
+BODY_METHODS = frozenset(("POST", "PUT", "PATCH"))
+
+
+class _BodyTee:
+    """Копия тела запроса по мере чтения приложением, не больше limit байт.
+
+    Тело не буферизуется заранее: куски копируются, пока укладываются
+    в лимит, дальше только считается общий размер"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.size = 0
+        self._chunks: List[bytes] = []
+
+    def feed(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.size <= self.limit:
+            self._chunks.append(chunk)
+        else:
+            self._chunks.clear()
+
+    def parse(self) -> Optional[Dict[str, Any]]:
+        """Распарсенное JSON тело или отметка о пропуске"""
+        if self.size > self.limit:
+            return {"_truncated": f"Body too large ({self.size} bytes)"}
+        if not self.size:
+            return None
+        try:
+            return json.loads(b"".join(self._chunks).decode('utf-8'))
+        except Exception as e:
+            return {"_error": f"Failed to parse body: {str(e)}"}
+
+
+class AuditMiddleware:
+    """Middleware для автоматического логирования HTTP запросов (чистый ASGI)"""
     
     def __init__(
         self, 
@@ -25,7 +78,7 @@ class AuditMiddleware(BaseHTTPMiddleware):
         log_response_body: bool = False,
         max_body_size: int = 1024 * 10  # 10KB
     ):
-        super().__init__(app)
+        self.app = app
         self.excluded_paths = excluded_paths or [
             "/api/docs",
             "/api/redoc", 
@@ -41,31 +94,22 @@ class AuditMiddleware(BaseHTTPMiddleware):
         self.log_request_body = log_request_body
         self.log_response_body = log_response_body
         self.max_body_size = max_body_size
+        # Префиксы одним кортежем для str.startswith
+        self._excluded_prefixes = tuple(self.excluded_paths)
+        self._excluded_methods = frozenset(self.excluded_methods)
 
-    def _should_log_request(self, request: Request) -> bool:
+    def _should_log_request(self, method: str, path: str) -> bool:
         """Определить, нужно ли логировать запрос"""
         # Проверяем метод
-        if request.method in self.excluded_methods:
+        if method in self._excluded_methods:
             return False
         
         # Проверяем GET запросы, если они отключены
-        if request.method == "GET" and not self.log_get_requests:
+        if method == "GET" and not self.log_get_requests:
             return False
         
         # Проверяем путь
-        path = request.url.path
-        for excluded_path in self.excluded_paths:
-            if path.startswith(excluded_path):
-                return False
-        
-        return True
-
-    def _extract_user_info(self, request: Request) -> Optional[int]:
-        """Извлечь информацию о пользователе из request.state"""
-        try:
-            return getattr(request.state, 'user_id', None)
-        except:
-            return None
+        return not path.startswith(self._excluded_prefixes)
 
     def _get_client_ip(self, request: Request) -> Optional[str]:
         """Получить IP адрес клиента"""
@@ -84,60 +128,21 @@ class AuditMiddleware(BaseHTTPMiddleware):
 
     def _extract_table_and_id_from_path(self, path: str, method: str) -> Tuple[Optional[str], Optional[int]]:
         """Извлечь название таблицы и ID записи из пути API"""
-        try:
-            # Удаляем /api/ префикс
-            if path.startswith('/api/'):
-                path = path[5:]
-            
-            parts = path.strip('/').split('/')
-            if len(parts) == 0:
-                return None, None
-            
-            # Первая часть - обычно название ресурса
-            resource = parts[0]
-            
-            # Маппинг API эндпоинтов на таблицы
-            table_mapping = {
-                'auth': None,  # Добавляем auth для избежания ошибок
-                'users': 'users',
-                'machines': 'machines',
-                'terminals': 'terminals',
-                'owners': 'owners',
-                'counterparties': 'counterparties',
-                'transactions': 'transactions',
-                'accounts': 'accounts',
-                'items': 'items',
-                'warehouses': 'warehouses',
-                'inventory-movements': 'inventory_movements',
-                'reports': 'reports',
-                'info-cards': 'info_cards',
-                'terminal-operations': 'terminal_operations',
-                'documents': 'documents',
-                'audit': None,  # Аудит не привязан к конкретной таблице
-                'status': None,  # Статус системы
-            }
-            
-            table_name = table_mapping.get(resource)
-            
-            # Пытаемся извлечь ID записи
-            record_id = None
-            if len(parts) >= 2 and table_name is not None:
-                # Только для ресурсов с таблицами пытаемся извлечь ID
-                try:
-                    # Проверяем что вторая часть пути - это число (ID записи)
-                    if parts[1].isdigit():
-                        record_id = int(parts[1])
-                    # Если не число, то это специальный эндпоинт, не ID
-                except (ValueError, IndexError):
-                    # Если не удается преобразовать в int, это не ID записи
-                    record_id = None
-            
-            return table_name, record_id
-            
-        except Exception as e:
-            # Логируем ошибку, но не ломаем middleware
-            print(f"Error extracting table and ID from path '{path}': {e}")
-            return None, None
+        # Удаляем /api/ префикс
+        if path.startswith('/api/'):
+            path = path[5:]
+
+        parts = path.strip('/').split('/')
+
+        # Первая часть - обычно название ресурса
+        table_name = TABLE_MAPPING.get(parts[0])
+
+        # ID записи - вторая часть пути, если это число (иначе это специальный эндпоинт)
+        record_id = None
+        if table_name is not None and len(parts) >= 2 and parts[1].isdigit():
+            record_id = int(parts[1])
+
+        return table_name, record_id
 
     def _determine_action(self, method: str, path: str) -> str:
         """Определить тип действия на основе HTTP метода и пути"""
@@ -156,113 +161,140 @@ class AuditMiddleware(BaseHTTPMiddleware):
         else:
             return method.upper()
 
-    async def _read_body(self, request: Request) -> Optional[Dict[str, Any]]:
-        """Прочитать и распарсить тело запроса"""
-        try:
-            if not self.log_request_body:
-                return None
-            
-            content_type = request.headers.get('content-type', '')
-            if 'application/json' not in content_type:
-                return None
-            
-            # Читаем тело запроса
-            body = await request.body()
-            if len(body) > self.max_body_size:
-                return {"_truncated": f"Body too large ({len(body)} bytes)"}
-            
-            if body:
-                return json.loads(body.decode('utf-8'))
-            
-        except Exception as e:
-            return {"_error": f"Failed to parse body: {str(e)}"}
-        
-        return None
+    def _create_body_tee(self, request: Request) -> Optional[_BodyTee]:
+        """Копия тела для JSON запросов с телом, если его логирование включено"""
+        if not self.log_request_body or request.method not in BODY_METHODS:
+            return None
+        if 'application/json' not in request.headers.get('content-type', ''):
+            return None
+        return _BodyTee(self.max_body_size)
 
-    async def dispatch(self, request: Request, call_next) -> Response:
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
         # Проверяем, нужно ли логировать
-        if not self._should_log_request(request):
-            return await call_next(request)
-        
+        if scope["type"] != "http" or not self._should_log_request(
+            scope["method"], scope["path"]
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        request = Request(scope)
+
         # Генерируем уникальный ID запроса
         request_id = str(uuid.uuid4())
-        
+
         # Засекаем время начала
-        start_time = time.time()
-        
-        # Извлекаем информацию о запросе
-        user_id = self._extract_user_info(request)
-        ip_address = self._get_client_ip(request)
-        user_agent = request.headers.get('User-Agent')
+        start_time = time.perf_counter()
+
+        # Копируем тело запроса по мере чтения (только для POST/PUT/PATCH)
+        body_tee = self._create_body_tee(request)
+        receive_app = receive
+        if body_tee is not None:
+            async def receive_app() -> Message:
+                message = await receive()
+                if message["type"] == "http.request":
+                    body_tee.feed(message.get("body", b""))
+                return message
+
+        status_code = 500
+
+        async def send_app(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        # Контекст запроса для журнала изменений данных
+        context_token = None
+        if data_change_capture.enabled:
+            context_token = bind_request(
+                {
+                    "scope": scope,
+                    "request_id": request_id,
+                    "ip_address": self._get_client_ip(request),
+                    "user_agent": request.headers.get('User-Agent'),
+                }
+            )
+
+        # Выполняем запрос; необработанное исключение записывается как 500
+        try:
+            await self.app(scope, receive_app, send_app)
+        finally:
+            if context_token is not None:
+                reset_request(context_token)
+            await self._write_log(
+                request,
+                request_id=request_id,
+                status_code=status_code,
+                duration_ms=int((time.perf_counter() - start_time) * 1000),
+                request_body=body_tee.parse() if body_tee is not None else None,
+            )
+
+    async def _write_log(
+        self,
+        request: Request,
+        request_id: str,
+        status_code: int,
+        duration_ms: int,
+        request_body: Optional[Dict[str, Any]],
+    ):
+        """Поставить запрос в очередь записи журнала аудита"""
         method = request.method
         path = request.url.path
-        action = self._determine_action(method, path)
         table_name, record_id = self._extract_table_and_id_from_path(path, method)
-        
-        # Читаем тело запроса для логирования (только для POST/PUT/PATCH)
-        request_body = None
-        if method in ["POST", "PUT", "PATCH"]:
-            request_body = await self._read_body(request)
-        
-        # Выполняем запрос
-        response = await call_next(request)
-        
-        # Вычисляем время выполнения
-        duration_ms = int((time.time() - start_time) * 1000)
-        
-        # Определяем сообщение об ошибке
-        error_message = None
-        if response.status_code >= 400:
-            if response.status_code == 401:
-                error_message = "Unauthorized"
-            elif response.status_code == 403:
-                error_message = "Forbidden"
-            elif response.status_code == 404:
-                error_message = "Not Found"
-            elif response.status_code >= 500:
-                error_message = "Internal Server Error"
-            else:
-                error_message = f"HTTP {response.status_code}"
-        
-        # Логируем в базу данных (в отдельной сессии)
+
+        # Объединяем техническую информацию с основной записью
+        technical_info = {
+            "request_id": request_id,
+            "duration_ms": duration_ms,
+            "status_code": status_code,
+            "query_params": dict(request.query_params) if request.query_params else None,
+        }
+
+        # Объединяем request_body с технической информацией
+        combined_values = {}
+        if isinstance(request_body, dict):
+            combined_values.update(request_body)
+        combined_values.update(technical_info)
+
         try:
-            db = SessionLocal()
-            try:
-                # Объединяем техническую информацию с основной записью
-                technical_info = {
+            await audit_log_writer.put(
+                {
+                    # Пользователь известен после AuthMiddleware, который выполняется внутри
+                    "user_id": getattr(request.state, 'user_id', None),
+                    "action": self._determine_action(method, path),
+                    "table_name": table_name,
+                    "record_id": record_id,
+                    "old_values": None,  # Для HTTP логирования old_values не применимо
+                    "new_values": combined_values,
+                    "ip_address": self._get_client_ip(request),
+                    "user_agent": request.headers.get('User-Agent'),
+                    "endpoint": path,
+                    "method": method,
                     "request_id": request_id,
                     "duration_ms": duration_ms,
-                    "status_code": response.status_code,
-                    "query_params": dict(request.query_params) if request.query_params else None,
+                    "status_code": status_code,
+                    "error_message": self._error_message(status_code),
+                    "created_at": datetime.utcnow(),
                 }
-                
-                # Объединяем request_body с технической информацией
-                combined_values = {}
-                if request_body:
-                    combined_values.update(request_body)
-                combined_values.update(technical_info)
-                
-                log_user_action(
-                    db=db,
-                    user_id=user_id,
-                    action=action,
-                    table_name=table_name,
-                    record_id=record_id,
-                    old_values=None,  # Для HTTP логирования old_values не применимо
-                    new_values=combined_values,
-                    ip_address=ip_address,
-                    user_agent=user_agent,
-                    endpoint=path,
-                    method=method,
-                )
-            finally:
-                db.close()
-                
+            )
         except Exception as e:
             # Логирование не должно ломать основной запрос
             print(f"Audit logging failed: {str(e)}")
-        
-        return response
+
+    @staticmethod
+    def _error_message(status_code: int) -> Optional[str]:
+        """Сообщение об ошибке по статусу ответа"""
+        if status_code < 400:
+            return None
+        if status_code == 401:
+            return "Unauthorized"
+        elif status_code == 403:
+            return "Forbidden"
+        elif status_code == 404:
+            return "Not Found"
+        elif status_code >= 500:
+            return "Internal Server Error"
+        return f"HTTP {status_code}"
 
 
 def create_audit_entry(
@@ -1,19 +1,28 @@
 from fastapi import Request, HTTPException, status
 from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
-from typing import List, Set
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from typing import List, Optional
 import re
 
 from app.api.auth.jwt import verify_token
 from app.external.sqlalchemy.session import SessionLocal
-from app.external.sqlalchemy.utils.users import get_user_by_id
+from app.external.sqlalchemy.utils.users import get_user_with_role
+from app.external.sqlalchemy.utils.api_tokens import (
+    get_api_token_by_hash,
+    hash_token,
+    is_api_token_allowed,
+)
+from app.services.api_token_usage import api_token_usage
+from app.services.auth_cache import api_token_cache, principal_cache, token_claims_cache
+from app.services.rate_limit import api_token_rate_limiter, rate_limit_headers
 
 
-class AuthMiddleware(BaseHTTPMiddleware):
-    """Middleware для автоматической аутентификации всех API эндпоинтов"""
+class AuthMiddleware:
+    """Middleware для автоматической аутентификации всех API эндпоинтов (чистый ASGI)"""
     
-    def __init__(self, app, excluded_paths: List[str] = None):
-        super().__init__(app)
+    def __init__(self, app: ASGIApp, excluded_paths: List[str] = None):
+        self.app = app
         
         # Пути, которые не требуют аутентификации
         default_excluded = [
@@ -27,7 +36,7 @@ class AuthMiddleware(BaseHTTPMiddleware):
             "/favicon.ico",
         ]
         
-        self.excluded_paths = set(default_excluded + (excluded_paths or []))
+        self.excluded_paths = frozenset(default_excluded + (excluded_paths or []))
         
         # Паттерны для исключения (например, статические файлы)
         self.excluded_patterns = [
@@ -35,23 +44,17 @@ class AuthMiddleware(BaseHTTPMiddleware):
             r"^/assets/.*",
             r"^/api/documents/download/.*",  # Скачивание по токену
         ]
+        # Все паттерны одним регулярным выражением, скомпилированным заранее
+        self._excluded_re = re.compile("|".join(f"(?:{p})" for p in self.excluded_patterns))
     
     def _is_excluded_path(self, path: str) -> bool:
         """Проверяет, исключен ли путь из аутентификации"""
-        # Проверяем точные совпадения
-        if path in self.excluded_paths:
-            return True
-            
-        # Проверяем паттерны
-        for pattern in self.excluded_patterns:
-            if re.match(pattern, path):
-                return True
-                
-        # Проверяем API пути, которые не начинаются с /api (например, статика)
+        # Пути не под /api (например, статика) не проверяются
         if not path.startswith("/api"):
             return True
-            
-        return False
+
+        # Проверяем точные совпадения и паттерны
+        return path in self.excluded_paths or self._excluded_re.match(path) is not None
     
     def _extract_token_from_request(self, request: Request) -> tuple[str | None, str]:
         """
@@ -77,15 +80,51 @@ class AuthMiddleware(BaseHTTPMiddleware):
         else:
             return None, "jwt"
     
-    async def dispatch(self, request: Request, call_next):
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
         # Проверяем, нужна ли аутентификация для этого пути
-        if self._is_excluded_path(request.url.path):
-            return await call_next(request)
-        
         # Пропускаем OPTIONS запросы (CORS preflight)
-        if request.method == "OPTIONS":
-            return await call_next(request)
-        
+        if self._is_excluded_path(scope["path"]) or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        request = Request(scope)
+        error_response = await self._authenticate(request)
+        if error_response is not None:
+            await error_response(scope, receive, send)
+            return
+
+        # Лимит запросов API токена
+        rate_limit = getattr(request.state, "rate_limit", None)
+        if rate_limit is None:
+            await self.app(scope, receive, send)
+            return
+        if not rate_limit.allowed:
+            response = JSONResponse(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                content={
+                    "detail": "API token rate limit exceeded",
+                    "error": "rate_limit_exceeded"
+                },
+                headers=rate_limit_headers(rate_limit),
+            )
+            await response(scope, receive, send)
+            return
+
+        headers = rate_limit_headers(rate_limit)
+
+        async def send_with_rate_limit(message: Message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).update(headers)
+            await send(message)
+
+        await self.app(scope, receive, send_with_rate_limit)
+
+    async def _authenticate(self, request: Request) -> Optional[JSONResponse]:
+        """Аутентифицировать запрос; ответ с ошибкой, если токен не принят"""
         # Извлекаем токен
         token, token_type = self._extract_token_from_request(request)
         if not token:
@@ -107,7 +146,7 @@ class AuthMiddleware(BaseHTTPMiddleware):
                     raise ValueError("Invalid API token")
             else:
                 # Обработка JWT токена (по умолчанию)
-                payload = verify_token(token)
+                payload = token_claims_cache.get(token, verify_token)
                 if payload is None:
                     raise ValueError("Invalid token")
                     
@@ -127,57 +166,68 @@ class AuthMiddleware(BaseHTTPMiddleware):
                 },
                 headers={"WWW-Authenticate": "Bearer"},
             )
-
-        
-        # Продолжаем обработку запроса
-        response = await call_next(request)
-        return response
+        return None
     
     async def _handle_jwt_user(self, request: Request, user_id: int):
-        """Обработка пользователя для JWT токена"""
+        """Обработка пользователя для JWT токена (пользователь берется из кэша)"""
+        principal = principal_cache.get(int(user_id), lambda: self._load_user(user_id))
+        if principal is None:
+            raise ValueError("User not found")
+
+        if not principal.is_active:
+            raise ValueError("User account is inactive")
+
+        # Добавляем информацию о пользователе в состояние запроса
+        request.state.current_user = principal.user
+        request.state.user_id = user_id
+        request.state.user_role = principal.role_name
+        request.state.auth_type = "jwt"
+
+    @staticmethod
+    def _load_user(user_id: int):
+        """Пользователь с ролью из БД, отсоединенный от закрытой сессии"""
         db = SessionLocal()
         try:
-            user = get_user_by_id(db, user_id)
-            if user is None:
-                raise ValueError("User not found")
-                
-            if not user.is_active:
-                raise ValueError("User account is inactive")
-            
-            # Добавляем информацию о пользователе в состояние запроса
-            request.state.current_user = user
-            request.state.user_id = user_id
-            request.state.user_role = user.role.name if user.role else None
-            request.state.auth_type = "jwt"
-            
+            return get_user_with_role(db, user_id)
         finally:
             db.close()
     
     async def _handle_api_token(self, request: Request, token: str) -> bool:
-        """Обработка API токена"""
-        from app.external.sqlalchemy.utils.api_tokens import validate_api_token
-        
+        """Обработка API токена (токен берется из кэша, использование пишется пачками)"""
         # Получаем IP адрес клиента
         ip_address = request.client.host if request.client else "127.0.0.1"
-        
+
+        token_hash = hash_token(token)
+        api_token = api_token_cache.get(token_hash, lambda: self._load_api_token(token_hash))
+        if not api_token or not is_api_token_allowed(api_token, ip_address):
+            return False
+
+        # Отклоненный по лимиту запрос не считается использованием
+        rate_limit = await api_token_rate_limiter.check_async(api_token)
+        request.state.rate_limit = rate_limit
+        if rate_limit is not None and not rate_limit.allowed:
+            api_token_usage.record_rejection(api_token.id)
+            return True
+        api_token_usage.record(api_token.id)
+
+        # Сохраняем информацию об API токене в request.state
+        request.state.api_token = api_token
+        request.state.user_id = api_token.created_by
+        request.state.auth_type = "api"
+
+        # Для совместимости также добавляем пользователя
+        if api_token.creator:
+            request.state.current_user = api_token.creator
+            request.state.user_role = api_token.creator.role.name if api_token.creator.role else None
+
+        return True
+
+    @staticmethod
+    def _load_api_token(token_hash: str):
+        """API токен с создателем и ролью из БД, отсоединенный от закрытой сессии"""
         db = SessionLocal()
         try:
-            api_token = validate_api_token(db, token, ip_address)
-            if not api_token:
-                return False
-            
-            # Сохраняем информацию об API токене в request.state
-            request.state.api_token = api_token
-            request.state.user_id = api_token.created_by
-            request.state.auth_type = "api"
-            
-            # Для совместимости также добавляем пользователя
-            if api_token.creator:
-                request.state.current_user = api_token.creator
-                request.state.user_role = api_token.creator.role.name if api_token.creator.role else None
-            
-            return True
-            
+            return get_api_token_by_hash(db, token_hash)
         finally:
             db.close()
 
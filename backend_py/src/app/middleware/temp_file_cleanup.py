@@ -1,29 +1,35 @@
 import os
-from pathlib import Path
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import ASGIApp
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 
-class TempFileCleanupMiddleware(BaseHTTPMiddleware):
-    """Middleware для очистки временных файлов после скачивания"""
+class TempFileCleanupMiddleware:
+    """Middleware для очистки временных файлов после скачивания (чистый ASGI)"""
     
     def __init__(self, app: ASGIApp):
-        super().__init__(app)
+        self.app = app
     
-    async def dispatch(self, request: Request, call_next):
-        response = await call_next(request)
-        
-        # Проверяем, есть ли заголовок с временным файлом
-        temp_file_path = response.headers.get("X-Temp-File")
-        
-        if temp_file_path and os.path.exists(temp_file_path):
-            try:
-                # Удаляем временный файл после отправки ответа
-                os.unlink(temp_file_path)
-                print(f"✅ Cleaned up temp file: {temp_file_path}")
-            except Exception as e:
-                print(f"❌ Error cleaning up temp file {temp_file_path}: {e}")
-        
-        return response
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
+        temp_file_path = None
+
+        async def send_app(message: Message):
+            nonlocal temp_file_path
+            # Проверяем, есть ли заголовок с временным файлом
+            if message["type"] == "http.response.start":
+                temp_file_path = Headers(raw=message["headers"]).get("X-Temp-File")
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_app)
+        finally:
+            # Удаляем временный файл после отправки ответа целиком
+            if temp_file_path and os.path.exists(temp_file_path):
+                try:
+                    os.unlink(temp_file_path)
+                    print(f"✅ Cleaned up temp file: {temp_file_path}")
+                except Exception as e:
+                    print(f"❌ Error cleaning up temp file {temp_file_path}: {e}")
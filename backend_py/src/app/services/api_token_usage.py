@@ -0,0 +1,117 @@
+"""
+Отложенная запись статистики использования API токенов
+"""
+
+import asyncio
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+from loguru import logger
+
+from app.external.sqlalchemy.session import SessionLocal
+from app.external.sqlalchemy.utils.api_tokens import (
+    add_tokens_rejections,
+    add_tokens_usage,
+)
+from app.settings import settings
+
+
+class ApiTokenUsageRecorder:
+    """Счетчики использования токенов в памяти со сбросом в БД пачками.
+
+    Запрос только увеличивает счетчик; воркер раз в flush_seconds пишет все
+    накопленное одним UPDATE, поэтому частые запросы интеграций не
+    конкурируют за строки api_tokens. Так же копятся отклонения по лимиту
+    запросов. Остаток сбрасывается при остановке."""
+
+    def __init__(self, flush_seconds: float):
+        self.flush_seconds = flush_seconds
+        self._usage: Dict[int, Tuple[int, datetime]] = {}
+        self._rejections: Dict[int, Tuple[int, datetime]] = {}
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _add(counters: Dict[int, Tuple[int, datetime]], token_id: int, count: int, at: datetime):
+        pending, pending_at = counters.get(token_id, (0, at))
+        counters[token_id] = (pending + count, max(pending_at, at))
+
+    def record(self, token_id: int):
+        """Учесть использование токена (потокобезопасно)"""
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            self._add(self._usage, token_id, 1, now)
+
+    def record_rejection(self, token_id: int):
+        """Учесть запрос, отклоненный по лимиту (потокобезопасно)"""
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            self._add(self._rejections, token_id, 1, now)
+
+    def pending(self) -> int:
+        """Количество токенов с несохраненной статистикой"""
+        with self._lock:
+            return len(self._usage.keys() | self._rejections.keys())
+
+    def _drain(self) -> Tuple[Dict[int, Tuple[int, datetime]], Dict[int, Tuple[int, datetime]]]:
+        with self._lock:
+            usage, self._usage = self._usage, {}
+            rejections, self._rejections = self._rejections, {}
+        return usage, rejections
+
+    def _write(self, db, write, batch: Dict[int, Tuple[int, datetime]], pending_attr: str) -> int:
+        if not batch:
+            return 0
+        try:
+            return write(db, batch)
+        except Exception as e:
+            db.rollback()
+            # Возвращаем счетчики, чтобы не потерять статистику
+            with self._lock:
+                counters = getattr(self, pending_attr)
+                for token_id, (count, at) in batch.items():
+                    self._add(counters, token_id, count, at)
+            logger.error(f"Error flushing API token {pending_attr.strip('_')}: {e}")
+            return 0
+
+    def flush(self) -> int:
+        """Синхронно записать накопленную статистику"""
+        usage, rejections = self._drain()
+        if not usage and not rejections:
+            return 0
+        db = SessionLocal()
+        try:
+            return self._write(db, add_tokens_usage, usage, "_usage") + self._write(
+                db, add_tokens_rejections, rejections, "_rejections"
+            )
+        finally:
+            db.close()
+
+    async def start(self):
+        """Запустить периодический сброс в текущем event loop"""
+        self._task = asyncio.create_task(self._run())
+        logger.info("API token usage writer started")
+
+    async def shutdown(self):
+        """Остановить воркер и записать остаток"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await asyncio.to_thread(self.flush)
+        logger.info("API token usage writer stopped")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            await asyncio.to_thread(self.flush)
+
+
+# Глобальный накопитель статистики API токенов
+api_token_usage = ApiTokenUsageRecorder(
+    flush_seconds=settings.api_token_usage_flush_seconds
+)
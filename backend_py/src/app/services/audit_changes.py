@@ -0,0 +1,216 @@
+"""
+Журнал изменений данных по событиям сессии SQLAlchemy
+"""
+
+from contextvars import ContextVar, Token
+from datetime import date, datetime
+from decimal import Decimal
+from enum import Enum
+from typing import Any, Dict, FrozenSet, List, Optional
+
+from loguru import logger
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app.services.audit_writer import audit_log_writer
+from app.settings import settings
+
+# Ключ session.info с изменениями, которые передаются в журнал после commit
+_PENDING_CHANGES = "audit_pending_changes"
+
+# Колонки, значения которых не попадают в журнал
+SECRET_COLUMNS = frozenset(
+    ("password_hash", "vendista_pass", "secrets", "token_hash", "bot_token")
+)
+MASKED_VALUE = "***"
+
+_request_context: ContextVar[Optional[Dict[str, Any]]] = ContextVar(
+    "audit_changes_request", default=None
+)
+
+
+def bind_request(context: Dict[str, Any]) -> Token:
+    """Привязать к текущему запросу request_id, IP, User-Agent и scope (для user_id)"""
+    return _request_context.set(context)
+
+
+def reset_request(token: Token):
+    _request_context.reset(token)
+
+
+def _json_value(value: Any) -> Any:
+    """Значение колонки в виде, пригодном для JSON"""
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f"<{len(value)} bytes>"
+    if isinstance(value, (dict, list)):
+        return value
+    return str(value)
+
+
+def _column_value(key: str, value: Any) -> Any:
+    return MASKED_VALUE if key in SECRET_COLUMNS else _json_value(value)
+
+
+class DataChangeCapture:
+    """Изменения аудируемых моделей из unit of work.
+
+    Значения берутся из истории атрибутов и уже загруженного состояния
+    объектов, без повторного чтения строк. Записи копятся в session.info
+    до commit и передаются писателю аудита одной пачкой; rollback их
+    отбрасывает. Не захватываются массовые UPDATE/DELETE запросами и
+    вставки через Core."""
+
+    def __init__(self, enabled: bool, tables: str):
+        self.enabled = enabled
+        self.tables: FrozenSet[str] = frozenset(
+            table.strip() for table in tables.split(",") if table.strip()
+        )
+        self.captured = 0
+
+    def is_audited(self, obj: Any) -> bool:
+        table = getattr(obj, "__tablename__", None)
+        return table is not None and table in self.tables
+
+    @staticmethod
+    def _record_id(state) -> Optional[int]:
+        """ID записи для одиночного целочисленного первичного ключа
+        (у новых объектов identity еще не назначена - берется из атрибутов)"""
+        mapper = state.mapper
+        if len(mapper.primary_key) != 1:
+            return None
+        key = mapper.get_property_by_column(mapper.primary_key[0]).key
+        record_id = state.dict.get(key)
+        return record_id if isinstance(record_id, int) else None
+
+    @staticmethod
+    def _loaded_values(state) -> Dict[str, Any]:
+        """Загруженные значения колонок записи; незагруженные (в т.ч.
+        серверные значения по умолчанию) не читаются"""
+        loaded = state.dict
+        return {
+            attr.key: _column_value(attr.key, loaded[attr.key])
+            for attr in state.mapper.column_attrs
+            if attr.key in loaded
+        }
+
+    @staticmethod
+    def _updated_values(state) -> Optional[tuple]:
+        """Старые и новые значения измененных колонок; старое известно,
+        только если атрибут был загружен до изменения"""
+        old_values, new_values = {}, {}
+        for attr in state.mapper.column_attrs:
+            history = state.attrs[attr.key].history
+            if not history.added and not history.deleted:
+                continue
+            new = history.added[0] if history.added else None
+            if history.deleted:
+                old = history.deleted[0]
+                if old == new:
+                    continue
+                old_values[attr.key] = _column_value(attr.key, old)
+            new_values[attr.key] = _column_value(attr.key, new)
+        if not new_values:
+            return None
+        return old_values, new_values
+
+    def collect(self, session: Session):
+        """Изменения аудируемых объектов текущего flush (до сброса истории атрибутов)"""
+        changes = []
+        for action, objects in (
+            ("CREATE", session.new),
+            ("UPDATE", session.dirty),
+            ("DELETE", session.deleted),
+        ):
+            for obj in objects:
+                if not self.is_audited(obj):
+                    continue
+                state = inspect(obj)
+                if action == "CREATE":
+                    old_values, new_values = None, self._loaded_values(state)
+                elif action == "UPDATE":
+                    values = self._updated_values(state)
+                    if values is None:
+                        continue
+                    old_values, new_values = values
+                else:
+                    old_values, new_values = self._loaded_values(state), None
+                changes.append(
+                    {
+                        "action": action,
+                        "table_name": obj.__tablename__,
+                        "record_id": self._record_id(state),
+                        "old_values": old_values,
+                        "new_values": new_values,
+                    }
+                )
+        if changes:
+            session.info.setdefault(_PENDING_CHANGES, []).extend(changes)
+
+    def publish(self, changes: List[Dict[str, Any]]):
+        """Передать зафиксированные изменения писателю аудита одной пачкой"""
+        context = _request_context.get() or {}
+        # Пользователь известен после AuthMiddleware, который выполняется внутри
+        state = context.get("scope", {}).get("state", {})
+        created_at = datetime.utcnow()
+        audit_log_writer.submit_many(
+            [
+                {
+                    **change,
+                    "user_id": state.get("user_id"),
+                    "ip_address": context.get("ip_address"),
+                    "user_agent": context.get("user_agent"),
+                    "endpoint": None,
+                    "method": None,
+                    "request_id": context.get("request_id"),
+                    "duration_ms": None,
+                    "status_code": None,
+                    "error_message": None,
+                    "created_at": created_at,
+                }
+                for change in changes
+            ]
+        )
+        self.captured += len(changes)
+
+
+# Глобальный захват изменений данных
+data_change_capture = DataChangeCapture(
+    enabled=settings.audit_data_changes_enabled,
+    tables=settings.audit_data_changes_tables,
+)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_data_changes(session: Session, _):
+    """Запомнить изменения аудируемых моделей до commit"""
+    if not data_change_capture.enabled:
+        return
+    try:
+        data_change_capture.collect(session)
+    except Exception as e:
+        # Журнал изменений не должен ломать запись данных
+        logger.error(f"Data change capture failed: {e}")
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_data_changes(session: Session):
+    changes = session.info.pop(_PENDING_CHANGES, None)
+    if not changes:
+        return
+    try:
+        data_change_capture.publish(changes)
+    except Exception as e:
+        logger.error(f"Publishing {len(changes)} data changes to audit failed: {e}")
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_data_changes(session: Session):
+    session.info.pop(_PENDING_CHANGES, None)
@@ -0,0 +1,376 @@
+"""
+Асинхронная запись журнала аудита пачками
+"""
+
+import asyncio
+import fcntl
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Deque, Dict, List, NamedTuple, Optional
+
+from loguru import logger
+from sqlalchemy import text
+
+from app.external.sqlalchemy.session import SessionLocal
+from app.external.sqlalchemy.utils.audit import add_audit_logs
+from app.settings import settings
+
+
+@contextmanager
+def _file_lock(path: str, blocking: bool = True):
+    """Межпроцессная блокировка (flock) на файле path.
+
+    Без blocking отдает False, если блокировку держит другой процесс"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class AuditWriterConfig(NamedTuple):
+    """Параметры писателя журнала аудита"""
+
+    batch_size: int
+    flush_seconds: float
+    max_queue_size: int
+    backpressure_seconds: float
+    spill_path: str
+    dead_letter_path: str
+    retry_seconds: float
+    max_retry_seconds: float
+
+    @classmethod
+    def from_settings(cls) -> "AuditWriterConfig":
+        return cls(
+            batch_size=settings.audit_writer_batch_size,
+            flush_seconds=settings.audit_writer_flush_seconds,
+            max_queue_size=settings.audit_writer_max_queue_size,
+            backpressure_seconds=settings.audit_writer_backpressure_seconds,
+            spill_path=settings.audit_writer_spill_path,
+            dead_letter_path=settings.audit_writer_dead_letter_path,
+            retry_seconds=settings.audit_writer_retry_seconds,
+            max_retry_seconds=settings.audit_writer_max_retry_seconds,
+        )
+
+
+class AuditLogWriter:
+    """Ограниченная очередь записей аудита с фоновой записью пачками.
+
+    Запрос только ставит запись в очередь; воркер пишет накопленное одним
+    executemany, когда набралась пачка или прошло flush_seconds. При полной
+    очереди запрос ждет место до backpressure_seconds, затем запись уходит
+    в файл переполнения, который воркер дописывает в БД позже. Пачка с
+    ошибкой делится пополам до отдельных записей: запись, которая не пишется
+    при доступной БД, уходит в dead-letter файл вместе с ошибкой. При
+    недоступной БД незаписанное возвращается в очередь, а запись
+    откладывается с удваивающейся паузой; остаток при остановке сохраняется
+    на диск. Файлы общие для воркеров: дозапись и разбор файла переполнения
+    защищены межпроцессными блокировками (flock)."""
+
+    def __init__(self, config: AuditWriterConfig):
+        self.batch_size = config.batch_size
+        self.flush_seconds = config.flush_seconds
+        self.max_queue_size = config.max_queue_size
+        self.backpressure_seconds = config.backpressure_seconds
+        self.spill_path = config.spill_path
+        self.dead_letter_path = config.dead_letter_path
+        self.retry_seconds = config.retry_seconds
+        self.max_retry_seconds = config.max_retry_seconds
+        self._queue: Deque[Dict[str, Any]] = deque()
+        self._lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._space: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._failures = 0
+        self._retry_at = 0.0
+        self.written = 0
+        self.spilled = 0
+        self.dead_lettered = 0
+
+    def _notify(self, event: Optional[asyncio.Event]):
+        if self._loop is not None and event is not None:
+            self._loop.call_soon_threadsafe(event.set)
+
+    def _try_append(self, entry: Dict[str, Any]) -> bool:
+        with self._lock:
+            if len(self._queue) >= self.max_queue_size:
+                return False
+            self._queue.append(entry)
+            batch_ready = len(self._queue) >= self.batch_size
+        if batch_ready:
+            self._notify(self._wakeup)
+        return True
+
+    def submit(self, entry: Dict[str, Any]):
+        """Поставить запись в очередь без ожидания (потокобезопасно); при переполнении - на диск"""
+        if not self._try_append(entry):
+            self._spill([entry])
+
+    def submit_many(self, entries: List[Dict[str, Any]]):
+        """Поставить пачку записей в очередь без ожидания; не поместившееся - на диск"""
+        with self._lock:
+            room = max(self.max_queue_size - len(self._queue), 0)
+            self._queue.extend(entries[:room])
+            batch_ready = len(self._queue) >= self.batch_size
+        if batch_ready:
+            self._notify(self._wakeup)
+        if entries[room:]:
+            self._spill(entries[room:])
+
+    async def put(self, entry: Dict[str, Any]):
+        """Поставить запись в очередь; при переполнении подождать место, затем - на диск"""
+        if self._try_append(entry):
+            return
+        if self._space is not None:
+            deadline = time.monotonic() + self.backpressure_seconds
+            while (remaining := deadline - time.monotonic()) > 0:
+                self._space.clear()
+                if self._try_append(entry):
+                    return
+                self._notify(self._wakeup)
+                try:
+                    await asyncio.wait_for(self._space.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            if self._try_append(entry):
+                return
+        # Запись на диск - вне event loop: он и так перегружен
+        await asyncio.to_thread(self._spill, [entry])
+
+    def pending(self) -> int:
+        """Количество записей в очереди"""
+        with self._lock:
+            return len(self._queue)
+
+    def _drain(self, limit: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            batch = [self._queue.popleft() for _ in range(min(limit, len(self._queue)))]
+        if batch:
+            self._notify(self._space)
+        return batch
+
+    def _requeue(self, batch: List[Dict[str, Any]]):
+        """Вернуть пачку в начало очереди; не поместившееся - на диск"""
+        with self._lock:
+            room = max(self.max_queue_size - len(self._queue), 0)
+            self._queue.extendleft(reversed(batch[:room]))
+        if batch[room:]:
+            self._spill(batch[room:])
+
+    @staticmethod
+    def _serializable(entry: Dict[str, Any]) -> Dict[str, Any]:
+        return {**entry, "created_at": entry["created_at"].isoformat()}
+
+    @classmethod
+    def _dump(cls, entry: Dict[str, Any]) -> str:
+        return json.dumps(cls._serializable(entry), default=str)
+
+    @staticmethod
+    def _load(line: str) -> Dict[str, Any]:
+        entry = json.loads(line)
+        entry["created_at"] = datetime.fromisoformat(entry["created_at"])
+        return entry
+
+    def _spill(self, entries: List[Dict[str, Any]]):
+        """Дописать записи в файл переполнения"""
+        with self._spill_lock, _file_lock(self.spill_path + ".lock"):
+            with open(self.spill_path, "a", encoding="utf-8") as spill:
+                spill.writelines(self._dump(entry) + "\n" for entry in entries)
+            self.spilled += len(entries)
+        logger.warning(f"Audit queue is full, spilled {len(entries)} entries to {self.spill_path}")
+
+    def _dead_letter(self, entry: Dict[str, Any], error: Exception):
+        """Дописать запись, которую БД не принимает, в dead-letter файл с ошибкой"""
+        line = json.dumps(
+            {
+                "failed_at": datetime.now().astimezone().isoformat(),
+                "error": f"{type(error).__name__}: {error}",
+                "entry": self._serializable(entry),
+            },
+            default=str,
+        )
+        with self._spill_lock, _file_lock(self.dead_letter_path + ".lock"):
+            with open(self.dead_letter_path, "a", encoding="utf-8") as dead_letter:
+                dead_letter.write(line + "\n")
+            self.dead_lettered += 1
+        logger.error(f"Audit log entry rejected by database, moved to {self.dead_letter_path}: {error}")
+
+    def _write(self, entries: List[Dict[str, Any]]) -> Optional[Exception]:
+        """Записать пачку одной транзакцией; вернуть ошибку или None"""
+        db = SessionLocal()
+        try:
+            add_audit_logs(db, entries)
+            self.written += len(entries)
+            return None
+        except Exception as e:
+            return e
+        finally:
+            db.close()
+
+    @staticmethod
+    def _database_available() -> bool:
+        db = SessionLocal()
+        try:
+            db.execute(text("SELECT 1"))
+            return True
+        except Exception:
+            return False
+        finally:
+            db.close()
+
+    def _write_isolated(self, entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Записать пачку, при ошибке - по половинам до отдельных записей.
+
+        Запись, которая не пишется при доступной БД, уходит в dead-letter файл.
+        Возвращает незаписанный из-за недоступности БД хвост пачки"""
+        error = self._write(entries)
+        if error is None:
+            return []
+        if not self._database_available():
+            logger.error(f"Error writing {len(entries)} audit log entries: {error}")
+            return entries
+        if len(entries) == 1:
+            self._dead_letter(entries[0], error)
+            return []
+        middle = len(entries) // 2
+        unwritten = self._write_isolated(entries[:middle])
+        if unwritten:
+            return unwritten + entries[middle:]
+        return self._write_isolated(entries[middle:])
+
+    def _backoff(self):
+        """Отложить следующую запись: пауза удваивается до max_retry_seconds"""
+        delay = min(self.retry_seconds * 2 ** self._failures, self.max_retry_seconds)
+        self._failures += 1
+        self._retry_at = time.monotonic() + delay
+        logger.warning(f"Audit database unavailable, next write attempt in {delay:.1f}s")
+
+    def next_retry_in(self) -> float:
+        """Сколько секунд осталось до следующей попытки записи после ошибки"""
+        return max(self._retry_at - time.monotonic(), 0)
+
+    def _flush_spill(self) -> bool:
+        """Записать файл переполнения в БД одной транзакцией.
+
+        Файл сначала переименовывается, чтобы запросы дописывали новый, не
+        дожидаясь записи; при недоступной БД в переименованном файле остаются
+        только незаписанные записи и ждут следующей попытки. Возвращает True,
+        если файл обработан целиком. Файл разбирает один процесс: остальные
+        пропускают ход, пока его блокировка занята"""
+        processing = self.spill_path + ".processing"
+        with _file_lock(processing + ".lock", blocking=False) as locked:
+            if not locked:
+                return True
+            with self._spill_lock, _file_lock(self.spill_path + ".lock"):
+                if not os.path.exists(processing):
+                    if not os.path.exists(self.spill_path):
+                        return True
+                    os.replace(self.spill_path, processing)
+            return self._replay_spill(processing)
+
+    def _replay_spill(self, processing: str) -> bool:
+        entries = []
+        with open(processing, encoding="utf-8") as spill:
+            for line in spill:
+                try:
+                    entries.append(self._load(line))
+                except (ValueError, KeyError, TypeError):
+                    # Строка, недописанная при аварийной остановке
+                    logger.warning(f"Skipping corrupted audit spill line: {line[:100]!r}")
+        unwritten = self._write_isolated(entries) if entries else []
+        if unwritten:
+            with open(processing + ".tmp", "w", encoding="utf-8") as spill:
+                spill.writelines(self._dump(entry) + "\n" for entry in unwritten)
+            os.replace(processing + ".tmp", processing)
+            return False
+        os.remove(processing)
+        logger.info(f"Audit spill file processed: {len(entries)} entries")
+        return True
+
+    def flush(self, force: bool = False) -> int:
+        """Синхронно записать очередь (на момент вызова) и файл переполнения.
+
+        После ошибки БД до конца паузы ничего не делает (кроме force)"""
+        if not force and self.next_retry_in() > 0:
+            return 0
+        written = self.written
+        remaining = self.pending()
+        while remaining > 0:
+            batch = self._drain(min(self.batch_size, remaining))
+            if not batch:
+                break
+            unwritten = self._write_isolated(batch)
+            if unwritten:
+                self._requeue(unwritten)
+                self._backoff()
+                return self.written - written
+            remaining -= len(batch)
+        if self._flush_spill():
+            self._failures = 0
+            self._retry_at = 0.0
+        else:
+            self._backoff()
+        return self.written - written
+
+    async def start(self):
+        """Запустить воркер в текущем event loop"""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._space = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        if (
+            self.pending()
+            or os.path.exists(self.spill_path)
+            or os.path.exists(self.spill_path + ".processing")
+        ):
+            self._wakeup.set()
+        logger.info("Audit log writer started")
+
+    async def shutdown(self):
+        """Остановить воркер и записать остаток; не записанное сохраняется на диск"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._loop = None
+        self._wakeup = None
+        self._space = None
+        await asyncio.to_thread(self.flush, True)
+        left = self._drain(self.pending())
+        if left:
+            self._spill(left)
+        logger.info("Audit log writer stopped")
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            # Полная очередь будит воркер и во время паузы после ошибки БД
+            retry_in = self.next_retry_in()
+            if retry_in > 0:
+                await asyncio.sleep(retry_in)
+            await asyncio.to_thread(self.flush)
+
+
+# Глобальный писатель журнала аудита
+audit_log_writer = AuditLogWriter(AuditWriterConfig.from_settings())
@@ -0,0 +1,202 @@
+"""
+Кэш аутентификации: пользователи AuthMiddleware, расшифрованные JWT и API токены
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from itertools import chain
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.external.sqlalchemy.models import ApiToken, Role, User
+from app.settings import settings
+
+# Ключи session.info с изменениями, которые сбрасывают кэш после commit
+_CHANGED_USERS = "auth_cache_changed_users"
+_CHANGED_ROLES = "auth_cache_changed_roles"
+_CHANGED_API_TOKENS = "auth_cache_changed_api_tokens"
+
+
+class Principal(NamedTuple):
+    """Пользователь запроса: отсоединенный User с загруженной ролью"""
+
+    user: User
+    is_active: bool
+    role_name: Optional[str]
+    expires: float
+
+
+class PrincipalCache:
+    """Пользователи по id на время TTL.
+
+    Записи сбрасываются после commit изменений пользователя или любой роли;
+    TTL ограничивает устаревание при правках в обход ORM. Объект User
+    разделяется между запросами и используется только для чтения."""
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._principals: Dict[int, Principal] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int, load: Callable[[], Optional[User]]) -> Optional[Principal]:
+        """Пользователь из кэша или через load() (None - пользователь не найден)"""
+        with self._lock:
+            principal = self._principals.get(user_id)
+            if principal is not None and time.monotonic() < principal.expires:
+                self.hits += 1
+                return principal
+            self.misses += 1
+            generation = self._generation
+
+        user = load()
+        if user is None:
+            return None
+        principal = Principal(
+            user=user,
+            is_active=user.is_active,
+            role_name=user.role.name if user.role else None,
+            expires=time.monotonic() + self.ttl_seconds,
+        )
+        with self._lock:
+            # Прочитанное до сброса не сохраняем: оно могло не увидеть изменение
+            if self.ttl_seconds > 0 and self._generation == generation:
+                self._principals[user_id] = principal
+        return principal
+
+    def invalidate(self, user_id: Optional[int] = None):
+        """Сбросить пользователя или весь кэш (user_id=None)"""
+        with self._lock:
+            self._generation += 1
+            if user_id is None:
+                self._principals.clear()
+            else:
+                self._principals.pop(user_id, None)
+
+
+class TokenClaimsCache:
+    """Расшифрованные JWT по строке токена до их exp (LRU ограниченного размера)"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._claims: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str, decode: Callable[[str], Optional[dict]]) -> Optional[dict]:
+        """Claims токена из кэша или через decode(); недействительные не кэшируются"""
+        now = time.time()
+        with self._lock:
+            claims = self._claims.get(token)
+            if claims is not None:
+                if claims["exp"] > now:
+                    self._claims.move_to_end(token)
+                    return claims
+                del self._claims[token]
+
+        claims = decode(token)
+        if claims is None or not isinstance(claims.get("exp"), (int, float)):
+            return claims
+        with self._lock:
+            self._claims[token] = claims
+            while len(self._claims) > self.max_size:
+                self._claims.popitem(last=False)
+        return claims
+
+    def clear(self):
+        with self._lock:
+            self._claims.clear()
+
+
+class ApiTokenCache:
+    """Найденные API токены по хешу на время TTL.
+
+    Хранится отсоединенный ApiToken с создателем и ролью; срок действия
+    и IP проверяются при каждом запросе. Изменение или удаление токена
+    (в том числе отзыв) сбрасывает запись сразу после commit."""
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._tokens: Dict[str, Tuple[ApiToken, float]] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(
+        self, token_hash: str, load: Callable[[], Optional[ApiToken]]
+    ) -> Optional[ApiToken]:
+        """Токен из кэша или через load() (None - токен не найден)"""
+        with self._lock:
+            cached = self._tokens.get(token_hash)
+            if cached is not None and time.monotonic() < cached[1]:
+                self.hits += 1
+                return cached[0]
+            self.misses += 1
+            generation = self._generation
+
+        api_token = load()
+        if api_token is None:
+            return None
+        with self._lock:
+            if self.ttl_seconds > 0 and self._generation == generation:
+                self._tokens[token_hash] = (
+                    api_token,
+                    time.monotonic() + self.ttl_seconds,
+                )
+        return api_token
+
+    def invalidate(self, token_hash: Optional[str] = None):
+        """Сбросить токен или весь кэш (token_hash=None)"""
+        with self._lock:
+            self._generation += 1
+            if token_hash is None:
+                self._tokens.clear()
+            else:
+                self._tokens.pop(token_hash, None)
+
+
+# Глобальные кэши AuthMiddleware
+principal_cache = PrincipalCache(ttl_seconds=settings.auth_principal_cache_ttl_seconds)
+token_claims_cache = TokenClaimsCache(max_size=settings.auth_token_cache_size)
+api_token_cache = ApiTokenCache(ttl_seconds=settings.api_token_cache_ttl_seconds)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_principal_changes(session: Session, _):
+    """Запомнить измененных и удаленных пользователей, роли и API токены до commit"""
+    for obj in chain(session.dirty, session.deleted):
+        if isinstance(obj, User) and obj.id is not None:
+            session.info.setdefault(_CHANGED_USERS, set()).add(obj.id)
+        elif isinstance(obj, Role):
+            session.info[_CHANGED_ROLES] = True
+        elif isinstance(obj, ApiToken):
+            session.info.setdefault(_CHANGED_API_TOKENS, set()).add(obj.token_hash)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_principals(session: Session):
+    """Сбросить кэш после фиксации изменений; смена роли затрагивает всех ее пользователей"""
+    user_ids = session.info.pop(_CHANGED_USERS, None)
+    token_hashes = session.info.pop(_CHANGED_API_TOKENS, None)
+    if session.info.pop(_CHANGED_ROLES, False):
+        principal_cache.invalidate()
+        api_token_cache.invalidate()
+    elif user_ids:
+        for user_id in user_ids:
+            principal_cache.invalidate(user_id)
+        # Токены хранят создателя и его роль
+        api_token_cache.invalidate()
+    for token_hash in token_hashes or ():
+        api_token_cache.invalidate(token_hash)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_principal_changes(session: Session):
+    session.info.pop(_CHANGED_USERS, None)
+    session.info.pop(_CHANGED_ROLES, None)
+    session.info.pop(_CHANGED_API_TOKENS, None)
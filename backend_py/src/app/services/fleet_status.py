@@ -0,0 +1,129 @@
+"""
+Сводное состояние парка автоматов с кэшем в памяти процесса
+"""
+
+import threading
+import time
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from typing import List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.external.sqlalchemy.utils import fleet_status as fleet_status_crud
+from app.settings import settings
+
+
+def _diff(today, prev) -> int | Decimal:
+    """Прирост счетчика за день от максимума предыдущего дня с данными (как в отчетах)"""
+    if today is None:
+        return 0
+    return max(today - (prev or 0), 0)
+
+
+def build_fleet_status(rows: List[dict]) -> dict:
+    """Собрать ответ о состоянии парка из строк запроса"""
+    machines = []
+    revenue_today = Decimal(0)
+    cashless_today = Decimal(0)
+    reporting_today = 0
+    for row in rows:
+        coins_today = _diff(row["today_coins"], row["prev_coins"])
+        revenue = Decimal(coins_today) * settings.coin_price_rub
+        cashless = row["cashless_amount"] or Decimal(0)
+        total_quantity = row["total_quantity"] or Decimal(0)
+        total_capacity = row["total_capacity"]
+        revenue_today += revenue
+        cashless_today += cashless
+        if row["today_readings"]:
+            reporting_today += 1
+        machines.append(
+            {
+                "machine_id": row["machine_id"],
+                "name": row["name"],
+                "latest": (
+                    {
+                        "id": row["monitoring_id"],
+                        "coins": row["coins"],
+                        "toys": row["toys"],
+                        "date": row["date"],
+                    }
+                    if row["monitoring_id"] is not None
+                    else None
+                ),
+                "readings_today": row["today_readings"] or 0,
+                "coins_today": coins_today,
+                "toys_today": _diff(row["today_toys"], row["prev_toys"]),
+                "revenue_today": revenue,
+                "cashless_today": cashless,
+                "cashless_transactions_today": row["cashless_count"] or 0,
+                "total_quantity": float(total_quantity),
+                "total_capacity": float(total_capacity) if total_capacity else None,
+                "utilization_percent": (
+                    float(total_quantity / total_capacity * 100)
+                    if total_capacity
+                    else None
+                ),
+                "total_items": row["total_items"] or 0,
+                "low_stock_items": row["low_stock_items"] or 0,
+            }
+        )
+    return {
+        "generated_at": datetime.now(timezone.utc),
+        "machines_total": len(machines),
+        "machines_reporting_today": reporting_today,
+        "revenue_today": revenue_today,
+        "cashless_today": cashless_today,
+        "machines": machines,
+    }
+
+
+class FleetStatusCache:
+    """Последний снимок состояния парка.
+
+    Снимок сбрасывается при поступлении показаний и безналичных платежей,
+    поэтому повторные обновления дашборда не обращаются к БД. Остатки
+    меняются многими операциями склада - их свежесть ограничивает TTL."""
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._snapshot: Optional[dict] = None
+        self._expires = 0.0
+        self._day: Optional[date] = None
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def invalidate(self):
+        """Сбросить снимок (потокобезопасно)"""
+        with self._lock:
+            self._generation += 1
+            self._snapshot = None
+
+    def get(self, db: Session) -> dict:
+        """Снимок из кэша или из БД, если он сброшен, устарел или наступил новый день"""
+        today = date.today()
+        with self._lock:
+            if (
+                self._snapshot is not None
+                and self._day == today
+                and time.monotonic() < self._expires
+            ):
+                self.hits += 1
+                return self._snapshot
+            self.misses += 1
+            generation = self._generation
+
+        snapshot = build_fleet_status(fleet_status_crud.get_fleet_status_rows(db))
+        with self._lock:
+            # Снимок, прочитанный до сброса, не сохраняем: он мог не увидеть новые данные
+            if self._generation == generation:
+                self._snapshot = snapshot
+                self._day = today
+                self._expires = time.monotonic() + self.ttl_seconds
+        return snapshot
+
+
+# Глобальный кэш состояния парка
+fleet_status_cache = FleetStatusCache(ttl_seconds=settings.fleet_status_cache_ttl_seconds)
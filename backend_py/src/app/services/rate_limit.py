@@ -0,0 +1,143 @@
+"""
+Лимит запросов API токенов (ApiToken.rate_limit - запросов в час)
+"""
+
+import asyncio
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from loguru import logger
+
+from app.external.sqlalchemy.models import ApiToken
+from app.external.sqlalchemy.session import SessionLocal
+from app.external.sqlalchemy.utils.api_tokens import acquire_rate_limit_token
+from app.settings import settings
+
+RATE_LIMIT_WINDOW_SECONDS = 3600
+
+
+class RateLimitDecision(NamedTuple):
+    """Результат проверки лимита для заголовков ответа"""
+
+    allowed: bool
+    limit: int
+    remaining: int
+    reset_seconds: int  # Через сколько корзина пополнится полностью
+    retry_after: int  # Через сколько появится следующий запрос (0 - уже доступен)
+
+
+class RateLimitBackend(ABC):
+    """Хранилище корзин токенов (token bucket) по ключу"""
+
+    # Обращение к хранилищу блокирует поток (запрос к БД) - выполняется вне event loop
+    blocking = False
+
+    @abstractmethod
+    def acquire(
+        self, key: int, capacity: int, refill_per_second: float
+    ) -> Tuple[bool, float]:
+        """Взять токен из корзины. Возвращает (разрешено, остаток токенов)"""
+        pass
+
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """Корзины в памяти процесса: лимит действует отдельно на каждый воркер"""
+
+    def __init__(self):
+        self._buckets: Dict[int, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def acquire(
+        self, key: int, capacity: int, refill_per_second: float
+    ) -> Tuple[bool, float]:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * refill_per_second)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+        return allowed, tokens
+
+
+class PostgresRateLimitBackend(RateLimitBackend):
+    """Корзины в таблице api_token_rate_limits: общий лимит для всех воркеров.
+
+    Каждый запрос с лимитом - INSERT ... ON CONFLICT и COMMIT в БД"""
+
+    blocking = True
+
+    def acquire(
+        self, key: int, capacity: int, refill_per_second: float
+    ) -> Tuple[bool, float]:
+        db = SessionLocal()
+        try:
+            return acquire_rate_limit_token(db, key, capacity, refill_per_second)
+        finally:
+            db.close()
+
+
+def get_rate_limit_backend() -> RateLimitBackend:
+    """Фабрика хранилища лимитов по настройке api_token_rate_limit_backend"""
+    backend_type = settings.api_token_rate_limit_backend.lower()
+    if backend_type == "postgres":
+        return PostgresRateLimitBackend()
+    if backend_type != "memory":
+        logger.warning(
+            f"Unknown rate limit backend: {backend_type}, falling back to memory"
+        )
+    return MemoryRateLimitBackend()
+
+
+class ApiTokenRateLimiter:
+    """Проверка ApiToken.rate_limit: корзина на rate_limit запросов,
+    пополняемая равномерно за час (допускает всплеск до полного лимита)"""
+
+    def __init__(self, backend: RateLimitBackend):
+        self.backend = backend
+
+    async def check_async(self, api_token: ApiToken) -> Optional[RateLimitDecision]:
+        """check для async кода: блокирующее хранилище опрашивается в потоке"""
+        if self.backend.blocking:
+            return await asyncio.to_thread(self.check, api_token)
+        return self.check(api_token)
+
+    def check(self, api_token: ApiToken) -> Optional[RateLimitDecision]:
+        """Решение по запросу токена; None - лимит не задан или не проверен"""
+        limit = api_token.rate_limit
+        if not limit or limit <= 0:
+            return None
+        refill = limit / RATE_LIMIT_WINDOW_SECONDS
+        try:
+            allowed, tokens = self.backend.acquire(api_token.id, limit, refill)
+        except Exception as e:
+            # Недоступность хранилища лимитов не должна блокировать интеграции
+            logger.error(f"Rate limit check failed for API token {api_token.id}: {e}")
+            return None
+        return RateLimitDecision(
+            allowed=allowed,
+            limit=limit,
+            remaining=max(int(tokens), 0),
+            reset_seconds=math.ceil(max(limit - tokens, 0) / refill),
+            retry_after=0 if allowed else max(math.ceil((1 - tokens) / refill), 1),
+        )
+
+
+def rate_limit_headers(decision: RateLimitDecision) -> Dict[str, str]:
+    """Заголовки X-RateLimit-* (и Retry-After для отклоненного запроса)"""
+    headers = {
+        "X-RateLimit-Limit": str(decision.limit),
+        "X-RateLimit-Remaining": str(decision.remaining),
+        "X-RateLimit-Reset": str(decision.reset_seconds),
+    }
+    if not decision.allowed:
+        headers["Retry-After"] = str(decision.retry_after)
+    return headers
+
+
+# Глобальный лимитер API токенов
+api_token_rate_limiter = ApiTokenRateLimiter(get_rate_limit_backend())
@@ -0,0 +1,242 @@
+"""
+Параллельный пересчет отчетов за исторический период
+"""
+import multiprocessing
+import threading
+import time
+import uuid
+from concurrent.futures import CancelledError, ProcessPoolExecutor, as_completed
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+from app.external.sqlalchemy.models import Machine
+from app.external.sqlalchemy.session import SessionLocal
+from app.settings import settings
+
+
+def _compute_chunk(day: date, machine_ids: List[int]) -> int:
+    """Пересчитать отчеты группы автоматов за день (выполняется в процессе пула).
+
+    Каждый процесс пула работает со своим engine и своими соединениями с БД."""
+    from app.api.reports.controllers import compute_and_store_reports
+
+    db = SessionLocal()
+    try:
+        return compute_and_store_reports(
+            db, datetime(day.year, day.month, day.day), machine_ids
+        )
+    finally:
+        db.close()
+
+
+class ReportBackfillJob:
+    """Состояние задачи пересчета отчетов за период"""
+
+    def __init__(
+        self,
+        start_date: date,
+        end_date: date,
+        machine_ids: Optional[List[int]],
+        workers: int,
+        chunk_size: int,
+    ):
+        self.id = uuid.uuid4().hex
+        self.start_date = start_date
+        self.end_date = end_date
+        self.machine_ids = machine_ids
+        self.workers = workers
+        self.chunk_size = chunk_size
+        # pending, running, completed, completed_with_errors, cancelled, failed
+        self.status = "pending"
+        self.total_chunks = 0
+        self.done_chunks = 0
+        self.failed_chunks = 0
+        self.reports_processed = 0
+        self.last_error: Optional[str] = None
+        self.created_at = datetime.now(timezone.utc)
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self._started_monotonic: Optional[float] = None
+        self._cancel_event = threading.Event()
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in ("completed", "completed_with_errors", "cancelled", "failed")
+
+    def eta_seconds(self) -> Optional[float]:
+        """Оценка оставшегося времени по средней скорости обработки чанков"""
+        if self.status != "running" or not self.done_chunks:
+            return None
+        elapsed = time.monotonic() - self._started_monotonic
+        remaining = self.total_chunks - self.done_chunks
+        return elapsed / self.done_chunks * remaining
+
+    def to_dict(self) -> dict:
+        progress = (
+            self.done_chunks / self.total_chunks * 100 if self.total_chunks else 0.0
+        )
+        return {
+            "id": self.id,
+            "status": self.status,
+            "start_date": self.start_date,
+            "end_date": self.end_date,
+            "machine_ids": self.machine_ids,
+            "workers": self.workers,
+            "total_chunks": self.total_chunks,
+            "done_chunks": self.done_chunks,
+            "failed_chunks": self.failed_chunks,
+            "reports_processed": self.reports_processed,
+            "progress_percent": round(progress, 2),
+            "eta_seconds": self.eta_seconds(),
+            "last_error": self.last_error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class ReportBackfillManager:
+    """Запуск, отслеживание и отмена задач пересчета отчетов.
+
+    Период разбивается на чанки (день x группа автоматов), которые выполняются
+    в пуле процессов тем же расчетом, что и compute_and_store_reports."""
+
+    def __init__(self, max_finished_jobs: int = 50):
+        self.max_finished_jobs = max_finished_jobs
+        self._jobs: Dict[str, ReportBackfillJob] = {}
+        self._lock = threading.Lock()
+
+    def start(
+        self,
+        start_date: date,
+        end_date: date,
+        machine_ids: Optional[List[int]] = None,
+        workers: Optional[int] = None,
+        chunk_size: Optional[int] = None,
+    ) -> ReportBackfillJob:
+        """Создать задачу и запустить ее в фоновом потоке"""
+        job = ReportBackfillJob(
+            start_date=start_date,
+            end_date=end_date,
+            machine_ids=machine_ids,
+            workers=workers or settings.report_backfill_workers,
+            chunk_size=chunk_size or settings.report_backfill_chunk_size,
+        )
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        threading.Thread(
+            target=self._run, args=(job,), name=f"report-backfill-{job.id}", daemon=True
+        ).start()
+        return job
+
+    def get(self, job_id: str) -> Optional[ReportBackfillJob]:
+        return self._jobs.get(job_id)
+
+    def list_jobs(self) -> List[ReportBackfillJob]:
+        return sorted(self._jobs.values(), key=lambda j: j.created_at, reverse=True)
+
+    def cancel(self, job_id: str) -> Optional[ReportBackfillJob]:
+        """Отменить задачу: ожидающие чанки снимаются, выполняющиеся дорабатывают"""
+        job = self._jobs.get(job_id)
+        if job and not job.is_finished:
+            job._cancel_event.set()
+        return job
+
+    def _prune(self):
+        finished = [j for j in self._jobs.values() if j.is_finished]
+        finished.sort(key=lambda j: j.created_at)
+        for job in finished[: max(0, len(finished) - self.max_finished_jobs)]:
+            del self._jobs[job.id]
+
+    def _build_chunks(self, job: ReportBackfillJob) -> List[tuple]:
+        machine_ids = job.machine_ids
+        if machine_ids is None:
+            db = SessionLocal()
+            try:
+                machine_ids = [
+                    row.id for row in db.query(Machine.id).order_by(Machine.id).all()
+                ]
+            finally:
+                db.close()
+
+        groups = [
+            machine_ids[i : i + job.chunk_size]
+            for i in range(0, len(machine_ids), job.chunk_size)
+        ]
+        chunks = []
+        day = job.start_date
+        while day <= job.end_date:
+            chunks.extend((day, group) for group in groups)
+            day += timedelta(days=1)
+        return chunks
+
+    def _run(self, job: ReportBackfillJob):
+        job.status = "running"
+        job.started_at = datetime.now(timezone.utc)
+        job._started_monotonic = time.monotonic()
+        try:
+            chunks = self._build_chunks(job)
+            job.total_chunks = len(chunks)
+            logger.info(
+                f"Report backfill {job.id}: {job.start_date}..{job.end_date}, "
+                f"{len(chunks)} chunks, {job.workers} workers"
+            )
+            # spawn: дочерние процессы не наследуют потоки и соединения сервера
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(
+                max_workers=job.workers, mp_context=context
+            ) as pool:
+                futures = [pool.submit(_compute_chunk, day, ids) for day, ids in chunks]
+                pending = set(futures)
+                while pending:
+                    if job._cancel_event.is_set():
+                        for future in pending:
+                            future.cancel()
+                    done = []
+                    try:
+                        for future in as_completed(pending, timeout=1):
+                            done.append(future)
+                            if job._cancel_event.is_set():
+                                break
+                    except TimeoutError:
+                        pass
+                    for future in done:
+                        pending.discard(future)
+                        self._collect(job, future)
+                    pending = {f for f in pending if not f.cancelled()}
+            if job._cancel_event.is_set():
+                job.status = "cancelled"
+            elif job.failed_chunks:
+                # Отчеты упавших чанков не пересчитаны: повторить backfill за период
+                job.status = "completed_with_errors"
+            else:
+                job.status = "completed"
+        except Exception as e:
+            job.status = "failed"
+            job.last_error = str(e)[:500]
+            logger.error(f"Report backfill {job.id} failed: {e}")
+        finally:
+            job.finished_at = datetime.now(timezone.utc)
+            logger.info(
+                f"Report backfill {job.id} {job.status}: {job.done_chunks}/{job.total_chunks} chunks, "
+                f"{job.reports_processed} reports, {job.failed_chunks} failed"
+            )
+
+    @staticmethod
+    def _collect(job: ReportBackfillJob, future):
+        try:
+            job.reports_processed += future.result()
+        except CancelledError:
+            return
+        except Exception as e:
+            job.failed_chunks += 1
+            job.last_error = str(e)[:500]
+            logger.error(f"Report backfill {job.id} chunk failed: {e}")
+        job.done_chunks += 1
+
+
+# Глобальный менеджер задач пересчета
+report_backfill_manager = ReportBackfillManager()
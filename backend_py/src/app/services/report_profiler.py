@@ -0,0 +1,203 @@
+"""
+Профилирование расчета отчетов по фазам
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional
+
+from loguru import logger
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.settings import settings
+
+# Фазы compute_and_store_reports в порядке выполнения
+REPORT_PHASES = (
+    "monitoring_lookup",
+    "cost_lookup",
+    "rent_lookup",
+    "calculation",
+    "movement_upsert",
+    "report_upsert",
+    "commit",
+)
+
+_active_run: ContextVar[Optional["ReportRunProfile"]] = ContextVar(
+    "report_profile_run", default=None
+)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_query(*_):
+    """Считать запросы профилируемого прогона в текущем потоке"""
+    run = _active_run.get()
+    if run is not None:
+        run.queries += 1
+
+
+class ReportRunProfile:
+    """Замеры одного прогона расчета отчетов за день"""
+
+    def __init__(self, report_date: datetime):
+        self.report_date = report_date
+        self.status = "running"
+        self.machines = 0
+        self.queries = 0
+        self.total_ms = 0.0
+        self.phases: Dict[str, dict] = {}
+        self.machine_ms: Dict[int, float] = {}
+        self.started_at = datetime.now(timezone.utc)
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        queries = self.queries
+        try:
+            yield
+        finally:
+            stats = self.phases.setdefault(name, {"ms": 0.0, "queries": 0})
+            stats["ms"] += (time.perf_counter() - started) * 1000
+            stats["queries"] += self.queries - queries
+
+    def record_machine(self, machine_id: int, started: float):
+        """Время расчета показателей автомата от отметки perf_counter"""
+        self.machine_ms[machine_id] = (time.perf_counter() - started) * 1000
+
+    def finish(self, status: str):
+        self.status = status
+        self.total_ms = (time.perf_counter() - self._started) * 1000
+
+    def to_dict(self) -> dict:
+        return {
+            "report_date": self.report_date.date().isoformat(),
+            "status": self.status,
+            "started_at": self.started_at,
+            "machines": self.machines,
+            "queries": self.queries,
+            "queries_per_machine": (
+                round(self.queries / self.machines, 2) if self.machines else None
+            ),
+            "total_ms": round(self.total_ms, 3),
+            "phases": {
+                name: {"ms": round(stats["ms"], 3), "queries": stats["queries"]}
+                for name, stats in self.phases.items()
+            },
+        }
+
+
+class ReportProfiler:
+    """Сбор профилей расчета отчетов: последние прогоны и сводка по фазам.
+
+    Выключенный профилировщик не создает замеров, поэтому расчет
+    не платит за инструментирование."""
+
+    def __init__(self, enabled: bool, history: int, top: int = 10):
+        self.enabled = enabled
+        self.top = top
+        self._runs: deque = deque(maxlen=history)
+        self._phase_totals: Dict[str, dict] = {}
+        self._machine_ms: Dict[int, float] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def run(self, report_date: datetime) -> Iterator[Optional[ReportRunProfile]]:
+        """Профилировать прогон расчета за день (None, если выключено)"""
+        if not self.enabled:
+            yield None
+            return
+        profile = ReportRunProfile(report_date)
+        token = _active_run.set(profile)
+        status = "failed"
+        try:
+            yield profile
+            status = "completed"
+        finally:
+            _active_run.reset(token)
+            profile.finish(status)
+            self._record(profile)
+
+    @staticmethod
+    def phase(profile: Optional[ReportRunProfile], name: str):
+        """Замер фазы прогона; без профиля - пустой контекст"""
+        return profile.phase(name) if profile else nullcontext()
+
+    def _record(self, profile: ReportRunProfile):
+        data = profile.to_dict()
+        with self._lock:
+            self._runs.append(data)
+            for name, stats in data["phases"].items():
+                totals = self._phase_totals.setdefault(
+                    name, {"runs": 0, "ms": 0.0, "max_ms": 0.0, "queries": 0}
+                )
+                totals["runs"] += 1
+                totals["ms"] += stats["ms"]
+                totals["max_ms"] = max(totals["max_ms"], stats["ms"])
+                totals["queries"] += stats["queries"]
+            for machine_id, ms in profile.machine_ms.items():
+                self._machine_ms[machine_id] = max(
+                    self._machine_ms.get(machine_id, 0.0), ms
+                )
+        logger.bind(event="report_profile", profile=data).info(
+            f"Report profile {data['report_date']}: {data['total_ms']} ms, "
+            f"{data['machines']} machines, {data['queries']} queries"
+        )
+
+    def configure(self, enabled: Optional[bool] = None, reset: bool = False):
+        if enabled is not None:
+            self.enabled = enabled
+        if reset:
+            with self._lock:
+                self._runs.clear()
+                self._phase_totals.clear()
+                self._machine_ms.clear()
+
+    def snapshot(self) -> dict:
+        """Сводка для админского эндпоинта"""
+        with self._lock:
+            runs: List[dict] = list(self._runs)
+            phases = {
+                name: {
+                    "runs": totals["runs"],
+                    "total_ms": round(totals["ms"], 3),
+                    "avg_ms": round(totals["ms"] / totals["runs"], 3),
+                    "max_ms": round(totals["max_ms"], 3),
+                    "queries": totals["queries"],
+                }
+                for name, totals in sorted(
+                    self._phase_totals.items(),
+                    key=lambda item: (
+                        REPORT_PHASES.index(item[0])
+                        if item[0] in REPORT_PHASES
+                        else len(REPORT_PHASES)
+                    ),
+                )
+            }
+            slowest_machines = sorted(
+                self._machine_ms.items(), key=lambda item: item[1], reverse=True
+            )[: self.top]
+        return {
+            "enabled": self.enabled,
+            "runs_recorded": len(runs),
+            "phases": phases,
+            "slowest_runs": sorted(runs, key=lambda run: run["total_ms"], reverse=True)[
+                : self.top
+            ],
+            "slowest_machines": [
+                {"machine_id": machine_id, "max_ms": round(ms, 3)}
+                for machine_id, ms in slowest_machines
+            ],
+            "recent_runs": runs[-self.top :][::-1],
+        }
+
+
+# Глобальный профилировщик расчета отчетов
+report_profiler = ReportProfiler(
+    enabled=settings.report_profiling_enabled,
+    history=settings.report_profiling_history,
+)
@@ -0,0 +1,197 @@
+"""
+Отложенный пересчет отчетов по изменениям мониторинга
+"""
+import asyncio
+import threading
+import time
+from datetime import date, datetime
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from loguru import logger
+
+from app.external.sqlalchemy.session import SessionLocal
+from app.settings import settings
+
+
+class ReportRecomputeQueue:
+    """Очередь "грязных" пар (автомат, день) с debounce-воркером.
+
+    Изменения показаний только помечают пары; воркер собирает все пометки,
+    накопившиеся за окно debounce, и пересчитывает их одним проходом вне запроса.
+    Если проход падает, пары пересчитываются по одной; упавшие повторяются
+    отдельно от общих проходов с растущей паузой и отбрасываются после
+    max_attempts попыток."""
+
+    def __init__(self, debounce_seconds: float, retry_seconds: float, max_attempts: int):
+        self.debounce_seconds = debounce_seconds
+        self.retry_seconds = retry_seconds
+        self.max_attempts = max_attempts
+        self._dirty: Set[Tuple[int, date]] = set()
+        # Упавшие пары: (число попыток, время следующей попытки по monotonic)
+        self._failed: Dict[Tuple[int, date], Tuple[int, float]] = {}
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def mark_dirty(self, machine_id: int, day: date | datetime):
+        """Пометить отчет автомата за день для пересчета (потокобезопасно)"""
+        if isinstance(day, datetime):
+            day = day.date()
+        with self._lock:
+            self._dirty.add((machine_id, day))
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def mark_dirty_many(self, machine_days: Iterable[Tuple[int, date | datetime]]):
+        """Пометить пачку пар (автомат, день) одним пробуждением воркера"""
+        batch = {
+            (machine_id, day.date() if isinstance(day, datetime) else day)
+            for machine_id, day in machine_days
+        }
+        if not batch:
+            return
+        with self._lock:
+            self._dirty |= batch
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def pending(self) -> int:
+        """Количество пар, ожидающих пересчета (включая ожидающие повтора)"""
+        with self._lock:
+            return len(self._dirty | self._failed.keys())
+
+    def _drain(self) -> Set[Tuple[int, date]]:
+        """Накопленные пары без ожидающих повтора: те пересчитываются отдельно"""
+        with self._lock:
+            batch, self._dirty = self._dirty - self._failed.keys(), set()
+        return batch
+
+    def _due_failures(self, force: bool = False) -> Set[Tuple[int, date]]:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                machine_day
+                for machine_day, (_, retry_at) in self._failed.items()
+                if force or retry_at <= now
+            }
+
+    def next_retry_in(self) -> Optional[float]:
+        """Через сколько секунд наступит ближайший повтор (None - повторов нет)"""
+        with self._lock:
+            if not self._failed:
+                return None
+            retry_at = min(retry_at for _, retry_at in self._failed.values())
+        return max(retry_at - time.monotonic(), 0)
+
+    @staticmethod
+    def _recompute(machine_days: Set[Tuple[int, date]]) -> int:
+        from app.api.reports.controllers import recompute_machine_days
+
+        db = SessionLocal()
+        try:
+            return recompute_machine_days(db, machine_days)
+        finally:
+            db.close()
+
+    def _record_failure(self, machine_day: Tuple[int, date], error: Exception):
+        """Отложить повтор пары с удвоением паузы; после max_attempts - отбросить"""
+        with self._lock:
+            attempts = self._failed.get(machine_day, (0, 0.0))[0] + 1
+            if attempts >= self.max_attempts:
+                self._failed.pop(machine_day, None)
+            else:
+                delay = self.retry_seconds * 2 ** (attempts - 1)
+                self._failed[machine_day] = (attempts, time.monotonic() + delay)
+        machine_id, day = machine_day
+        if attempts >= self.max_attempts:
+            logger.error(
+                f"Report recompute for machine {machine_id} on {day} dropped "
+                f"after {attempts} attempts: {error}"
+            )
+        else:
+            logger.warning(
+                f"Report recompute for machine {machine_id} on {day} failed "
+                f"(attempt {attempts}/{self.max_attempts}): {error}"
+            )
+
+    def _recompute_each(self, machine_days: Set[Tuple[int, date]]) -> int:
+        """Пересчитать пары по одной, чтобы ошибка одной не мешала остальным"""
+        processed = 0
+        for machine_day in sorted(machine_days):
+            try:
+                processed += self._recompute({machine_day})
+            except Exception as e:
+                self._record_failure(machine_day, e)
+                continue
+            with self._lock:
+                self._failed.pop(machine_day, None)
+        return processed
+
+    def flush(self, force_retries: bool = False) -> int:
+        """Синхронно пересчитать накопленные пары и пары, которым пора повторить
+        (force_retries - все ожидающие повтора сразу)"""
+        batch = self._drain()
+        processed = 0
+        if batch:
+            try:
+                processed = self._recompute(batch)
+                logger.info(
+                    f"Report recompute: {len(batch)} dirty machine-days, {processed} reports stored"
+                )
+            except Exception as e:
+                logger.error(
+                    f"Error recomputing reports, retrying {len(batch)} machine-days one by one: {e}"
+                )
+                processed = self._recompute_each(batch)
+        retries = self._due_failures(force_retries)
+        if retries:
+            processed += self._recompute_each(retries)
+        return processed
+
+    async def start(self):
+        """Запустить воркер в текущем event loop"""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        if self.pending():
+            self._wakeup.set()
+        logger.info("Report recompute worker started")
+
+    async def shutdown(self):
+        """Остановить воркер и пересчитать то, что осталось в очереди"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._loop = None
+        self._wakeup = None
+        await asyncio.to_thread(self.flush, True)
+        left = self.pending()
+        if left:
+            logger.warning(f"Report recompute worker stopped with {left} failed machine-days")
+        logger.info("Report recompute worker stopped")
+
+    async def _run(self):
+        while True:
+            # Без новых пометок воркер просыпается к ближайшему повтору
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.next_retry_in())
+            except asyncio.TimeoutError:
+                pass
+            else:
+                # Окно debounce: собираем пометки от параллельных запросов
+                await asyncio.sleep(self.debounce_seconds)
+            self._wakeup.clear()
+            await asyncio.to_thread(self.flush)
+
+
+# Глобальный экземпляр очереди пересчета
+report_recompute_queue = ReportRecomputeQueue(
+    debounce_seconds=settings.report_recompute_debounce_seconds,
+    retry_seconds=settings.report_recompute_retry_seconds,
+    max_attempts=settings.report_recompute_max_attempts,
+)
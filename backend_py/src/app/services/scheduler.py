@@ -13,7 +13,9 @@ from loguru import logger
 from sqlalchemy.orm import Session
 
 from app.external.sqlalchemy.models import ScheduledJob, Phone, Rent, MachineStock, TelegramBot
-from app.external.sqlalchemy.session import get_db
+from app.external.sqlalchemy.session import SessionLocal, get_db
+from app.external.sqlalchemy.utils import audit_partitions, monitoring_partitions
+from app.settings import settings
 from app.api.telegram.controllers import send_notification_system
 
 
@@ -87,6 +89,22 @@ class TaskScheduler:
                     'function_path': 'app.services.scheduler:_check_low_stock_wrapper',
                     'function_params': {},
                 },
+                {
+                    'name': '🗄 Обслуживание секций мониторинга (встроенная)',
+                    'description': 'Создание месячных секций мониторинга наперед и архивирование старых показаний каждый день в 03:00',
+                    'job_type': 'cron',
+                    'cron_expression': '0 3 * * *',
+                    'function_path': 'app.services.scheduler:_maintain_monitoring_partitions_wrapper',
+                    'function_params': {},
+                },
+                {
+                    'name': '🗄 Обслуживание секций аудита (встроенная)',
+                    'description': 'Создание месячных секций журнала аудита наперед и удаление старых секций каждый день в 03:30',
+                    'job_type': 'cron',
+                    'cron_expression': '30 3 * * *',
+                    'function_path': 'app.services.scheduler:_maintain_audit_partitions_wrapper',
+                    'function_params': {},
+                },
             ]
             
             # Проверяем и создаем задачи
@@ -228,6 +246,54 @@ class TaskScheduler:
         finally:
             db.close()
             
+    async def _maintain_monitoring_partitions(self):
+        """Создать секции мониторинга наперед и архивировать старые"""
+        logger.info("Running monitoring partitions maintenance...")
+
+        def maintain():
+            db = SessionLocal()
+            try:
+                return monitoring_partitions.maintain_monitoring_partitions(
+                    db,
+                    months_ahead=settings.monitoring_partitions_ahead,
+                    retention_days=settings.monitoring_raw_retention_days,
+                )
+            finally:
+                db.close()
+
+        try:
+            result = await asyncio.to_thread(maintain)
+            logger.info(
+                f"Monitoring partitions maintained: created {result['created']}, "
+                f"archived {result['archived']}"
+            )
+        except Exception as e:
+            logger.error(f"Error maintaining monitoring partitions: {e}")
+
+    async def _maintain_audit_partitions(self):
+        """Создать секции журнала аудита наперед и удалить старые"""
+        logger.info("Running audit partitions maintenance...")
+
+        def maintain():
+            db = SessionLocal()
+            try:
+                return audit_partitions.maintain_audit_partitions(
+                    db,
+                    months_ahead=settings.audit_partitions_ahead,
+                    retention_days=settings.audit_log_retention_days,
+                )
+            finally:
+                db.close()
+
+        try:
+            result = await asyncio.to_thread(maintain)
+            logger.info(
+                f"Audit partitions maintained: created {result['created']}, "
+                f"dropped {result['dropped']}"
+            )
+        except Exception as e:
+            logger.error(f"Error maintaining audit partitions: {e}")
+
     async def _check_low_stock(self):
         """Проверить низкие остатки игрушек и отправить уведомления"""
         logger.info("Running low stock check...")
@@ -658,6 +724,16 @@ async def _check_low_stock_wrapper():
     await task_scheduler._check_low_stock()
 
 
+async def _maintain_monitoring_partitions_wrapper():
+    """Wrapper для обслуживания секций мониторинга"""
+    await task_scheduler._maintain_monitoring_partitions()
+
+
+async def _maintain_audit_partitions_wrapper():
+    """Wrapper для обслуживания секций журнала аудита"""
+    await task_scheduler._maintain_audit_partitions()
+
+
 # Глобальный экземпляр планировщика
 task_scheduler = TaskScheduler()
 
@@ -0,0 +1,245 @@
+"""
+Потоковая загрузка телеметрии в формате NDJSON
+"""
+
+import asyncio
+import json
+import time
+from typing import AsyncIterator, List, Optional, Tuple
+
+from loguru import logger
+from pydantic import ValidationError
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from app.api.monitoring.models import CashlessTransactionIn, MonitoringIn
+from app.external.sqlalchemy.session import SessionLocal
+from app.external.sqlalchemy.utils import cashless_payments as cashless_crud
+from app.external.sqlalchemy.utils import monitoring as monitoring_crud
+from app.services.fleet_status import fleet_status_cache
+from app.services.report_recompute import report_recompute_queue
+from app.settings import settings
+
+# Порций тела запроса в очереди чтения: ограничивает память и дает обратное давление
+_RECEIVE_QUEUE_SIZE = 8
+
+
+class _IngestBatch:
+    """Накопленные строки потока до очередной записи в БД"""
+
+    def __init__(self):
+        self.monitoring: List[Tuple[int, dict]] = []
+        self.cashless: List[Tuple[int, dict]] = []
+        self.errors: List[dict] = []
+        self.first_line: Optional[int] = None
+        self.last_line: Optional[int] = None
+        self.started: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self.monitoring) + len(self.cashless) + len(self.errors)
+
+    def touch(self, line: int):
+        if self.first_line is None:
+            self.first_line = line
+            self.started = time.monotonic()
+        self.last_line = line
+
+
+def _parse_line(batch: _IngestBatch, line_no: int, raw: bytes):
+    """Разобрать строку NDJSON в показание мониторинга или безналичную транзакцию"""
+    batch.touch(line_no)
+    try:
+        item = json.loads(raw)
+        if not isinstance(item, dict):
+            raise ValueError("Expected a JSON object")
+        kind = item.pop("type", "monitoring")
+        if kind == "monitoring":
+            batch.monitoring.append((line_no, MonitoringIn(**item).model_dump()))
+        elif kind == "cashless":
+            batch.cashless.append((line_no, CashlessTransactionIn(**item).model_dump()))
+        else:
+            raise ValueError(f"Unknown type: {kind}")
+    except (ValueError, ValidationError) as e:
+        batch.errors.append({"line": line_no, "detail": str(e)[:300]})
+
+
+def _write_batch(batch: _IngestBatch) -> dict:
+    """Записать порцию в БД (выполняется в потоке) и собрать подтверждение"""
+    ack = {
+        "first_line": batch.first_line,
+        "last_line": batch.last_line,
+        "created": 0,
+        "duplicates": 0,
+        "cashless": 0,
+        "errors": list(batch.errors),
+    }
+    db = SessionLocal()
+    try:
+        if batch.monitoring:
+            results = monitoring_crud.bulk_create_monitoring(
+                db, [reading for _, reading in batch.monitoring]
+            )
+            created = []
+            for (line_no, _), result in zip(batch.monitoring, results):
+                if result["status"] == "created":
+                    created.append((result["machine_id"], result["date"]))
+                elif result["status"] == "duplicate":
+                    ack["duplicates"] += 1
+                else:
+                    ack["errors"].append({"line": line_no, "detail": result["detail"]})
+            ack["created"] = len(created)
+            report_recompute_queue.mark_dirty_many(created)
+        if batch.cashless:
+            results = cashless_crud.add_cashless_transactions(
+                db, [transaction for _, transaction in batch.cashless]
+            )
+            for (line_no, _), error in zip(batch.cashless, results):
+                if error:
+                    ack["errors"].append({"line": line_no, "detail": error})
+                else:
+                    ack["cashless"] += 1
+    except Exception as e:
+        db.rollback()
+        logger.error(
+            f"Telemetry ingest batch {batch.first_line}-{batch.last_line} failed: {e}"
+        )
+        ack["failed"] = str(e)[:300]
+    finally:
+        db.close()
+    if ack["created"] or ack["cashless"]:
+        fleet_status_cache.invalidate()
+    ack["errors"].sort(key=lambda error: error["line"])
+    return ack
+
+
+async def _pump_body(receive: Receive, queue: asyncio.Queue):
+    """Читать тело запроса порциями в ограниченную очередь; None - конец тела"""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            await queue.put(None)
+            return
+        body = message.get("body", b"")
+        if body:
+            await queue.put(body)
+        if not message.get("more_body", False):
+            await queue.put(None)
+            return
+
+
+async def ingest_stream(receive: Receive) -> AsyncIterator[dict]:
+    """Разбирать поток построчно и писать микропорциями по размеру или времени.
+
+    Тело не накапливается: в памяти только незавершенная строка и текущая порция.
+    После каждой записи отдается подтверждение, в конце - итог."""
+    queue: asyncio.Queue = asyncio.Queue(maxsize=_RECEIVE_QUEUE_SIZE)
+    pump = asyncio.create_task(_pump_body(receive, queue))
+    batch = _IngestBatch()
+    totals = {"lines": 0, "created": 0, "duplicates": 0, "cashless": 0, "errors": 0}
+    pending = b""
+    line_no = 0
+    skipping = False  # остаток слишком длинной строки отбрасывается до перевода строки
+
+    async def flush():
+        nonlocal batch
+        current, batch = batch, _IngestBatch()
+        ack = await asyncio.to_thread(_write_batch, current)
+        for key in ("created", "duplicates", "cashless"):
+            totals[key] += ack[key]
+        totals["errors"] += len(ack["errors"])
+        return ack
+
+    try:
+        while True:
+            timeout = None
+            if len(batch):
+                elapsed = time.monotonic() - batch.started
+                timeout = max(0.0, settings.ingest_flush_seconds - elapsed)
+            try:
+                chunk = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                yield await flush()
+                continue
+            if chunk is None:
+                break
+
+            data = pending + chunk
+            if skipping:
+                cut = data.find(b"\n")
+                if cut < 0:
+                    pending = b""
+                    continue
+                data, skipping = data[cut + 1 :], False
+            lines = data.split(b"\n")
+            pending = lines.pop()
+            for raw in lines:
+                line_no += 1
+                if len(raw) > settings.ingest_max_line_bytes:
+                    batch.touch(line_no)
+                    batch.errors.append({"line": line_no, "detail": "Line too long"})
+                elif raw.strip():
+                    _parse_line(batch, line_no, raw)
+                if len(batch) >= settings.ingest_batch_size:
+                    yield await flush()
+            if len(pending) > settings.ingest_max_line_bytes:
+                line_no += 1
+                batch.touch(line_no)
+                batch.errors.append({"line": line_no, "detail": "Line too long"})
+                pending = b""
+                skipping = True
+
+        if pending.strip() and not skipping:
+            line_no += 1
+            _parse_line(batch, line_no, pending)
+        if len(batch):
+            yield await flush()
+    finally:
+        pump.cancel()
+
+    totals["lines"] = line_no
+    logger.info(
+        f"Telemetry ingest finished: {line_no} lines, {totals['created']} created, "
+        f"{totals['duplicates']} duplicates, {totals['cashless']} cashless, "
+        f"{totals['errors']} errors"
+    )
+    yield {"done": True, **totals}
+
+
+class TelemetryIngestResponse(Response):
+    """Ответ, который сам читает тело запроса и потоково пишет подтверждения.
+
+    Чтение и запись идут одновременно, поэтому тело не передается через Request:
+    ответ получает receive напрямую."""
+
+    media_type = "application/x-ndjson"
+
+    def __init__(self):
+        self.status_code = 200
+        self.background = None
+        self.init_headers()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:  # noqa: ARG002
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            }
+        )
+        connected = True
+        async for ack in ingest_stream(receive):
+            if not connected:
+                continue
+            try:
+                await send(
+                    {
+                        "type": "http.response.body",
+                        "body": json.dumps(ack, default=str).encode() + b"\n",
+                        "more_body": True,
+                    }
+                )
+            except OSError:
+                # Клиент отключился: принятые строки все равно дописываются
+                connected = False
+        if connected:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
@@ -32,6 +32,80 @@ class Settings(BaseSettings):
     # JWT Settings
     secret_key: str = Field(default="your-secret-key-here-change-in-production")
     access_token_expire_minutes: int = Field(default=1440)
+    auth_principal_cache_ttl_seconds: float = Field(
+        default=60.0,
+        description="Время жизни кэша пользователей в AuthMiddleware (сек), 0 - без кэша",
+    )
+    auth_token_cache_size: int = Field(
+        default=10000,
+        description="Максимум расшифрованных JWT в кэше AuthMiddleware",
+    )
+    api_token_cache_ttl_seconds: float = Field(
+        default=30.0,
+        description="Время жизни кэша проверенных API токенов (сек), 0 - без кэша",
+    )
+    api_token_usage_flush_seconds: float = Field(
+        default=10.0,
+        description="Период записи накопленной статистики использования API токенов (сек)",
+    )
+    api_token_rate_limit_backend: str = Field(
+        default="memory",
+        description="Хранилище лимитов API токенов: memory - в процессе, postgres - общее "
+        "для всех воркеров (запись в БД и COMMIT на каждый запрос токена с лимитом, в потоке вне event loop)",
+    )
+
+    # Audit Settings
+    audit_writer_batch_size: int = Field(
+        default=500,
+        description="Размер пачки записей аудита, после которого запись начинается сразу",
+    )
+    audit_writer_flush_seconds: float = Field(
+        default=1.0,
+        description="Максимальная задержка записи аудита в БД (сек)",
+    )
+    audit_writer_max_queue_size: int = Field(
+        default=10000,
+        description="Максимум записей аудита в очереди в памяти",
+    )
+    audit_writer_backpressure_seconds: float = Field(
+        default=0.5,
+        description="Сколько запрос ждет места в полной очереди аудита перед записью на диск (сек)",
+    )
+    audit_writer_spill_path: str = Field(
+        default="./temp_uploads/audit_spill.jsonl",
+        description="Файл для записей аудита, не поместившихся в очередь",
+    )
+    audit_writer_dead_letter_path: str = Field(
+        default="./temp_uploads/audit_dead_letter.jsonl",
+        description="Файл для записей аудита, которые БД отклоняет (с текстом ошибки)",
+    )
+    audit_writer_retry_seconds: float = Field(
+        default=2.0,
+        description="Пауза перед повтором записи аудита при недоступной БД (сек), далее удваивается",
+    )
+    audit_writer_max_retry_seconds: float = Field(
+        default=60.0,
+        description="Максимальная пауза между повторами записи аудита при недоступной БД (сек)",
+    )
+    audit_partitions_ahead: int = Field(
+        default=2,
+        description="Сколько месячных секций журнала аудита создавать наперед",
+    )
+    audit_log_retention_days: int = Field(
+        default=0,
+        description="Срок хранения журнала аудита (дней) для планового удаления "
+        "старых секций, 0 - хранить все",
+    )
+    audit_data_changes_enabled: bool = Field(
+        default=False,
+        description="Журнал изменений данных (старые и новые значения) по событиям сессии ORM",
+    )
+    audit_data_changes_tables: str = Field(
+        default="users,user_owners,owners,terminals,machines,counterparties,"
+        "accounts,transactions,items,item_categories,warehouses,prices,"
+        "inventory_movements,rent,info_cards,documents,api_tokens,roles",
+        description="Таблицы журнала изменений данных (через запятую)",
+    )
 
     # Info Cards Encryption Key
     info_cards_secret_key: str = Field(
@@ -47,3 +121,81 @@ class Settings(BaseSettings):
         default="https://api.vendista.ru:99/reports/common",
         description="URL для получения отчетов Vendista API",
     )
+
+    # Reports Settings
+    coin_price_rub: int = Field(
+        default=10,
+        description="Стоимость монеты в рублях: выручка = прирост coins * стоимость",
+    )
+    report_recompute_debounce_seconds: float = Field(
+        default=2.0,
+        description="Окно debounce для пересчета отчетов после изменений мониторинга (сек)",
+    )
+    report_recompute_retry_seconds: float = Field(
+        default=30.0,
+        description="Пауза перед первым повтором упавшего пересчета автомата за день (сек), далее удваивается",
+    )
+    report_recompute_max_attempts: int = Field(
+        default=5,
+        description="Число попыток пересчета автомата за день, после которого пара отбрасывается",
+    )
+    report_backfill_workers: int = Field(
+        default=4,
+        description="Количество процессов для пересчета отчетов за период",
+    )
+    report_backfill_chunk_size: int = Field(
+        default=50,
+        description="Количество автоматов в одном чанке пересчета за день",
+    )
+    report_profiling_enabled: bool = Field(
+        default=False,
+        description="Профилирование расчета отчетов по фазам",
+    )
+    report_profiling_history: int = Field(
+        default=200,
+        description="Количество последних прогонов расчета отчетов в профиле",
+    )
+
+    # Monitoring Settings
+    monitoring_bulk_max_readings: int = Field(
+        default=10000,
+        description="Максимум показаний мониторинга в одном пакетном запросе",
+    )
+    cashless_bulk_max_transactions: int = Field(
+        default=10000,
+        description="Максимум безналичных транзакций в одном пакетном запросе",
+    )
+    monitoring_partitions_ahead: int = Field(
+        default=2,
+        description="Сколько месячных секций мониторинга создавать наперед",
+    )
+    monitoring_raw_retention_days: int = Field(
+        default=0,
+        description="Срок хранения сырых показаний мониторинга (дней); старые секции "
+        "архивируются в дневные срезы и удаляются, 0 - хранить все",
+    )
+
+    fleet_status_cache_ttl_seconds: float = Field(
+        default=30.0,
+        description="Максимальный возраст кэшированного состояния парка (сек); "
+        "новые показания сбрасывают кэш сразу",
+    )
+
+    ingest_batch_size: int = Field(
+        default=500,
+        description="Строк потоковой загрузки телеметрии в одной записи в БД",
+    )
+    ingest_flush_seconds: float = Field(
+        default=1.0,
+        description="Максимальное время накопления строк потоковой загрузки до записи (сек)",
+    )
+    ingest_max_line_bytes: int = Field(
+        default=64 * 1024,
+        description="Максимальная длина строки NDJSON при потоковой загрузке (байт)",
+    )
+
+    # Export Settings
+    export_batch_size: int = Field(
+        default=5000,
+        description="Размер порции строк серверного курсора при выгрузке таблиц",
+    )